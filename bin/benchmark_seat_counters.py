@@ -0,0 +1,123 @@
+"""
+Compares the single-item seat counter with the sharded one under contention.
+
+Concurrent threads enroll fake students (CWIDs from 9900000) in a class with enough seats for
+all of them, once with the counter on the class item and once with it split over shards.
+Transactions canceled by conflicting writes are retried and counted. The benchmark classes,
+enrollments & students are deleted afterwards.
+
+Needs DynamoDB (with the ClassSeatShards table) & Redis running. Usage (from the repository root):
+```
+python3 -m bin.benchmark_seat_counters
+python3 -m bin.benchmark_seat_counters --students 2000 --threads 32 --shards 10
+```
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from enrollment_service.db_connection import get_dynamodb, get_redisdb, TableNames
+from enrollment_service.enrollment_helper import enroll_student
+from enrollment_service.seat_shards import shard_class, delete_shards, get_enrollment_count
+
+FIRST_CWID = 9900000
+BENCHMARK_CLASS_ID = "BENCH.SEATS.{}"
+
+
+def create_class(class_id, room_capacity: int, dynamodb):
+    kwargs = {
+        "Item": {
+            "id": class_id,
+            "department_code": "BENCH",
+            "course_no": 0,
+            "section_no": 0,
+            "year": 0,
+            "semester": "BENCH",
+            "title": "Seat counter benchmark",
+            "instructor_cwid": 0,
+            "room_capacity": room_capacity,
+            "enrollment_count": 0,
+        }
+    }
+    dynamodb.put_item(TableNames.CLASSES, kwargs)
+
+
+def enroll_until_done(class_id, cwid: int, dynamodb):
+    """
+    Returns:
+    - tuple: (enrolled, number of conflicts)
+    """
+    conflicts = 0
+
+    while True:
+        try:
+            full_class = enroll_student(class_id, cwid, "Bench", str(cwid), dynamodb)
+        except HTTPException as e:
+            if e.detail != "Transaction Canceled":
+                raise
+            conflicts += 1
+        else:
+            return full_class is None, conflicts
+
+
+def run(class_id, num_students: int, num_threads: int, dynamodb):
+    cwids = range(FIRST_CWID, FIRST_CWID + num_students)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        results = list(executor.map(lambda cwid: enroll_until_done(class_id, cwid, dynamodb), cwids))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "enrolled": sum(1 for enrolled, _ in results if enrolled),
+        "conflicts": sum(conflicts for _, conflicts in results),
+        "seconds": elapsed,
+    }
+
+
+def cleanup(class_id, num_students: int, dynamodb, redisdb):
+    with dynamodb.batch_writer(TableNames.ENROLLMENTS) as batch:
+        for cwid in range(FIRST_CWID, FIRST_CWID + num_students):
+            batch.delete_item(Key={"class_id": class_id, "student_cwid": cwid})
+
+    with dynamodb.batch_writer(TableNames.PERSONNEL) as batch:
+        for cwid in range(FIRST_CWID, FIRST_CWID + num_students):
+            batch.delete_item(Key={"cwid": cwid})
+
+    dynamodb.delete_item(TableNames.CLASSES, {"Key": {"id": class_id}})
+    delete_shards(class_id, dynamodb, redisdb)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-item vs sharded seat counters.")
+    parser.add_argument("--students", type=int, default=500, help="Enrollments per mode. Default: 500")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent enrollments. Default: 16")
+    parser.add_argument("--shards", type=int, default=8, help="Shards of the sharded class. Default: 8")
+    args = parser.parse_args()
+
+    dynamodb = get_dynamodb()
+    redisdb = get_redisdb()
+
+    print(f"{args.students} enrollments, {args.threads} threads\n")
+    print(f"{'counter':<16} {'enrolled':>9} {'conflicts':>10} {'seconds':>9} {'enroll/s':>9}")
+
+    for mode in ("single-item", f"{args.shards} shards"):
+        class_id = BENCHMARK_CLASS_ID.format(mode.replace(" ", "-"))
+
+        try:
+            create_class(class_id, args.students, dynamodb)
+            if mode != "single-item":
+                shard_class(class_id, args.shards, dynamodb, redisdb)
+
+            result = run(class_id, args.students, args.threads, dynamodb)
+
+            # Every enrollment must be counted exactly once
+            class_item = dynamodb.get_item(TableNames.CLASSES, {"Key": {"id": class_id}, "ConsistentRead": True})["Item"]
+            assert get_enrollment_count(class_id, class_item, dynamodb) == result["enrolled"]
+
+            print(f"{mode:<16} {result['enrolled']:>9} {result['conflicts']:>10} "
+                  f"{result['seconds']:>9.2f} {result['enrolled'] / result['seconds']:>9.1f}")
+        finally:
+            cleanup(class_id, args.students, dynamodb, redisdb)
+
+    redisdb.close()
@@ -0,0 +1,99 @@
+"""
+Compares the default FastAPI encoding (jsonable_encoder + JSONResponse) with FastJSONResponse
+on payloads shaped like the items the services return.
+
+Usage (from the repository root):
+```
+python3 -m bin.benchmark_serialization
+python3 -m bin.benchmark_serialization --rows 20000 --repeat 5
+```
+"""
+import timeit
+import argparse
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from enrollment_service import serialization
+from enrollment_service.serialization import FastJSONResponse
+
+
+def build_roster(rows: int):
+    # Items of the Enrollments table, as returned by boto3
+    return [
+        {
+            "class_id": "2024.FA.CPSC.449.1",
+            "student_cwid": Decimal(100000 + i),
+            "student_info": {"first_name": f"First{i}", "last_name": f"Last{i}"}
+        }
+        for i in range(rows)
+    ]
+
+
+def build_class_list(rows: int):
+    # Items of the Classes table (available-index projection), as returned by boto3
+    return [
+        {
+            "id": f"2024.FA.CPSC.{400 + i % 100}.{i}",
+            "department_code": "CPSC",
+            "course_no": Decimal(400 + i % 100),
+            "section_no": Decimal(i),
+            "year": Decimal(2024),
+            "semester": "FA",
+            "title": "Back-end Engineering",
+            "instructor_cwid": Decimal(1 + i % 50),
+            "instructor_info": {"first_name": "Kenytt", "last_name": "Avery"},
+            "room_capacity": Decimal(40),
+            "enrollment_count": Decimal(i % 40)
+        }
+        for i in range(rows)
+    ]
+
+
+def build_personnel(rows: int):
+    # Items of the Personnel table, with string sets
+    return [
+        {
+            "cwid": Decimal(i),
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "roles": {"Student"},
+            "enrollments": {f"2024.FA.CPSC.{400 + j}.1" for j in range(5)},
+            "waitlists": {"2024.FA.CPSC.490.1"}
+        }
+        for i in range(rows)
+    ]
+
+
+def default_encoding(payload):
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def fast_encoding(payload):
+    return FastJSONResponse(content=payload).body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding of DynamoDB items.")
+    parser.add_argument("--rows", type=int, default=5000, help="Items per payload. Default: 5000")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, best is kept. Default: 3")
+    parser.add_argument("--number", type=int, default=10, help="Encodings per run. Default: 10")
+    args = parser.parse_args()
+
+    backend = "orjson" if serialization.orjson is not None else "json"
+    print(f"FastJSONResponse backend: {backend}, {args.rows} items per payload\n")
+    print(f"{'payload':<12} {'default (ms)':>14} {'fast (ms)':>12} {'speedup':>9}")
+
+    payloads = {
+        "roster": build_roster(args.rows),
+        "classes": build_class_list(args.rows),
+        "personnel": build_personnel(args.rows)
+    }
+
+    for name, payload in payloads.items():
+        timings = []
+        for encode in (default_encoding, fast_encoding):
+            runs = timeit.repeat(lambda: encode(payload), repeat=args.repeat, number=args.number)
+            timings.append(min(runs) / args.number * 1000)
+
+        default_ms, fast_ms = timings
+        print(f"{name:<12} {default_ms:>14.2f} {fast_ms:>12.2f} {default_ms / fast_ms:>8.1f}x")
@@ -0,0 +1,81 @@
+"""
+Measures webhook delivery throughput with one slow host and many fast ones.
+
+Local stand-in endpoints (tests/webhook_service.py) are started on consecutive ports: the first one
+answers after `--slow-delay` seconds, the others right away. Deliveries go round-robin to all of them,
+first one at a time with `requests` (what the dispatcher used to do), then with the WebhookClient,
+then with the WebhookClient batching the events per URL (`webhook_dispatcher.py --batch`).
+
+Usage (from the repository root):
+```
+python3 -m bin.benchmark_webhooks
+python3 -m bin.benchmark_webhooks --deliveries 5000 --fast-hosts 20 --slow-delay 2
+```
+"""
+import sys
+import time
+import argparse
+import requests
+from tests.webhook_service import WebhookTestService
+
+sys.path.append("workers")
+from webhook_client import WebhookClient, WebhookBatcher
+
+FIRST_PORT = 5910
+
+# Deliveries of the one-at-a-time baseline. It is slow: a fraction is enough to get the rate.
+BASELINE_DELIVERIES = 200
+
+
+def run_sequential(urls: list, num_deliveries: int):
+    started_at = time.perf_counter()
+
+    for i in range(num_deliveries):
+        requests.post(urls[i % len(urls)], json={"delivery": i})
+
+    return num_deliveries / (time.perf_counter() - started_at)
+
+
+def run_client(urls: list, num_deliveries: int, batch: bool = False):
+    client = WebhookBatcher(WebhookClient()) if batch else WebhookClient()
+    started_at = time.perf_counter()
+
+    futures = [client.post(urls[i % len(urls)], {"delivery": i}) for i in range(num_deliveries)]
+    failed = sum(1 for f in futures if f.exception() is not None)
+
+    elapsed = time.perf_counter() - started_at
+    client.close()
+
+    num_requests = client.stats()["requests"] if batch else num_deliveries
+    return (num_deliveries - failed) / elapsed, failed, num_requests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark webhook delivery with one slow host.")
+    parser.add_argument("--deliveries", type=int, default=2000, help="Deliveries. Default: 2000")
+    parser.add_argument("--fast-hosts", type=int, default=10, help="Fast endpoints. Default: 10")
+    parser.add_argument("--slow-delay", type=float, default=1, help="Response time of the slow endpoint. Default: 1")
+    args = parser.parse_args()
+
+    ports = range(FIRST_PORT, FIRST_PORT + args.fast_hosts + 1)
+    services = [WebhookTestService(port=port, delay_seconds=args.slow_delay if port == FIRST_PORT else 0,
+                                   shutdown_timer=3600)
+                for port in ports]
+    for service in services:
+        service.start()
+    time.sleep(5)  # Wait for the endpoints to be up and running
+
+    # Every port is a different host for the connection pools
+    urls = [f"http://localhost:{port}/webhook" for port in ports]
+
+    print(f"1 slow host ({args.slow_delay}s), {args.fast_hosts} fast hosts\n")
+
+    rate = run_sequential(urls, min(BASELINE_DELIVERIES, args.deliveries))
+    print(f"{'requests, one at a time':<26} {rate:>9.1f} deliveries/s")
+
+    for name, batch in (("WebhookClient", False), ("WebhookClient, batched", True)):
+        rate, failed, num_requests = run_client(urls, args.deliveries, batch)
+        print(f"{name:<26} {rate:>9.1f} deliveries/s ({failed} failed, {num_requests} requests)")
+
+    for service in services:
+        service.stop()
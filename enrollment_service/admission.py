@@ -0,0 +1,195 @@
+import json
+import math
+import asyncio
+from collections import deque
+from http import HTTPStatus
+from .idempotency import buffer_request_body, send_error
+from .metrics import metrics
+
+# Requests of one class processed at the same time. More would only conflict on the class item.
+ADMISSION_MAX_CONCURRENT_PER_CLASS = 4
+
+# Requests of one class waiting for a slot. Beyond this, requests are rejected right away.
+ADMISSION_MAX_QUEUE_PER_CLASS = 200
+
+# How long a request waits for a slot before it is rejected
+ADMISSION_MAX_WAIT_SECONDS = 10
+
+# Weight of the latest request in the average processing time (used for Retry-After)
+PROCESSING_TIME_SMOOTHING = 0.1
+
+
+class _ClassQueue:
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits the concurrent enrollment requests per class, in arrival order.
+
+    Each class gets ADMISSION_MAX_CONCURRENT_PER_CLASS slots. Further requests for the class
+    wait in a FIFO queue of up to ADMISSION_MAX_QUEUE_PER_CLASS requests, without holding a
+    worker thread. When the queue is full, or a request waited ADMISSION_MAX_WAIT_SECONDS,
+    it gets 503 with `Retry-After`. Requests for other classes are not affected.
+
+    Limits apply per service instance. Queue depth, wait time & rejections are reported
+    in `GET /metrics/` under `admission.*`.
+
+    Example:
+    ```python
+    app.add_middleware(AdmissionControlMiddleware)
+    ```
+    """
+
+    def __init__(self,
+                 app,
+                 max_concurrent_per_class: int = ADMISSION_MAX_CONCURRENT_PER_CLASS,
+                 max_queue_per_class: int = ADMISSION_MAX_QUEUE_PER_CLASS,
+                 max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.app = app
+        self.max_concurrent_per_class = max_concurrent_per_class
+        self.max_queue_per_class = max_queue_per_class
+        self.max_wait_seconds = max_wait_seconds
+
+        # class_id -> _ClassQueue, only for classes with requests in progress
+        self.queues = {}
+        self.num_active = 0
+        self.num_waiting = 0
+        self.avg_processing_seconds = 0.1
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        class_id, receive = await _get_class_id(scope, receive)
+
+        if class_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = self.queues.setdefault(class_id, _ClassQueue())
+
+        # ---------------------------------------------------------------------
+        # Take a slot, or wait for one in FIFO order
+        # ---------------------------------------------------------------------
+        if queue.active < self.max_concurrent_per_class and not queue.waiters:
+            queue.active += 1
+            self.num_active += 1
+        elif len(queue.waiters) >= self.max_queue_per_class:
+            metrics.increment("admission.rejected")
+            await send_error(send, HTTPStatus.SERVICE_UNAVAILABLE,
+                             "Too many requests for this class. Please retry later.",
+                             retry_after=self._retry_after(queue))
+            return
+        else:
+            waiter = loop.create_future()
+            queue.waiters.append(waiter)
+            self._update_queue_gauges(+1)
+            queued_at = loop.time()
+
+            try:
+                await asyncio.wait_for(waiter, self.max_wait_seconds)
+            except asyncio.TimeoutError:
+                self._remove_waiter(class_id, queue, waiter)
+                metrics.increment("admission.timed_out")
+                await send_error(send, HTTPStatus.SERVICE_UNAVAILABLE,
+                                 "Too many requests for this class. Please retry later.",
+                                 retry_after=self._retry_after(queue))
+                return
+            except BaseException:
+                # The client went away. Give the slot to the next request if it was handed over.
+                if waiter.done() and not waiter.cancelled():
+                    self._release(class_id, queue)
+                else:
+                    self._remove_waiter(class_id, queue, waiter)
+                raise
+
+            metrics.increment("admission.queued")
+            metrics.increment("admission.wait_ms", int((loop.time() - queued_at) * 1000))
+
+        metrics.increment("admission.admitted")
+        started_at = loop.time()
+
+        # ---------------------------------------------------------------------
+        # Process the request, then hand the slot over to the next one
+        # ---------------------------------------------------------------------
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.avg_processing_seconds += PROCESSING_TIME_SMOOTHING * \
+                (loop.time() - started_at - self.avg_processing_seconds)
+            self._release(class_id, queue)
+
+    def _release(self, class_id, queue: _ClassQueue):
+        while queue.waiters:
+            waiter = queue.waiters.popleft()
+            self._update_queue_gauges(-1)
+            if not waiter.done():
+                # The slot goes to the waiter, so the number of active requests does not change
+                waiter.set_result(None)
+                return
+
+        queue.active -= 1
+        self.num_active -= 1
+        metrics.set_gauge("admission.active", self.num_active)
+
+        if queue.active == 0:
+            del self.queues[class_id]
+
+    def _remove_waiter(self, class_id, queue: _ClassQueue, waiter):
+        if waiter in queue.waiters:
+            queue.waiters.remove(waiter)
+            self._update_queue_gauges(-1)
+
+        if queue.active == 0 and not queue.waiters:
+            self.queues.pop(class_id, None)
+
+    def _update_queue_gauges(self, change: int):
+        self.num_waiting += change
+        metrics.set_gauge("admission.waiting", self.num_waiting)
+        metrics.set_gauge("admission.active", self.num_active)
+
+    def _retry_after(self, queue: _ClassQueue):
+        # Time until the requests ahead are processed
+        ahead = queue.active + len(queue.waiters)
+        return max(1, math.ceil(ahead / self.max_concurrent_per_class * self.avg_processing_seconds))
+
+
+async def _get_class_id(scope, receive):
+    """
+    Returns the class of an enrollment request: (class_id, receive).
+
+    The class of `POST /enrollment/` is in the body, which is buffered and replayed.
+    Drops & hold confirmations carry it in the path. Other requests return None.
+    """
+    method = scope["method"]
+    segments = [e for e in scope["path"].split("/") if e]
+
+    # POST /holds/{class_id}/confirm/
+    if method == "POST" and len(segments) == 3 and segments[0] == "holds" and segments[2] == "confirm":
+        return segments[1], receive
+
+    if not segments or segments[0] != "enrollment":
+        return None, receive
+
+    if method == "POST" and len(segments) == 1:
+        body, receive = await buffer_request_body(receive)
+        try:
+            class_id = json.loads(body).get("class_id")
+        except (ValueError, AttributeError):
+            class_id = None
+        return (class_id if isinstance(class_id, str) else None), receive
+
+    # DELETE /enrollment/{class_id} & /enrollment/{class_id}/{student_id}/administratively/
+    if method == "DELETE" and len(segments) in (2, 4):
+        return segments[1], receive
+
+    # POST /enrollment/{class_id}/administratively/ (batch drop)
+    if method == "POST" and len(segments) == 3 and segments[2] == "administratively":
+        return segments[1], receive
+
+    return None, receive
@@ -2,11 +2,23 @@ from fastapi import FastAPI
 from .instructor_router import instructor_router
 from .student_router import student_router
 from .registrar_router import registrar_router
+from .metrics_router import metrics_router
+from .idempotency import IdempotencyMiddleware
+from .admission import AdmissionControlMiddleware
+from .serialization import FastJSONResponse
 
 # Create the main FastAPI application instance
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Attach the routers to the main application
 app.include_router(instructor_router)
 app.include_router(student_router)
 app.include_router(registrar_router)
+app.include_router(metrics_router)
+
+# Limit concurrent enrollments & drops per class during registration surges
+app.add_middleware(AdmissionControlMiddleware)
+
+# Replay responses of retried mutations that carry an Idempotency-Key header.
+# Added last, so it runs first: replays do not wait for an admission slot.
+app.add_middleware(IdempotencyMiddleware)
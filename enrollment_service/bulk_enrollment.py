@@ -0,0 +1,623 @@
+import time
+import queue
+import random
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeDeserializer
+from fastapi import HTTPException
+from redis import Redis
+from .dynamoclient import DynamoClient
+from .db_connection import get_dynamodb, TableNames
+from .enrollment_helper import batch_get_items, enroll_student, is_auto_enroll_enabled, \
+    enroll_students_from_waitlist, MAX_PROMOTIONS_PER_TRANSACTION
+from .seat_shards import get_enrollment_count, build_shard_drop_item, cache_shard_count
+from .seat_holds import count_active_holds
+from .versions import bump_versions
+
+# Number of classes written concurrently
+BULK_WRITE_CONCURRENCY = 8
+
+# Number of waitlist entries sent to Redis per pipeline
+BULK_WAITLIST_PIPELINE_SIZE = 500
+
+# A drop writes 3 items per student + 1 class (or shard) item. DynamoDB allows 100 items per transaction.
+MAX_DROPS_PER_TRANSACTION = 33
+
+# Attempts of one transaction when it conflicts with other writes
+MAX_TRANSACTION_ATTEMPTS = 3
+TRANSACTION_RETRY_DELAY_SECONDS = 0.05
+
+# Converts items in DynamoDB JSON (returned in cancellation reasons) to Python values
+_deserializer = TypeDeserializer()
+
+# boto3 resources are not thread-safe: every writer thread gets its own DynamoClient
+_thread_local = threading.local()
+
+# Put on the result queue by a writer when it is done
+_DONE = object()
+
+
+class PlacementStatus:
+    ENROLLED = "enrolled"
+    WAITLISTED = "waitlisted"
+    DROPPED = "dropped"
+    FAILED = "failed"
+
+
+def _result(class_id, cwid, status: str, detail: str = None):
+    result = {"class_id": class_id, "cwid": cwid, "status": status}
+    if detail:
+        result["detail"] = detail
+    return result
+
+
+class BulkEnrollmentPlan:
+    """
+    The placements of a bulk enrollment, grouped by class.
+
+    Attributes:
+    - failures (list): Results of the placements that were rejected while planning.
+    - enrollments (dict): class_id -> (class item, list of student items) to enroll.
+    - waitlists (dict): class_id -> list of student items to place on the waitlist.
+    - held_seats (dict): class_id -> number of seats held by checkouts (see seat_holds.py) when planning.
+    - waitlist_sizes (dict): class_id -> size of the waitlist, including the entries planned here.
+    - num_waitlists (dict): CWID -> number of waitlists of the student, including the ones planned here.
+
+    The students who lose their seat while the plan is written go to the waitlist, within the same limits.
+    """
+
+    def __init__(self, waitlist_capacity: int, max_waitlists_per_student: int):
+        self.failures = []
+        self.enrollments = {}
+        self.waitlists = {}
+        self.held_seats = {}
+        self.waitlist_sizes = {}
+        self.num_waitlists = {}
+
+        self.waitlist_capacity = waitlist_capacity
+        self.max_waitlists_per_student = max_waitlists_per_student
+        # Guards waitlist_sizes & num_waitlists while the classes are written concurrently
+        self.lock = threading.Lock()
+
+
+def plan_bulk_enrollment(placements: list,
+                         waitlist_capacity: int,
+                         max_waitlists_per_student: int,
+                         dynamodb: DynamoClient,
+                         redisdb: Redis):
+    """
+    Groups placements by class and decides, once per class, who is enrolled and who is waitlisted.
+
+    The classes and students are read with batched reads, and the waitlist sizes with one
+    Redis pipeline. Seats held by checkouts are not open. Placements keep their order within a class:
+    the first ones get the open seats.
+
+    Parameters:
+    - placements (list): (class_id, cwid) pairs.
+    - waitlist_capacity (int): Maximum number of students on a waitlist.
+    - max_waitlists_per_student (int): Maximum number of waitlists a student can be on.
+
+    Returns:
+    - BulkEnrollmentPlan
+    """
+    plan = BulkEnrollmentPlan(waitlist_capacity, max_waitlists_per_student)
+
+    # ---------------------------------------------------------------------
+    # Group by class & drop duplicates
+    # ---------------------------------------------------------------------
+    classes = {}
+    for class_id, cwid in placements:
+        cwids = classes.setdefault(class_id, {})
+        if cwid in cwids:
+            plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED, "Duplicate placement"))
+        else:
+            cwids[cwid] = None
+
+    if not classes:
+        return plan
+
+    # ---------------------------------------------------------------------
+    # Prefetch classes, students & waitlist sizes
+    # ---------------------------------------------------------------------
+    class_items = batch_get_items(dynamodb, TableNames.CLASSES,
+                                  [{"id": class_id} for class_id in classes],
+                                  ["id", "room_capacity", "enrollment_count", "shard_count"])
+    class_items = {e["id"]: e for e in class_items}
+
+    all_cwids = {cwid for cwids in classes.values() for cwid in cwids}
+    students = batch_get_items(dynamodb, TableNames.PERSONNEL,
+                               [{"cwid": cwid} for cwid in all_cwids],
+                               ["cwid", "first_name", "last_name", "enrollments", "waitlists"])
+    students = {int(e["cwid"]): e for e in students}
+
+    pipeline = redisdb.pipeline(transaction=False)
+    for class_id in classes:
+        pipeline.zcard(class_id)
+    waitlist_sizes = plan.waitlist_sizes
+    waitlist_sizes.update(zip(classes, pipeline.execute()))
+
+    # Number of waitlists per student, including the ones planned here
+    num_waitlists = plan.num_waitlists
+    num_waitlists.update((cwid, len(e.get("waitlists", ()))) for cwid, e in students.items())
+
+    # ---------------------------------------------------------------------
+    # Decide the placements of every class
+    # ---------------------------------------------------------------------
+    for class_id, cwids in classes.items():
+        class_item = class_items.get(class_id)
+
+        if class_item is None:
+            plan.failures.extend(_result(class_id, cwid, PlacementStatus.FAILED, "Class Not Found")
+                                 for cwid in cwids)
+            continue
+
+        plan.held_seats[class_id] = count_active_holds(class_id, redisdb)
+        open_seats = int(class_item.get("room_capacity", 0)) - get_enrollment_count(class_id, class_item, dynamodb) \
+            - plan.held_seats[class_id]
+
+        for cwid in cwids:
+            student = students.get(cwid)
+
+            if student is None:
+                plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED, "Student Not Found"))
+            elif class_id in student.get("enrollments", ()):
+                plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED, "Already enrolled"))
+            elif class_id in student.get("waitlists", ()):
+                plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED, "Already on the waitlist"))
+            elif open_seats > 0:
+                plan.enrollments.setdefault(class_id, (class_item, []))[1].append(student)
+                open_seats -= 1
+            elif waitlist_sizes[class_id] >= waitlist_capacity:
+                plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED, "Waitlist is full"))
+            elif num_waitlists[cwid] >= max_waitlists_per_student:
+                plan.failures.append(_result(class_id, cwid, PlacementStatus.FAILED,
+                                             "Exceed number of waitlists limit"))
+            else:
+                plan.waitlists.setdefault(class_id, []).append(student)
+                waitlist_sizes[class_id] += 1
+                num_waitlists[cwid] += 1
+
+    return plan
+
+
+def execute_bulk_enrollment(plan: BulkEnrollmentPlan, redisdb: Redis):
+    """
+    Writes a bulk enrollment plan, yielding the result of every placement as soon as it is known.
+
+    Classes are written concurrently, each in transactions of up to MAX_PROMOTIONS_PER_TRANSACTION
+    students that also check & update the class's enrollment_count. The results of a transaction
+    are yielded once it commits. Students who lose their seat to concurrent enrollments are placed
+    on the waitlist instead. Waitlist entries are added with pipelined Redis calls.
+
+    Every writer thread uses a DynamoClient of its own (see `_get_thread_dynamodb`).
+
+    Yields:
+    - dict: {"class_id", "cwid", "status": enrolled | waitlisted | failed, "detail" (if failed)}
+    """
+    yield from plan.failures
+
+    results = queue.Queue()
+
+    def write(writer, *args):
+        try:
+            for result in writer(*args, _get_thread_dynamodb(), redisdb):
+                results.put(result)
+        finally:
+            results.put(_DONE)
+
+    with ThreadPoolExecutor(max_workers=BULK_WRITE_CONCURRENCY) as executor:
+        futures = [executor.submit(write, _enroll_class, class_id, class_item, students, plan)
+                   for class_id, (class_item, students) in plan.enrollments.items()]
+
+        if plan.waitlists:
+            futures.append(executor.submit(write, _add_to_waitlists, plan.waitlists))
+
+        num_running = len(futures)
+        while num_running:
+            result = results.get()
+            if result is _DONE:
+                num_running -= 1
+            else:
+                yield result
+
+    # Raise the error of a writer that failed, if any
+    for future in futures:
+        future.result()
+
+
+def _get_thread_dynamodb():
+    if not hasattr(_thread_local, "dynamodb"):
+        _thread_local.dynamodb = get_dynamodb()
+    return _thread_local.dynamodb
+
+
+def _enroll_class(class_id, class_item: dict, students: list, plan: BulkEnrollmentPlan,
+                  dynamodb: DynamoClient, redisdb: Redis):
+    room_capacity = int(class_item.get("room_capacity", 0))
+
+    if class_item.get("shard_count"):
+        yield from _enroll_sharded_class(class_id, room_capacity, students, plan, dynamodb, redisdb)
+        return
+
+    enrollment_count = int(class_item.get("enrollment_count", 0))
+    num_held_seats = plan.held_seats.get(class_id, 0)
+    attempt = 0
+
+    while students:
+        chunk = students[:MAX_PROMOTIONS_PER_TRANSACTION]
+
+        try:
+            dynamodb.transact_write_items(
+                _build_bulk_enroll_transact_items(class_id, chunk, room_capacity, enrollment_count, num_held_seats))
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                yield from (_result(class_id, int(s["cwid"]), PlacementStatus.FAILED,
+                                    e.response["Error"]["Code"]) for s in chunk)
+                students = students[len(chunk):]
+                attempt = 0
+                continue
+
+            if attempt + 1 >= MAX_TRANSACTION_ATTEMPTS:
+                yield from (_result(class_id, int(s["cwid"]), PlacementStatus.FAILED, "Transaction Canceled")
+                            for s in chunk)
+                students = students[len(chunk):]
+                attempt = 0
+                continue
+
+            reasons = e.response["CancellationReasons"]
+
+            # The class item is last. Its condition fails when seats were taken in the meantime,
+            # or when the class was sharded.
+            if reasons[-1]["Code"] == "ConditionalCheckFailed":
+                kwargs = {
+                    "Key": {"id": class_id},
+                    "ProjectionExpression": "id, room_capacity, enrollment_count, shard_count",
+                    "ConsistentRead": True
+                }
+                class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+                if class_item is None:
+                    yield from (_result(class_id, int(s["cwid"]), PlacementStatus.FAILED, "Class Not Found")
+                                for s in students)
+                    break
+
+                if class_item.get("shard_count"):
+                    cache_shard_count(class_id, class_item["shard_count"])
+                    yield from _enroll_sharded_class(class_id, int(class_item.get("room_capacity", 0)), students,
+                                                     plan, dynamodb, redisdb)
+                    break
+
+                # The students who still fit keep their seat, the others go to the waitlist
+                room_capacity = int(class_item.get("room_capacity", 0))
+                enrollment_count = int(class_item.get("enrollment_count", 0))
+                num_held_seats = count_active_holds(class_id, redisdb)
+                open_seats = max(0, room_capacity - enrollment_count - num_held_seats)
+
+                yield from _add_overflow_to_waitlist(class_id, students[open_seats:], plan, dynamodb, redisdb)
+                students = students[:open_seats]
+            else:
+                # Drop the students who got enrolled in the meantime, then try again
+                enrolled = {chunk[j // 2]["cwid"] for j, reason in enumerate(reasons[:-1])
+                            if j % 2 == 0 and reason["Code"] == "ConditionalCheckFailed"}
+                yield from (_result(class_id, int(s["cwid"]), PlacementStatus.FAILED, "Already enrolled")
+                            for s in chunk if s["cwid"] in enrolled)
+                students = [s for s in students if s["cwid"] not in enrolled]
+
+            if not students:
+                break
+
+            time.sleep(TRANSACTION_RETRY_DELAY_SECONDS * (2 ** attempt))
+            attempt += 1
+        else:
+            enrollment_count += len(chunk)
+            bump_versions([class_id], [int(s["cwid"]) for s in chunk], catalog=True)
+            yield from (_result(class_id, int(s["cwid"]), PlacementStatus.ENROLLED) for s in chunk)
+            students = students[len(chunk):]
+            attempt = 0
+
+
+def _enroll_sharded_class(class_id, room_capacity: int, students: list, plan: BulkEnrollmentPlan,
+                          dynamodb: DynamoClient, redisdb: Redis):
+    # Every student takes a seat from one of the shards, like a single enrollment
+    overflow = []
+
+    # Seats held by checkouts are not open, like in the unsharded path
+    max_enrollment_count = None
+    num_held_seats = count_active_holds(class_id, redisdb)
+    if num_held_seats:
+        max_enrollment_count = room_capacity - num_held_seats
+
+    for student in students:
+        cwid = int(student["cwid"])
+
+        try:
+            full_class = enroll_student(class_id, cwid, student["first_name"], student["last_name"], dynamodb,
+                                        max_enrollment_count)
+        except HTTPException as e:
+            yield _result(class_id, cwid, PlacementStatus.FAILED, str(e.detail))
+        except ClientError as e:
+            yield _result(class_id, cwid, PlacementStatus.FAILED, e.response["Error"]["Code"])
+        else:
+            if full_class is None:
+                bump_versions([class_id], [cwid], catalog=True)
+                yield _result(class_id, cwid, PlacementStatus.ENROLLED)
+            else:
+                overflow.append(student)
+
+    yield from _add_overflow_to_waitlist(class_id, overflow, plan, dynamodb, redisdb)
+
+
+def _add_overflow_to_waitlist(class_id, students: list, plan: BulkEnrollmentPlan,
+                              dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Places the students who lost their seat while the plan was written on the waitlist,
+    within the limits of the plan. The class is full for the ones that do not fit.
+    """
+    results = []
+    waitlisted = []
+
+    with plan.lock:
+        for student in students:
+            cwid = int(student["cwid"])
+
+            if plan.waitlist_sizes.get(class_id, 0) >= plan.waitlist_capacity:
+                results.append(_result(class_id, cwid, PlacementStatus.FAILED, "Class is full"))
+            elif plan.num_waitlists.get(cwid, 0) >= plan.max_waitlists_per_student:
+                results.append(_result(class_id, cwid, PlacementStatus.FAILED, "Exceed number of waitlists limit"))
+            else:
+                waitlisted.append(student)
+                plan.waitlist_sizes[class_id] = plan.waitlist_sizes.get(class_id, 0) + 1
+                plan.num_waitlists[cwid] = plan.num_waitlists.get(cwid, 0) + 1
+
+    if waitlisted:
+        results.extend(_add_to_waitlists({class_id: waitlisted}, dynamodb, redisdb))
+
+    return results
+
+
+def _build_bulk_enroll_transact_items(class_id, students: list, room_capacity: int, enrollment_count: int,
+                                      num_held_seats: int = 0):
+    transact_items = []
+
+    for student in students:
+        cwid = int(student["cwid"])
+
+        transact_items.append({
+            "Put": {
+                "TableName": TableNames.ENROLLMENTS,
+                "Item": {
+                    "class_id": class_id,
+                    "student_cwid": cwid,
+                    "student_info": {
+                        "first_name": student["first_name"],
+                        "last_name": student["last_name"]
+                    }
+                },
+                "ConditionExpression": "attribute_not_exists(class_id) AND attribute_not_exists(student_cwid)"
+            }
+        })
+
+        transact_items.append({
+            "Update": {
+                "TableName": TableNames.PERSONNEL,
+                "Key": {"cwid": cwid},
+                "UpdateExpression": "ADD enrollments :value",
+                "ExpressionAttributeValues": {":value": {class_id}}
+            }
+        })
+
+    transact_items.append({
+        "Update": {
+            "TableName": TableNames.CLASSES,
+            "Key": {"id": class_id},
+            "UpdateExpression": "SET available = :status, \
+                                    enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size",
+            "ConditionExpression": "attribute_not_exists(shard_count) \
+                                    AND (attribute_not_exists(enrollment_count) OR enrollment_count <= :max_count)",
+            "ExpressionAttributeValues": {
+                ":status": "true" if room_capacity > enrollment_count + len(students) else "false",
+                ":step_size": len(students),
+                ":zero": 0,
+                ":max_count": room_capacity - num_held_seats - len(students)
+            }
+        }
+    })
+
+    return transact_items
+
+
+def _add_to_waitlists(waitlists: dict, dynamodb: DynamoClient, redisdb: Redis):
+    results = []
+    score = int(datetime.utcnow().timestamp())
+    entries = [(class_id, student) for class_id, students in waitlists.items() for student in students]
+
+    # ***********************************************
+    # Redis: Add to the waitlists in pipelined batches
+    # ***********************************************
+    for i in range(0, len(entries), BULK_WAITLIST_PIPELINE_SIZE):
+        pipeline = redisdb.pipeline(transaction=False)
+        for class_id, student in entries[i:i + BULK_WAITLIST_PIPELINE_SIZE]:
+            member = f"{int(student['cwid'])}#{student['first_name']}#{student['last_name']}"
+            pipeline.zadd(class_id, {member: score})
+        pipeline.execute()
+
+    # ***********************************************
+    # UPDATE PERSONNEL `waitlists` attribute, once per student
+    # ***********************************************
+    class_ids_by_student = {}
+    for class_id, student in entries:
+        class_ids_by_student.setdefault(int(student["cwid"]), set()).add(class_id)
+
+    for cwid, class_ids in class_ids_by_student.items():
+        kwargs = {
+            "Key": {"cwid": cwid},
+            "UpdateExpression": "ADD waitlists :value",
+            "ExpressionAttributeValues": {":value": class_ids}
+        }
+        dynamodb.update_item(TableNames.PERSONNEL, kwargs)
+
+    bump_versions(waitlists.keys(), class_ids_by_student.keys(), redisdb=redisdb)
+
+    results.extend(_result(class_id, int(student["cwid"]), PlacementStatus.WAITLISTED)
+                   for class_id, student in entries)
+    return results
+
+
+def bulk_drop(class_id, cwids: list, dynamodb: DynamoClient):
+    """
+    Drops many students from a class administratively.
+
+    The enrollments are read with batched reads and deleted in transactions of up to
+    MAX_DROPS_PER_TRANSACTION students, each with a single update of the class's enrollment_count
+    (or of one of its shards). The waitlist promotion runs once, after all the drops.
+
+    Parameters:
+    - cwids (list): The students to drop. Duplicates are ignored.
+
+    Returns:
+    - list: {"class_id", "cwid", "status": dropped | failed, "detail" (if failed)} per student.
+    """
+    results = []
+    cwids = list(dict.fromkeys(cwids))
+
+    kwargs = {"Key": {"id": class_id}, "ProjectionExpression": "id, shard_count"}
+    class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+    if class_item is None:
+        return [_result(class_id, cwid, PlacementStatus.FAILED, "Class Not Found") for cwid in cwids]
+
+    shard_count = class_item.get("shard_count")
+
+    # ---------------------------------------------------------------------
+    # Read the names stored in the enrollments, for the droplist
+    # ---------------------------------------------------------------------
+    enrollments = batch_get_items(dynamodb, TableNames.ENROLLMENTS,
+                                  [{"class_id": class_id, "student_cwid": cwid} for cwid in cwids],
+                                  ["student_cwid", "student_info"])
+    student_infos = {int(e["student_cwid"]): e["student_info"] for e in enrollments}
+
+    results.extend(_result(class_id, cwid, PlacementStatus.FAILED, "Enrollment Not Found")
+                   for cwid in cwids if cwid not in student_infos)
+    students = [(cwid, student_infos[cwid]) for cwid in cwids if cwid in student_infos]
+
+    # ---------------------------------------------------------------------
+    # Drop in chunks that fit in one transaction
+    # ---------------------------------------------------------------------
+    dropped = []
+
+    for i in range(0, len(students), MAX_DROPS_PER_TRANSACTION):
+        chunk = students[i:i + MAX_DROPS_PER_TRANSACTION]
+
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            try:
+                dynamodb.transact_write_items(_build_bulk_drop_transact_items(class_id, chunk, shard_count))
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException":
+                    results.extend(_result(class_id, cwid, PlacementStatus.FAILED, e.response["Error"]["Code"])
+                                   for cwid, _ in chunk)
+                    chunk = []
+                    break
+
+                reasons = e.response["CancellationReasons"]
+
+                # The class (or shard) item is last. Its condition fails when the class was (un)sharded.
+                if reasons[-1]["Code"] == "ConditionalCheckFailed":
+                    class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item", {})
+                    shard_count = class_item.get("shard_count")
+                    cache_shard_count(class_id, shard_count)
+
+                # Enrollments that were dropped in the meantime, or store other names
+                for j in range(len(chunk) - 1, -1, -1):
+                    reason = reasons[j * 3]
+                    if reason["Code"] != "ConditionalCheckFailed":
+                        continue
+
+                    cwid = chunk[j][0]
+                    if "Item" in reason:
+                        chunk[j] = (cwid, _deserializer.deserialize(reason["Item"]["student_info"]))
+                    else:
+                        results.append(_result(class_id, cwid, PlacementStatus.FAILED, "Enrollment Not Found"))
+                        del chunk[j]
+
+                if not chunk:
+                    break
+
+                time.sleep(TRANSACTION_RETRY_DELAY_SECONDS * (2 ** attempt))
+            else:
+                dropped.extend(cwid for cwid, _ in chunk)
+                results.extend(_result(class_id, cwid, PlacementStatus.DROPPED) for cwid, _ in chunk)
+                chunk = []
+                break
+
+        results.extend(_result(class_id, cwid, PlacementStatus.FAILED, "Transaction Canceled")
+                       for cwid, _ in chunk)
+
+    # ---------------------------------------------------------------------
+    # Give the seats to the waitlist, once
+    # ---------------------------------------------------------------------
+    if dropped:
+        bump_versions([class_id], dropped, catalog=True)
+
+        if is_auto_enroll_enabled(dynamodb):
+            enroll_students_from_waitlist([class_id], dynamodb)
+
+    return results
+
+
+def _build_bulk_drop_transact_items(class_id, students: list, shard_count: int = None):
+    transact_items = []
+
+    for cwid, student_info in students:
+        transact_items.append({
+            "Delete": {
+                "TableName": TableNames.ENROLLMENTS,
+                "Key": {"class_id": class_id, "student_cwid": cwid},
+                "ConditionExpression": "student_info = :student_info",
+                "ExpressionAttributeValues": {":student_info": student_info},
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD"
+            }
+        })
+
+        transact_items.append({
+            "Put": {
+                "TableName": TableNames.DROPLIST,
+                "Item": {
+                    "class_id": class_id,
+                    "student_cwid": cwid,
+                    "student_info": student_info,
+                    "administrative": True
+                }
+            }
+        })
+
+        transact_items.append({
+            "Update": {
+                "TableName": TableNames.PERSONNEL,
+                "Key": {"cwid": cwid},
+                "UpdateExpression": "DELETE enrollments :value",
+                "ExpressionAttributeValues": {":value": {class_id}}
+            }
+        })
+
+    if shard_count:
+        # All the seats go back to one random shard. The merger spreads them again.
+        transact_items.append(build_shard_drop_item(class_id, random.randrange(int(shard_count)), len(students)))
+    else:
+        transact_items.append({
+            "Update": {
+                "TableName": TableNames.CLASSES,
+                "Key": {"id": class_id},
+                "UpdateExpression": "SET available = :status, \
+                                        enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size",
+                "ConditionExpression": "attribute_not_exists(shard_count)",
+                "ExpressionAttributeValues": {
+                    ":status": "true",
+                    ":step_size": -len(students),
+                    ":zero": 0
+                }
+            }
+        })
+
+    return transact_items
@@ -0,0 +1,354 @@
+"""
+Imports courses & classes from CSV or NDJSON.
+
+The input is parsed incrementally and processed in chunks of IMPORT_CHUNK_SIZE records:
+the referenced courses & instructors (and already existing records) are prefetched with
+batched reads, the records are validated in memory, and the valid ones are written with
+transactions of conditional puts, so records created since the prefetch are not overwritten.
+Invalid records are reported per row and do not abort the import.
+
+Usage:
+```
+python3 -m enrollment_service.bulk_import classes ./schedule.csv
+python3 -m enrollment_service.bulk_import courses ./courses.ndjson --format ndjson
+```
+"""
+import sys
+import csv
+import json
+import time
+import argparse
+from enum import Enum
+from itertools import islice
+import anyio
+from pydantic import ValidationError
+from botocore.exceptions import ClientError
+from .dynamoclient import DynamoClient
+from .db_connection import get_dynamodb, TableNames
+from .enrollment_helper import batch_get_items, build_class_record, MAX_TRANSACTION_ITEMS
+from .models import Course, ClassCreate
+from .versions import bump_versions
+
+# Number of records validated & written together
+IMPORT_CHUNK_SIZE = 500
+
+# Attempts of one transaction when it conflicts with other writes
+MAX_TRANSACTION_ATTEMPTS = 3
+TRANSACTION_RETRY_DELAY_SECONDS = 0.05
+
+
+class ImportKind(str, Enum):
+    COURSES = "courses"
+    CLASSES = "classes"
+
+
+class ImportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+def import_records(kind: ImportKind, fmt: ImportFormat, lines, dynamodb: DynamoClient):
+    """
+    Imports the records of a CSV or NDJSON input.
+
+    Parameters:
+    - kind (ImportKind): What the records are.
+    - fmt (ImportFormat): The input format. CSV input starts with a header row.
+    - lines (iterable): The lines of the input. It is consumed incrementally.
+    - dynamodb (DynamoClient): Database connection.
+
+    Returns:
+    - dict: {"imported": int, "failed": int, "errors": [{"row": int, "detail": str}]}
+    """
+    import_chunk = _import_courses if kind == ImportKind.COURSES else _import_classes
+    rows = _parse_rows(fmt, lines)
+
+    summary = {"imported": 0, "failed": 0, "errors": []}
+
+    # Keys of the records imported so far, to detect duplicates in the input
+    seen_keys = set()
+
+    while True:
+        chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+
+        # Rows that could not be parsed
+        errors = [{"row": row_no, "detail": record} for row_no, record in chunk if isinstance(record, str)]
+        records = [(row_no, record) for row_no, record in chunk if not isinstance(record, str)]
+
+        imported, chunk_errors = import_chunk(records, seen_keys, dynamodb)
+        errors.extend(chunk_errors)
+
+        summary["imported"] += imported
+        summary["failed"] += len(errors)
+        summary["errors"].extend(sorted(errors, key=lambda e: e["row"]))
+
+    return summary
+
+
+def iter_lines_from_async(stream):
+    """
+    Turns an async stream of bytes (e.g. `request.stream()`) into lines of text.
+
+    The returned generator must be consumed in a worker thread started by AnyIO
+    (e.g. with `run_in_threadpool`), while the event loop reads the stream.
+    """
+    iterator = stream.__aiter__()
+
+    async def read_chunk():
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    pending = b""
+
+    while True:
+        chunk = anyio.from_thread.run(read_chunk)
+        if chunk is None:
+            break
+
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+
+    if pending:
+        yield pending.decode("utf-8")
+
+
+def _parse_rows(fmt: ImportFormat, lines):
+    """
+    Yields (row number, record). The record is an error message if the row cannot be parsed.
+    """
+    if fmt == ImportFormat.CSV:
+        reader = csv.DictReader(lines)
+        for row_no, record in enumerate(reader, start=1):
+            if None in record or None in record.values():
+                yield row_no, "Number of columns does not match the header"
+            else:
+                yield row_no, record
+    else:
+        row_no = 0
+        for line in lines:
+            if not line.strip():
+                continue
+
+            row_no += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_no, f"Invalid JSON: {e}"
+                continue
+
+            if isinstance(record, dict):
+                yield row_no, record
+            else:
+                yield row_no, "Record is not a JSON object"
+
+
+def _validation_detail(e: ValidationError):
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+def _import_courses(records: list, seen_keys: set, dynamodb: DynamoClient):
+    errors = []
+    courses = []
+
+    # ---------------------------------------------------------------------
+    # Validate
+    # ---------------------------------------------------------------------
+    for row_no, record in records:
+        try:
+            course = Course(**record)
+        except ValidationError as e:
+            errors.append({"row": row_no, "detail": _validation_detail(e)})
+            continue
+
+        key = (course.department_code, course.course_no)
+        if key in seen_keys:
+            errors.append({"row": row_no, "detail": "Duplicate course"})
+            continue
+
+        seen_keys.add(key)
+        courses.append((row_no, course))
+
+    # ---------------------------------------------------------------------
+    # Prefetch the courses that already exist
+    # ---------------------------------------------------------------------
+    existing = batch_get_items(dynamodb, TableNames.COURSES,
+                               [{"department_code": c.department_code, "course_no": c.course_no} for _, c in courses],
+                               ["department_code", "course_no"])
+    existing = {(e["department_code"], int(e["course_no"])) for e in existing}
+
+    # ---------------------------------------------------------------------
+    # Write
+    # ---------------------------------------------------------------------
+    new_courses = []
+
+    for row_no, course in courses:
+        if (course.department_code, course.course_no) in existing:
+            errors.append({"row": row_no, "detail": "Item already exists"})
+            continue
+
+        new_courses.append((row_no, dict(course)))
+
+    imported, write_errors = _put_new_items(TableNames.COURSES, new_courses, "department_code", dynamodb)
+    errors.extend(write_errors)
+
+    return imported, errors
+
+
+def _import_classes(records: list, seen_keys: set, dynamodb: DynamoClient):
+    errors = []
+    classes = []
+
+    # ---------------------------------------------------------------------
+    # Validate
+    # ---------------------------------------------------------------------
+    for row_no, record in records:
+        try:
+            new_class = ClassCreate(**record)
+        except ValidationError as e:
+            errors.append({"row": row_no, "detail": _validation_detail(e)})
+            continue
+
+        classes.append((row_no, new_class))
+
+    # ---------------------------------------------------------------------
+    # Prefetch the courses, instructors & classes that already exist
+    # ---------------------------------------------------------------------
+    course_keys = {(c.department_code, c.course_no) for _, c in classes}
+    courses = batch_get_items(dynamodb, TableNames.COURSES,
+                              [{"department_code": d, "course_no": n} for d, n in course_keys],
+                              ["department_code", "course_no", "title"])
+    courses = {(e["department_code"], int(e["course_no"])): e for e in courses}
+
+    instructor_keys = {c.instructor_cwid for _, c in classes}
+    instructors = batch_get_items(dynamodb, TableNames.PERSONNEL,
+                                  [{"cwid": cwid} for cwid in instructor_keys],
+                                  ["cwid", "first_name", "last_name", "roles"])
+    instructors = {int(e["cwid"]): e for e in instructors}
+
+    class_ids = {f"{c.year}.{c.semester}.{c.department_code}.{c.course_no}.{c.section_no}" for _, c in classes}
+    existing = batch_get_items(dynamodb, TableNames.CLASSES, [{"id": e} for e in class_ids], ["id"])
+    existing = {e["id"] for e in existing}
+
+    # ---------------------------------------------------------------------
+    # Check references & write
+    # ---------------------------------------------------------------------
+    new_classes = []
+
+    for row_no, new_class in classes:
+        course = courses.get((new_class.department_code, new_class.course_no))
+        instructor = instructors.get(new_class.instructor_cwid)
+
+        if course is None:
+            errors.append({"row": row_no, "detail": "Course information not found"})
+            continue
+
+        # Personnel items created by an enrollment have no roles
+        if instructor is None or "Instructor" not in instructor.get("roles", ()):
+            errors.append({"row": row_no, "detail": "Instructor not found"})
+            continue
+
+        record = build_class_record(new_class, course, instructor)
+
+        if record["id"] in existing:
+            errors.append({"row": row_no, "detail": "Item already exists"})
+            continue
+
+        if record["id"] in seen_keys:
+            errors.append({"row": row_no, "detail": "Duplicate class"})
+            continue
+
+        seen_keys.add(record["id"])
+        new_classes.append((row_no, record))
+
+    imported, write_errors = _put_new_items(TableNames.CLASSES, new_classes, "id", dynamodb)
+    errors.extend(write_errors)
+
+    if imported:
+        bump_versions(catalog=True)
+
+    return imported, errors
+
+
+def _put_new_items(table_name: str, items: list, key_attribute: str, dynamodb: DynamoClient):
+    """
+    Writes items that must not exist yet, in transactions of up to MAX_TRANSACTION_ITEMS puts
+    conditioned on `attribute_not_exists(key_attribute)`. An item created since the prefetch
+    is reported instead of being overwritten, and the rest of its transaction is written again.
+
+    Parameters:
+    - items (list): (row number, item) pairs.
+
+    Returns:
+    - tuple: (number of items written, [{"row": int, "detail": str}] of the items not written)
+    """
+    imported = 0
+    errors = []
+
+    for i in range(0, len(items), MAX_TRANSACTION_ITEMS):
+        chunk = items[i:i + MAX_TRANSACTION_ITEMS]
+
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            transact_items = [{
+                "Put": {
+                    "TableName": table_name,
+                    "Item": item,
+                    "ConditionExpression": f"attribute_not_exists({key_attribute})"
+                }
+            } for _, item in chunk]
+
+            try:
+                dynamodb.transact_write_items(transact_items)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+
+                # Drop the items that exist now, then try again
+                reasons = e.response["CancellationReasons"]
+                created = {j for j, reason in enumerate(reasons) if reason["Code"] == "ConditionalCheckFailed"}
+                errors.extend({"row": row_no, "detail": "Item already exists"}
+                              for j, (row_no, _) in enumerate(chunk) if j in created)
+                chunk = [e for j, e in enumerate(chunk) if j not in created]
+
+                if not chunk:
+                    break
+
+                time.sleep(TRANSACTION_RETRY_DELAY_SECONDS * (2 ** attempt))
+            else:
+                imported += len(chunk)
+                chunk = []
+                break
+
+        errors.extend({"row": row_no, "detail": "Transaction Canceled"} for row_no, _ in chunk)
+
+    return imported, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import courses or classes from CSV or NDJSON.")
+    parser.add_argument("kind", type=ImportKind, choices=list(ImportKind))
+    parser.add_argument("path", help="Input file. Use - for stdin.")
+    parser.add_argument("--format", type=ImportFormat, choices=list(ImportFormat), default=None,
+                        help="Input format. Default: based on the file extension, otherwise csv.")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        fmt = ImportFormat.NDJSON if args.path.endswith((".ndjson", ".jsonl")) else ImportFormat.CSV
+
+    if args.path == "-":
+        summary = import_records(args.kind, fmt, sys.stdin, get_dynamodb())
+    else:
+        with open(args.path, newline="", encoding="utf-8") as f:
+            summary = import_records(args.kind, fmt, f, get_dynamodb())
+
+    for error in summary["errors"]:
+        print(f"Row {error['row']}: {error['detail']}", file=sys.stderr)
+
+    print(f"Imported: {summary['imported']}, Failed: {summary['failed']}")
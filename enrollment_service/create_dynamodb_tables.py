@@ -1,4 +1,7 @@
-from .db_connection import get_dynamodb, TableNames
+from redis import RedisError
+from .db_connection import get_dynamodb, get_redisdb, TableNames
+from .dependency_injection import reset_sync_cache
+from .enrollment_helper import AVAILABLE_CLASS_ATTRIBUTES
 
 dynamodb = get_dynamodb()
 
@@ -28,7 +31,9 @@ create_class_table_params = {
                 {"AttributeName": "available", "KeyType": "HASH"}
             ],
             "Projection": {
-                "ProjectionType": "ALL"
+                "ProjectionType": "INCLUDE",
+                # Key attributes (id, available) are always projected
+                "NonKeyAttributes": [e for e in AVAILABLE_CLASS_ATTRIBUTES if e != "id"]
             },
             "ProvisionedThroughput": {
                 "ReadCapacityUnits": 3,
@@ -148,6 +153,33 @@ create_droplist_table_params = {
 }
 
 
+# Seat counters of sharded classes (see seat_shards.py)
+create_seat_shard_table_params = {
+    "TableName": TableNames.SEAT_SHARDS,
+    "KeySchema": [
+        {
+            "AttributeName": "class_id",
+            "KeyType": "HASH"
+        },
+        {
+            "AttributeName": "shard_no",
+            "KeyType": "RANGE"
+        }
+    ],
+    "AttributeDefinitions": [
+        {
+            "AttributeName": "class_id",
+            "AttributeType": "S"
+        },
+        {
+            "AttributeName": "shard_no",
+            "AttributeType": "N"
+        }
+    ],
+    "ProvisionedThroughput": {"ReadCapacityUnits": 3, "WriteCapacityUnits": 3}
+}
+
+
 # ---------------------------------------------------------------------
 # Delete all existing tables
 # ---------------------------------------------------------------------
@@ -166,6 +198,7 @@ dynamodb.create_table(create_personnel_table_params)
 dynamodb.create_table(create_config_table_params)
 dynamodb.create_table(create_enrollment_table_params)
 dynamodb.create_table(create_droplist_table_params)
+dynamodb.create_table(create_seat_shard_table_params)
 
 
 # ---------------------------------------------------------------------
@@ -179,3 +212,12 @@ kwargs = {
 }
 
 dynamodb.put_item(TableNames.CONFIGS, kwargs)
+
+
+# ---------------------------------------------------------------------
+# The Personnel items are gone: the synchronized claims must be synchronized again
+# ---------------------------------------------------------------------
+try:
+    reset_sync_cache(get_redisdb())
+except RedisError as e:
+    print(f"RedisError: {e}")
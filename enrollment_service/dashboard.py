@@ -0,0 +1,100 @@
+"""
+The student dashboard: everything a student's home page shows, gathered in one request.
+
+The backend calls run concurrently in two phases:
+1. The Personnel item and the notification subscriptions.
+2. Once the Personnel item is known: the details of the student's classes (batched reads)
+   and the waitlist positions (one Redis pipeline). The subscriptions may still be loading.
+
+So a dashboard takes about as long as its slowest chain of calls, not the sum of all of them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from redis import Redis
+from .dynamoclient import DynamoClient
+from .db_connection import TableNames
+from .enrollment_helper import batch_get_items, AVAILABLE_CLASS_ATTRIBUTES
+from .subscriptions import get_subscriptions, member_name
+
+# Backend calls of all the dashboards in progress, per service instance
+DASHBOARD_MAX_CONCURRENT_CALLS = 32
+
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_MAX_CONCURRENT_CALLS, thread_name_prefix="dashboard")
+
+
+def get_dashboard(student_id: int, first_name: str, last_name: str, dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Gathers the dashboard of a student.
+
+    Returns:
+    - dict: {
+        "student": {"cwid", "first_name", "last_name"},
+        "enrollments": [class, ...],
+        "waitlists": [class with "position", ...],
+        "subscriptions": [{"class_id", "email", "webhook_url"}, ...]
+      }
+      Classes carry AVAILABLE_CLASS_ATTRIBUTES. Classes that no longer exist are left out.
+    """
+    member = member_name(student_id, first_name, last_name)
+
+    # ---------------------------------------------------------------------
+    # Phase 1: Personnel item & subscriptions
+    # ---------------------------------------------------------------------
+    personnel_future = _executor.submit(_read_personnel, student_id, dynamodb)
+    subscriptions_future = _executor.submit(get_subscriptions, member, redisdb)
+
+    personnel = personnel_future.result()
+    enrollments = sorted(personnel.get("enrollments", ()))
+    waitlists = sorted(personnel.get("waitlists", ()))
+
+    # ---------------------------------------------------------------------
+    # Phase 2: Class details & waitlist positions
+    # ---------------------------------------------------------------------
+    classes_future = _executor.submit(_read_classes, set(enrollments) | set(waitlists), dynamodb)
+    positions_future = _executor.submit(_read_waitlist_positions, waitlists, member, redisdb)
+
+    classes = classes_future.result()
+    positions = positions_future.result()
+
+    waitlisted_classes = []
+    for class_id in waitlists:
+        if class_id in classes:
+            waitlisted_classes.append({**classes[class_id], "position": positions.get(class_id)})
+
+    return {
+        "student": {"cwid": student_id, "first_name": first_name, "last_name": last_name},
+        "enrollments": [classes[e] for e in enrollments if e in classes],
+        "waitlists": waitlisted_classes,
+        "subscriptions": subscriptions_future.result(),
+    }
+
+
+def _read_personnel(student_id: int, dynamodb: DynamoClient):
+    kwargs = {
+        "Key": {"cwid": student_id},
+        "ProjectionExpression": "enrollments, waitlists"
+    }
+    return dynamodb.get_item(TableNames.PERSONNEL, kwargs).get("Item", {})
+
+
+def _read_classes(class_ids: set, dynamodb: DynamoClient):
+    if not class_ids:
+        return {}
+
+    items = batch_get_items(dynamodb, TableNames.CLASSES, [{"id": e} for e in class_ids],
+                            AVAILABLE_CLASS_ATTRIBUTES)
+    return {e["id"]: e for e in items}
+
+
+def _read_waitlist_positions(class_ids: list, member: str, redisdb: Redis):
+    """
+    Returns:
+    - dict: class_id -> position on the waitlist (1 is next), for the waitlists the student is on.
+    """
+    if not class_ids:
+        return {}
+
+    pipeline = redisdb.pipeline(transaction=False)
+    for class_id in class_ids:
+        pipeline.zrank(class_id, member)
+
+    return {class_id: rank + 1 for class_id, rank in zip(class_ids, pipeline.execute()) if rank is not None}
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 from pydantic_settings import BaseSettings
 from .dynamoclient import DynamoClient
 
@@ -10,6 +11,7 @@ class TableNames:
     ENROLLMENTS = "Enrollments"
     DROPLIST = "Droplist"
     PERSONNEL = "Personnel"
+    SEAT_SHARDS = "ClassSeatShards"
 
 
 class Settings(BaseSettings, env_file=".env", extra="ignore"):
@@ -17,6 +19,10 @@ class Settings(BaseSettings, env_file=".env", extra="ignore"):
     AWS_SECRET_ACCESS_KEY: str
     AWS_REGION_NAME: str
 
+    # True: enroll with one conditional transaction (no pre-read of the class).
+    # False: read the class first, then enroll.
+    FAST_ENROLL: bool = True
+
 
 settings = Settings()
 
@@ -28,6 +34,9 @@ def get_db():
 def get_redisdb():
     return redis.Redis()
 
+def get_async_redisdb():
+    return redis.asyncio.Redis()
+
 def get_dynamodb():
     return DynamoClient(settings.AWS_ACCESS_KEY_ID,
                        settings.AWS_SECRET_ACCESS_KEY,
@@ -1,6 +1,47 @@
+import json
+import hashlib
 from fastapi import Header, Depends
+from redis import Redis, RedisError
 from .dynamoclient import DynamoClient
-from .db_connection import get_dynamodb, TableNames
+from .db_connection import get_dynamodb, get_redisdb, TableNames
+from .metrics import metrics
+
+# Claims that were recently synchronized are remembered in Redis (shared by all service instances),
+# keyed by a hash of the claims.
+SYNC_CACHE_TTL_SECONDS = 60 * 60
+
+# The value of every remembered claims hash. The reseed (create_dynamodb_tables.py) bumps it:
+# claims synchronized before no longer prove that their Personnel item exists.
+SYNC_EPOCH_KEY = "personnel_sync:epoch"
+
+
+def _claims_digest(cwid: int, first_name: str, last_name: str, roles: list[str]):
+    claims = json.dumps([cwid, first_name, last_name, roles], separators=(",", ":"))
+    return hashlib.sha256(claims.encode("utf-8")).hexdigest()
+
+
+def _get_sync_state(cache_key: str, redisdb: Redis):
+    """
+    Returns:
+    - tuple: (True if the claims were synchronized in the current epoch, the current epoch)
+    """
+    try:
+        pipeline = redisdb.pipeline(transaction=False)
+        pipeline.get(SYNC_EPOCH_KEY)
+        pipeline.get(cache_key)
+        epoch, synced_epoch = pipeline.execute()
+    except RedisError:
+        return False, None
+
+    epoch = epoch or b"0"
+    return synced_epoch == epoch, epoch
+
+
+def reset_sync_cache(redisdb: Redis):
+    """
+    Forgets all the synchronized claims. Call it whenever the Personnel table is recreated.
+    """
+    redisdb.incr(SYNC_EPOCH_KEY)
 
 
 def sync_user_account(
@@ -8,15 +49,22 @@ def sync_user_account(
         first_name: str = Header(alias="x-first-name"),
         last_name: str = Header(alias="x-last-name"),
         roles: list[str] = Header(alias="x-roles"),
+        redisdb: Redis = Depends(get_redisdb),
         dynamodb: DynamoClient = Depends(get_dynamodb)):
     """
     Synchronizes user account information to a DynamoDB table.
 
+    DynamoDB is only accessed when the claims (cwid, names, roles) were not synchronized recently.
+    Synchronized claims are remembered in Redis for SYNC_CACHE_TTL_SECONDS, until the Personnel
+    table is recreated (see `reset_sync_cache`). The saved Personnel reads are counted
+    in the `personnel_sync.reads_saved` metric.
+
     Parameters:
     - cwid (int): The user's unique identifier.
     - first_name (str): The user's first name.
     - last_name (str): The user's last name.
     - roles (str): A comma-separated string of user roles.
+    - redisdb (Redis): Redis client used to cache the synchronized claims.
     - dynamodb (DynamoClient): DynamoDB client used to interact with the database.
 
     Raises:
@@ -30,7 +78,22 @@ def sync_user_account(
     Note:
     This function is designed to be used as a FastAPI dependency in web applications.
     """
+    digest = _claims_digest(cwid, first_name, last_name, roles)
+    cache_key = f"personnel_sync:{digest}"
+
+    # ***********************************************
+    # Claims synchronized recently. Nothing to do.
+    # ***********************************************
     try:
+        is_synced, epoch = _get_sync_state(cache_key, redisdb)
+
+        if is_synced:
+            metrics.increment("personnel_sync.redis_hits")
+            metrics.increment("personnel_sync.reads_saved")
+            return
+
+        metrics.increment("personnel_sync.misses")
+
         kwargs = {"Key": {"cwid": cwid}}
         response = dynamodb.get_item(TableNames.PERSONNEL, kwargs)
 
@@ -48,9 +111,9 @@ def sync_user_account(
             }
             dynamodb.put_item(TableNames.PERSONNEL, kwargs)
 
-        elif response["Item"]["first_name"] != first_name \
-                or response["Item"]["last_name"] != last_name \
-                or response["Item"]["roles"] != roles:
+        elif response["Item"].get("first_name") != first_name \
+                or response["Item"].get("last_name") != last_name \
+                or response["Item"].get("roles") != roles:
             # ***********************************************
             # Data changes dectected. UPDATE data
             # ***********************************************
@@ -61,5 +124,16 @@ def sync_user_account(
             }
             dynamodb.update_item(TableNames.PERSONNEL, kwargs)
 
+        # ***********************************************
+        # Remember the synchronized claims, for the epoch read before the sync
+        # ***********************************************
+        if epoch is not None:
+            try:
+                redisdb.set(cache_key, epoch, ex=SYNC_CACHE_TTL_SECONDS)
+            except RedisError:
+                pass
+
     except Exception as e:
         raise Exception(f"UserAccountSyncFailed: {e}")
+    finally:
+        redisdb.close()
@@ -39,6 +39,12 @@ class DynamoClient:
     def batch_write_item(self, kwargs: dict):
         return self.dyn_resource.batch_write_item(**kwargs)
 
+    def batch_get_item(self, kwargs: dict):
+        return self.dyn_resource.batch_get_item(**kwargs)
+
+    def batch_writer(self, tablename: str):
+        return self.dyn_resource.Table(tablename).batch_writer()
+
     def query(self, tablename: str, kwargs: dict):
         return self.dyn_resource.Table(tablename).query(**kwargs)
 
@@ -1,25 +1,109 @@
 from http import HTTPStatus
 from fastapi import HTTPException, status
 from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeDeserializer
 from .dynamoclient import DynamoClient
 from .db_connection import get_dynamodb, get_redisdb, TableNames
+from .models import ClassCreate
+from .versions import bump_versions
+from .seat_holds import count_active_holds
+from .seat_shards import get_cached_shard_count, cache_shard_count, get_enrollment_count, \
+    pick_open_shards, query_shards, build_shard_enroll_item, build_shard_drop_item, build_shard_claim_items
+from redis import Redis, RedisError
+from .subscriptions import get_class_subscribers
 import pika
 import json
+import time
+import random
+
+# Attributes returned by the available classes listing.
+# These are also the non-key attributes projected into `available-index`.
+AVAILABLE_CLASS_ATTRIBUTES = [
+    "id",
+    "department_code",
+    "course_no",
+    "section_no",
+    "year",
+    "semester",
+    "title",
+    "instructor_cwid",
+    "instructor_info",
+    "room_capacity",
+    "enrollment_count",
+]
+
+# Upper bound of index pages read to fill one page of available classes
+MAX_AVAILABLE_CLASS_QUERY_PAGES = 10
+
+# A promotion writes 2 items per student + 1 class item. DynamoDB allows 100 items per transaction.
+MAX_TRANSACTION_ITEMS = 100
+MAX_PROMOTIONS_PER_TRANSACTION = 49
+
+# A drop is tried again when the names in the enrollment differ, or the class was (un)sharded
+MAX_DROP_ATTEMPTS = 3
+
+# DynamoDB allows 100 keys per batch_get_item call
+MAX_BATCH_GET_KEYS = 100
+BATCH_RETRY_DELAY_SECONDS = 0.05
+
+# Number of waitlist entries read per ZRANGE when the whole waitlist is streamed
+WAITLIST_READ_CHUNK_SIZE = 500
+
+# Topic exchange of the enrollment events (see notification_routing_key)
+NOTIFICATION_EXCHANGE = "waitlist_events"
+
+# Redis cache of the auto enrollment config
+AUTO_ENROLL_CACHE_KEY = "config:auto_enrollment_enabled"
+CONFIG_CACHE_TTL_SECONDS = 300
+
+# Converts items in DynamoDB JSON (returned by the low-level client) to Python values
+_deserializer = TypeDeserializer()
 
 
 def is_auto_enroll_enabled(dynamodb: DynamoClient):
     """
     Check if automatic enrollment is enabled
 
+    The value is cached in Redis for CONFIG_CACHE_TTL_SECONDS, so that it is
+    not read from DynamoDB on every drop.
+
     Parameters:
         dynamodb (DynamoClient): Database connection.
 
     Returns:
         bool: True if automatic enrollment is enabled. Otherwise, False.
     """
+    redisdb = get_redisdb()
+
+    try:
+        cached = redisdb.get(AUTO_ENROLL_CACHE_KEY)
+    except RedisError:
+        cached = None
+
+    if cached is not None:
+        redisdb.close()
+        return cached == b"1"
+
     kwargs = {"Key": {"variable_name": "auto_enrollment_enabled"}}
     response = dynamodb.get_item(TableNames.CONFIGS, kwargs)
-    return response["Item"]["value"] == True
+    enabled = response["Item"]["value"] == True
+
+    try:
+        cache_auto_enroll_enabled(enabled, redisdb)
+    except RedisError:
+        pass
+    finally:
+        redisdb.close()
+
+    return enabled
+
+
+def cache_auto_enroll_enabled(enabled: bool, redisdb: Redis):
+    """
+    Stores the auto enrollment config in the Redis cache.
+    Call this whenever the config changes, so that all service instances see the new value.
+    """
+    redisdb.set(AUTO_ENROLL_CACHE_KEY, "1" if enabled else "0", ex=CONFIG_CACHE_TTL_SECONDS)
 
 
 def enroll_students_from_waitlist(class_id_list: list, dynamodb: DynamoClient):
@@ -56,7 +140,13 @@ def enroll_students_from_waitlist(class_id_list: list, dynamodb: DynamoClient):
             else:
                 enrollment_count = 0
 
-            num_open_seats = room_capacity - enrollment_count
+            # The seats of a sharded class are counted by its shards too
+            shards = query_shards(class_id, dynamodb) if response["Item"].get("shard_count") else []
+            enrollment_count += sum(int(e["enrollment_count"]) for e in shards)
+
+            # Seats held by students who are checking out are not open
+            num_held_seats = count_active_holds(class_id, redisdb)
+            num_open_seats = room_capacity - enrollment_count - num_held_seats
 
             # ---------------------------------------------------------------------
             # Move students from the waitlist to enrollments
@@ -68,65 +158,118 @@ def enroll_students_from_waitlist(class_id_list: list, dynamodb: DynamoClient):
                 members = redisdb.zrange(class_id, 0, num_open_seats - 1)
 
                 # ***********************************************
-                # Dynamo DB: Build a list of transact items
+                # Dynamo DB: Enroll the students in chunks that fit in one transaction
                 # ***********************************************
-                transact_items = []
-
-                for m in members:
-                    student_id, first_name, last_name = m.decode("utf-8").split("#")
-                    student_id = int(student_id)
-
-                    transact_items.append(
-                        {
-                            # ***********************************************
-                            # INSERT INTO enrollments table
-                            # ***********************************************
-                            "Put": {
-                                "TableName": TableNames.ENROLLMENTS,
-                                "Item": {
-                                    "class_id": class_id,
-                                    "student_cwid": student_id,
-                                    "student_info": {
-                                        "first_name": first_name,
-                                        "last_name": last_name,
+                enrolled_members = []
+
+                # Sharded classes update up to one item per shard instead of the class item
+                chunk_size = (MAX_TRANSACTION_ITEMS - len(shards)) // 2 if shards else MAX_PROMOTIONS_PER_TRANSACTION
+
+                for i in range(0, len(members), chunk_size):
+                    chunk = members[i:i + chunk_size]
+                    transact_items = []
+
+                    if shards:
+                        # ***********************************************
+                        # Take the seats from the shards that have room
+                        # ***********************************************
+                        shard_items, num_claimed = build_shard_claim_items(
+                            class_id, query_shards(class_id, dynamodb), len(chunk))
+                        chunk = chunk[:num_claimed]
+
+                        if not chunk:
+                            break
+
+                    for m in chunk:
+                        student_id, first_name, last_name = m.decode("utf-8").split("#")
+                        student_id = int(student_id)
+
+                        transact_items.append(
+                            {
+                                # ***********************************************
+                                # INSERT INTO enrollments table
+                                # ***********************************************
+                                "Put": {
+                                    "TableName": TableNames.ENROLLMENTS,
+                                    "Item": {
+                                        "class_id": class_id,
+                                        "student_cwid": student_id,
+                                        "student_info": {
+                                            "first_name": first_name,
+                                            "last_name": last_name,
+                                        },
                                     },
-                                },
-                                "ConditionExpression": "attribute_not_exists(class_id) AND attribute_not_exists(student_cwid)",
+                                    "ConditionExpression": "attribute_not_exists(class_id) AND attribute_not_exists(student_cwid)",
+                                }
                             }
-                        }
-                    )
+                        )
 
-                    transact_items.append(
-                        {
-                            # ***********************************************
-                            # UPDATE PERSONNEL `enrollments` & waitlists attributes
-                            # ***********************************************
-                            "Update": {
-                                "TableName": TableNames.PERSONNEL,
-                                "Key": {"cwid": student_id},
-                                "UpdateExpression": "ADD enrollments :value \
-                                                 DELETE waitlists :value",
-                                "ExpressionAttributeValues": {":value": {class_id}},
+                        transact_items.append(
+                            {
+                                # ***********************************************
+                                # UPDATE PERSONNEL `enrollments` & waitlists attributes
+                                # ***********************************************
+                                "Update": {
+                                    "TableName": TableNames.PERSONNEL,
+                                    "Key": {"cwid": student_id},
+                                    "UpdateExpression": "ADD enrollments :value \
+                                                     DELETE waitlists :value",
+                                    "ExpressionAttributeValues": {":value": {class_id}},
+                                }
                             }
-                        }
-                    )
+                        )
+
+                    enrollment_count += len(chunk)
+
+                    if shards:
+                        transact_items.extend(shard_items)
+                    else:
+                        transact_items.append(
+                            {
+                                # ***********************************************
+                                # UPDATE class available status & enrollment_count
+                                # ***********************************************
+                                "Update": {
+                                    "TableName": TableNames.CLASSES,
+                                    "Key": {"id": class_id},
+                                    "UpdateExpression": "SET available = :status, \
+                                                        enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size",
+                                    "ConditionExpression": "attribute_not_exists(shard_count) \
+                                                            AND (attribute_not_exists(enrollment_count) \
+                                                                 OR enrollment_count <= :max_count)",
+                                    "ExpressionAttributeValues": {
+                                        ":status": "true" if room_capacity > enrollment_count else "false",
+                                        ":step_size": len(chunk),
+                                        ":zero": 0,
+                                        ":max_count": room_capacity - num_held_seats - len(chunk),
+                                    },
+                                }
+                            }
+                        )
 
-                # ***********************************************
-                # Perform updating data in DynamoDB & Redis
-                # ***********************************************
-                if transact_items:
                     # Dynamo DB: Perform transact_write_items operation
                     dynamodb.transact_write_items(transact_items)
 
                     # Redis: Delete those students from the waitlist
                     #        because they enrolled successfully
-                    redisdb.zremrangebyrank(class_id, 0, num_open_seats - 1)
+                    redisdb.zrem(class_id, *chunk)
+
+                    enrolled_members.extend(chunk)
+
+                    bump_versions([class_id], [int(m.decode("utf-8").split("#")[0]) for m in chunk],
+                                  catalog=True, redisdb=redisdb)
 
+                members = enrolled_members
+
+                # ***********************************************
+                # Notify the students who enrolled successfully
+                # ***********************************************
+                if members:
                     # Update the counter
-                    num_students_enrolled += num_open_seats
+                    num_students_enrolled += len(members)
 
                     # ***********************************************
-                    # RabbitMQ: Send a message to the fanout exchange
+                    # RabbitMQ: Send a message to the topic exchange
                     # ***********************************************
                     # establish a connection
                     connection = pika.BlockingConnection(
@@ -136,49 +279,51 @@ def enroll_students_from_waitlist(class_id_list: list, dynamodb: DynamoClient):
                     # create a channel
                     channel = connection.channel()
 
-                    # declare the fanout exchange
-                    exchange_name = "waitlist_exchange"
+                    # declare the topic exchange
+                    exchange_name = NOTIFICATION_EXCHANGE
                     channel.exchange_declare(
-                        exchange=exchange_name, exchange_type="fanout"
+                        exchange=exchange_name, exchange_type="topic"
                     )
 
-                    for m in members:
-                        student_id, first_name, last_name = m.decode("utf-8").split("#")
-                        student_id = int(student_id)
+                    # retrieve the stored preferences of all the subscribers of the class at once
+                    subscribers = get_class_subscribers(class_id, redisdb)
 
-                        # constructing a unique identifier for the student
-                        member_name = f"{student_id}#{first_name}#{last_name}"
+                    for m in members:
+                        # the member is the unique identifier of the student
+                        member = m.decode("utf-8")
 
-                        # retrieve the stored preferences for the student and class
-                        preferences_json = redisdb.hget(member_name, class_id)
+                        # constructing the message. Every promoted student gets one
+                        # for the event stream, the routing key tells the dispatchers if it is for them
+                        message = {
+                            "event_type": "AutoEnrolledFromWaitlist",
+                            "class_id": class_id,
+                            "student_cwid": int(member.split("#")[0]),
+                        }
 
-                        if preferences_json:
-                            # convert the preference exist for the student and class from redis
-                            preferences = json.loads(preferences_json)
+                        preferences = subscribers.get(member, {})
 
-                            # constructing the message
-                            message = {
-                                "event_type": "AutoEnrolledFromWaitlist",
-                                "class_id": class_id,
-                            }
+                        # extract email
+                        email = preferences.get("email")
+                        if email:
+                            message["email"] = email
 
-                            # extract email
-                            email = preferences.get("email")
-                            if email:
-                                message["email"] = email
+                        # extract webhook_url
+                        webhook_url = preferences.get("webhook_url")
+                        if webhook_url:
+                            message["webhook_url"] = webhook_url
 
-                            # extract webhook_url
-                            webhook_url = preferences.get("webhook_url")
-                            if webhook_url:
-                                message["webhook_url"] = webhook_url
+                        # convert JSON message to a string
+                        message = json.dumps(message)
 
-                            # convert JSON message to a string
-                            message = json.dumps(message)
+                        # publish the message to the exchange
+                        channel.basic_publish(
+                            exchange=exchange_name,
+                            routing_key=notification_routing_key("AutoEnrolledFromWaitlist", email, webhook_url),
+                            body=message
+                        )
 
-                            # publish the message to the exchange
-                            channel.basic_publish(
-                                exchange=exchange_name, routing_key="", body=message
-                            )
+                    # the students left on the waitlist moved up
+                    publish_waitlist_positions(class_id, redisdb, channel)
 
                     # close the connection
                     connection.close()
@@ -191,6 +336,49 @@ def enroll_students_from_waitlist(class_id_list: list, dynamodb: DynamoClient):
     return num_students_enrolled
 
 
+def publish_waitlist_positions(class_id, redisdb: Redis, channel=None):
+    """
+    Publishes a `WaitlistPositionChanged` event with the position of every student left on the waitlist
+    of a class. Called whenever students leave the waitlist, since everyone behind them moved up.
+
+    Parameters:
+    - channel: An open RabbitMQ channel on which NOTIFICATION_EXCHANGE is declared.
+      When None, a connection is opened for the event.
+    """
+    remaining = redisdb.zrange(class_id, 0, -1)
+    if not remaining:
+        return
+
+    message = json.dumps({
+        "event_type": "WaitlistPositionChanged",
+        "class_id": class_id,
+        "positions": {m.decode("utf-8").split("#")[0]: position for position, m in enumerate(remaining, start=1)},
+    })
+
+    connection = None
+    if channel is None:
+        connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+        channel = connection.channel()
+        channel.exchange_declare(exchange=NOTIFICATION_EXCHANGE, exchange_type="topic")
+
+    try:
+        channel.basic_publish(exchange=NOTIFICATION_EXCHANGE,
+                              routing_key=notification_routing_key("WaitlistPositionChanged"),
+                              body=message)
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def notification_routing_key(event_type: str, email: str = None, webhook_url: str = None):
+    """
+    Returns:
+    - str: The routing key of an event on NOTIFICATION_EXCHANGE: `{event_type}.{email|none}.{webhook|none}`,
+      e.g. `AutoEnrolledFromWaitlist.email.none`. The dispatchers bind to the events they can deliver.
+    """
+    return f"{event_type}.{'email' if email else 'none'}.{'webhook' if webhook_url else 'none'}"
+
+
 def get_all_available_classes(dynamodb: DynamoClient):
     """
     Retrieves a list of available classes. The definition of an "available class" is one that has open seats.
@@ -218,6 +406,235 @@ def get_all_available_classes(dynamodb: DynamoClient):
         return responses["Items"]
 
 
+def query_available_classes(dynamodb: DynamoClient,
+                            filters: dict,
+                            exclude_ids: set,
+                            limit: int,
+                            exclusive_start_key: dict = None):
+    """
+    Retrieves one page of available classes, projected to AVAILABLE_CLASS_ATTRIBUTES.
+
+    Parameters:
+    - dynamodb (DynamoClient): Database connection.
+    - filters (dict): Attribute name -> value pairs to match (e.g. department_code, year).
+      None values are ignored.
+    - exclude_ids (set): Class IDs to leave out of the page (e.g. classes the student is in).
+    - limit (int): Maximum number of classes to return.
+    - exclusive_start_key (dict): Position to resume from, as returned by the previous page.
+
+    Returns:
+    - tuple: (classes, last_evaluated_key). last_evaluated_key is None when there are no more pages.
+
+    Note:
+    At most MAX_AVAILABLE_CLASS_QUERY_PAGES index pages are read per call, so a page can hold
+    fewer than `limit` classes while last_evaluated_key is still set.
+    """
+    names = {f"#{attr}": attr for attr in AVAILABLE_CLASS_ATTRIBUTES}
+    names["#available"] = "available"
+    values = {":available": "true"}
+
+    # Enrollments do not clear the `available` flag, so also check the seats here
+    conditions = ["(attribute_not_exists(#enrollment_count) OR #enrollment_count < #room_capacity)"]
+    for attr, value in filters.items():
+        if value is None:
+            continue
+        names[f"#{attr}"] = attr
+        values[f":{attr}"] = value
+        conditions.append(f"#{attr} = :{attr}")
+
+    kwargs = {
+        "IndexName": "available-index",
+        "KeyConditionExpression": "#available = :available",
+        "ProjectionExpression": ", ".join(f"#{attr}" for attr in AVAILABLE_CLASS_ATTRIBUTES),
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+    kwargs["FilterExpression"] = " AND ".join(conditions)
+
+    classes = []
+    last_evaluated_key = exclusive_start_key
+
+    for _ in range(MAX_AVAILABLE_CLASS_QUERY_PAGES):
+        # Never evaluate more items than are still needed, so that
+        # LastEvaluatedKey always points right after the last returned class
+        kwargs["Limit"] = limit - len(classes)
+
+        if last_evaluated_key:
+            kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+        response = dynamodb.query(TableNames.CLASSES, kwargs)
+        classes.extend(e for e in response["Items"] if e["id"] not in exclude_ids)
+        last_evaluated_key = response.get("LastEvaluatedKey")
+
+        if not last_evaluated_key or len(classes) >= limit:
+            break
+
+    return classes, last_evaluated_key
+
+
+def query_items(dynamodb: DynamoClient,
+                table_name: str,
+                kwargs: dict,
+                limit: int = None,
+                exclusive_start_key: dict = None):
+    """
+    Queries a table either one page at a time or as a lazy stream of all its pages.
+
+    Parameters:
+    - dynamodb (DynamoClient): Database connection.
+    - table_name (str): The table to query.
+    - kwargs (dict): The query parameters (KeyConditionExpression, ...).
+    - limit (int): If given, only one page of at most `limit` items is read.
+      Otherwise all the items are returned.
+    - exclusive_start_key (dict): Position to resume from, as returned by the previous page.
+
+    Returns:
+    - tuple: (items, last_evaluated_key).
+      With `limit`, items is a list and last_evaluated_key is None when there are no more pages.
+      Without `limit`, items is an iterator that reads the next page once the previous one has
+      been consumed, and last_evaluated_key is None. The first page is read before returning,
+      so that errors are raised here.
+    """
+    kwargs = dict(kwargs)
+
+    if exclusive_start_key:
+        kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+    if limit:
+        kwargs["Limit"] = limit
+        response = dynamodb.query(table_name, kwargs)
+        return response["Items"], response.get("LastEvaluatedKey")
+
+    first_page = dynamodb.query(table_name, kwargs)
+
+    def iter_pages():
+        response = first_page
+        while True:
+            yield from response["Items"]
+
+            if not response.get("LastEvaluatedKey"):
+                break
+
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            response = dynamodb.query(table_name, kwargs)
+
+    return iter_pages(), None
+
+
+def read_waitlist(class_id, redisdb: Redis, limit: int = None, offset: int = 0):
+    """
+    Reads a waitlist in order, either one page at a time or as a lazy stream.
+
+    Parameters:
+    - class_id (str): The ID of the class.
+    - redisdb (Redis): Redis connection.
+    - limit (int): If given, only one page of at most `limit` entries is read.
+      Otherwise the whole waitlist is read in chunks of WAITLIST_READ_CHUNK_SIZE.
+    - offset (int): Rank of the first entry to read.
+
+    Returns:
+    - tuple: (entries, next_offset).
+      With `limit`, entries is a list and next_offset is None when there are no more entries.
+      Without `limit`, entries is an iterator and next_offset is None.
+    """
+    def to_entry(member, score):
+        student_id, first_name, last_name = member.decode('utf-8').split("#")
+        return {
+            "student_cwid": student_id,
+            "first_name": first_name,
+            "last_name": last_name,
+            "created_at": score
+        }
+
+    if limit:
+        # Read one extra entry to know whether there is a next page
+        members = redisdb.zrange(class_id, offset, offset + limit, withscores=True)
+        next_offset = offset + limit if len(members) > limit else None
+        return [to_entry(member, score) for member, score in members[:limit]], next_offset
+
+    def iter_chunks():
+        start = offset
+        while True:
+            members = redisdb.zrange(class_id, start, start + WAITLIST_READ_CHUNK_SIZE - 1, withscores=True)
+            yield from (to_entry(member, score) for member, score in members)
+
+            if len(members) < WAITLIST_READ_CHUNK_SIZE:
+                break
+            start += WAITLIST_READ_CHUNK_SIZE
+
+    return iter_chunks(), None
+
+
+def batch_get_items(dynamodb: DynamoClient, table_name: str, keys: list, attributes: list = None):
+    """
+    Reads many items with as few `batch_get_item` calls as possible.
+
+    Parameters:
+    - dynamodb (DynamoClient): Database connection.
+    - table_name (str): The table to read from.
+    - keys (list): The primary keys of the items. Duplicates are not allowed.
+    - attributes (list): If given, only these attributes are read. Include the key attributes
+      to be able to match the items with the keys.
+
+    Returns:
+    - list: The items that exist, in no particular order.
+    """
+    items = []
+
+    for i in range(0, len(keys), MAX_BATCH_GET_KEYS):
+        request = {"Keys": keys[i:i + MAX_BATCH_GET_KEYS]}
+
+        if attributes:
+            request["ProjectionExpression"] = ", ".join(f"#{attr}" for attr in attributes)
+            request["ExpressionAttributeNames"] = {f"#{attr}": attr for attr in attributes}
+
+        request_items = {table_name: request}
+        delay = BATCH_RETRY_DELAY_SECONDS
+
+        while request_items:
+            response = dynamodb.batch_get_item({"RequestItems": request_items})
+            items.extend(response["Responses"].get(table_name, []))
+
+            # Retry the keys DynamoDB could not process (e.g. throttling)
+            request_items = response.get("UnprocessedKeys")
+            if request_items:
+                time.sleep(delay)
+                delay *= 2
+
+    return items
+
+
+def build_class_record(new_class: ClassCreate, course: dict, instructor: dict):
+    """
+    Builds the Classes item of a new class.
+
+    Parameters:
+    - new_class (ClassCreate): The class. Its `id` is generated here.
+    - course (dict): The Courses item of the class.
+    - instructor (dict): The Personnel item of the instructor.
+
+    Returns:
+    - dict: The item to insert.
+    """
+    # Generate class_id. Example format: 2024.Fall.CPSC.335.2
+    new_class.id = f"{new_class.year}.{new_class.semester}.{new_class.department_code}.{new_class.course_no}.{new_class.section_no}"
+
+    # Convert to dictionary
+    record = dict(new_class)
+
+    # Add class name
+    record["title"] = course["title"]
+
+    # Add instructor info
+    record["instructor_info"] = {
+        "first_name": instructor["first_name"],
+        "last_name": instructor["last_name"]
+    }
+
+    return record
+
+
 def add_to_waitlist(
     class_id, class_title: str, student_id, member_name: str, score: int
 ):
@@ -241,87 +658,393 @@ def add_to_waitlist(
 
         dynamodb.update_item(TableNames.PERSONNEL, update_kwargs)
 
+        bump_versions([class_id], [student_id], redisdb=redisdb)
+
     except Exception as e:
         raise Exception(f"AddToWaitlistFailed: {e}")
 
 
+def build_enroll_transact_items(class_id, student_id, first_name: str, last_name: str, available: str = None,
+                                max_enrollment_count: int = None, shard_no: int = None):
+    """
+    Builds the transaction that enrolls a student in a class.
+
+    The class update only succeeds while the class exists, is not sharded and has an open seat,
+    so concurrent enrollments cannot overbook the class.
+
+    Parameters:
+    - available (str): If given, the new `available` status of the class ("true" or "false").
+    - max_enrollment_count (int): If given, the seats are limited to this number instead of
+      `room_capacity` (e.g. room_capacity minus the seats held by other students).
+    - shard_no (int): If given, the seat is taken from this shard of a sharded class
+      instead of the class item (see seat_shards.py). `available` & `max_enrollment_count`
+      do not apply then.
+
+    Returns:
+    - list: TransactItems for `transact_write_items`. The items are, in order:
+      the enrollment, the class (or its shard), and the student.
+    """
+    class_update_expression = "SET enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size"
+    class_attribute_values = {":step_size": 1, ":zero": 0}
+    class_condition_expression = "attribute_exists(id) AND attribute_not_exists(shard_count) \
+                                  AND ((attribute_not_exists(enrollment_count) AND room_capacity > :zero) \
+                                       OR enrollment_count < room_capacity)"
+
+    if max_enrollment_count is not None:
+        class_attribute_values[":max_count"] = max_enrollment_count
+        class_condition_expression = "attribute_exists(id) AND attribute_not_exists(shard_count) \
+                                      AND ((attribute_not_exists(enrollment_count) AND :max_count > :zero) \
+                                           OR enrollment_count < :max_count)"
+
+    if available is not None:
+        class_update_expression += ", available = :status"
+        class_attribute_values[":status"] = available
+
+    if shard_no is not None:
+        class_item = build_shard_enroll_item(class_id, shard_no)
+    else:
+        class_item = {
+            # ***********************************************
+            # UPDATE class enrollment_count, if there is an open seat
+            # ***********************************************
+            "Update": {
+                "TableName": TableNames.CLASSES,
+                "Key": {
+                    "id": class_id
+                },
+                "UpdateExpression": class_update_expression,
+                "ConditionExpression": class_condition_expression,
+                "ExpressionAttributeValues": class_attribute_values,
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD"
+            }
+        }
+
+    return [
+        {
+            # ***********************************************
+            # INSERT new item INTO enrollments table
+            # ***********************************************
+            "Put": {
+                "TableName": TableNames.ENROLLMENTS,
+                "Item": {
+                    "class_id": class_id,
+                    "student_cwid": student_id,
+                    "student_info": {
+                        "first_name": first_name,
+                        "last_name": last_name
+                    }
+                },
+                "ConditionExpression": "attribute_not_exists(class_id) AND attribute_not_exists(student_cwid)"
+            }
+        },
+        class_item,
+        {
+            # ***********************************************
+            # UPDATE PERSONNEL `enrollments` attribute
+            # ***********************************************
+            "Update": {
+                "TableName": TableNames.PERSONNEL,
+                "Key": {
+                    "cwid": student_id
+                },
+                "UpdateExpression": "ADD enrollments :value",
+                "ExpressionAttributeValues": {
+                    ":value": {class_id}
+                },
+            }
+        }
+    ]
+
+
+def enroll_student(class_id, student_id, first_name: str, last_name: str, dynamodb: DynamoClient,
+                   max_enrollment_count: int = None):
+    """
+    Enrolls a student in a class with a single DynamoDB call, without reading the class first.
+
+    The transaction carries the seat check. When it is canceled, the cancellation reasons
+    (with the old class item from `ReturnValuesOnConditionCheckFailure`) tell apart
+    "already enrolled", "class not found", "class full" and "class sharded".
+    Sharded classes are enrolled in one of their shards (see `_enroll_student_in_shards`).
+
+    Parameters:
+    - dynamodb (DynamoClient): Database connection.
+    - max_enrollment_count (int): If given, the seats are limited to this number instead of
+      `room_capacity` (see `build_enroll_transact_items`).
+
+    Returns:
+    - dict: None if the student was enrolled. Otherwise, the class is full and
+      its current item is returned, so the caller can place the student on the waitlist.
+
+    Raises:
+    - HTTPException (404): If the class does not exist.
+    - HTTPException (409): If the student already enrolled, or the transaction conflicts.
+    """
+    if get_cached_shard_count(class_id):
+        return _enroll_student_in_shards(class_id, student_id, first_name, last_name, dynamodb,
+                                         max_enrollment_count)
+
+    try:
+        dynamodb.transact_write_items(
+            build_enroll_transact_items(class_id, student_id, first_name, last_name,
+                                        max_enrollment_count=max_enrollment_count))
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "TransactionCanceledException":
+            raise
+
+        enrollment_reason, class_reason = e.response["CancellationReasons"][:2]
+
+        if enrollment_reason["Code"] == "ConditionalCheckFailed":
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Already enrolled")
+
+        if class_reason["Code"] == "ConditionalCheckFailed":
+            if "Item" not in class_reason:
+                raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Class Not Found")
+
+            class_item = {k: _deserializer.deserialize(v) for k, v in class_reason["Item"].items()}
+
+            if not class_item.get("shard_count"):
+                return class_item
+
+            cache_shard_count(class_id, class_item["shard_count"])
+            return _enroll_student_in_shards(class_id, student_id, first_name, last_name, dynamodb,
+                                             max_enrollment_count)
+
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Transaction Canceled")
+
+    return None
+
+
+def _enroll_student_in_shards(class_id, student_id, first_name: str, last_name: str, dynamodb: DynamoClient,
+                              max_enrollment_count: int = None):
+    """
+    Enrolls a student in a sharded class, with a seat from one of the shards that have room.
+    Same contract as `enroll_student`. The class item returned when the class is full
+    carries the enrollment_count of the class and its shards.
+    """
+    if max_enrollment_count is not None:
+        # Held seats are checked against the current count before taking a seat from a shard
+        kwargs = {"Key": {"id": class_id}, "ConsistentRead": True}
+        class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+        if class_item:
+            enrollment_count = get_enrollment_count(class_id, class_item, dynamodb)
+
+            if enrollment_count >= max_enrollment_count:
+                class_item["enrollment_count"] = enrollment_count
+                return class_item
+
+    for shard_no in pick_open_shards(class_id, dynamodb):
+        try:
+            dynamodb.transact_write_items(
+                build_enroll_transact_items(class_id, student_id, first_name, last_name, shard_no=shard_no))
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+
+            enrollment_reason, shard_reason = e.response["CancellationReasons"][:2]
+
+            if enrollment_reason["Code"] == "ConditionalCheckFailed":
+                raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Already enrolled")
+
+            # Another enrollment took the last seat of the shard. Try the next one.
+            if shard_reason["Code"] == "ConditionalCheckFailed":
+                continue
+
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Transaction Canceled")
+        else:
+            return None
+
+    # ---------------------------------------------------------------------
+    # No shard has room: the class is full, or it is no longer sharded
+    # ---------------------------------------------------------------------
+    kwargs = {"Key": {"id": class_id}, "ConsistentRead": True}
+    class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+    if class_item is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Class Not Found")
+
+    cache_shard_count(class_id, class_item.get("shard_count"))
+
+    if not class_item.get("shard_count"):
+        return enroll_student(class_id, student_id, first_name, last_name, dynamodb, max_enrollment_count)
+
+    class_item["enrollment_count"] = get_enrollment_count(class_id, class_item, dynamodb)
+    return class_item
+
+
+def mark_class_unavailable(class_id, dynamodb: DynamoClient):
+    """
+    Sets the `available` status of a class to "false" if the class has no open seats.
+
+    Enrollments that take the last seat do not read the class, so they cannot clear
+    the status themselves. It is cleared here once an enrollment finds the class full.
+    """
+    kwargs = {
+        "Key": {"id": class_id},
+        "ConditionExpression": "available = :available AND enrollment_count >= room_capacity",
+        "UpdateExpression": "SET available = :status",
+        "ExpressionAttributeValues": {":available": "true", ":status": "false"},
+    }
+
+    try:
+        dynamodb.update_item(TableNames.CLASSES, kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    else:
+        bump_versions(catalog=True)
+
+
+def build_drop_transact_items(class_id, student_id, student_info: dict, administrative: bool,
+                              shard_no: int = None):
+    """
+    Builds the transaction that drops a student from a class.
+
+    The enrollment is only deleted if it stores the given `student_info`, so the droplist
+    record always carries the names of the deleted enrollment. If the check fails,
+    the enrollment (if any) is returned in the cancellation reasons.
+
+    Parameters:
+    - shard_no (int): If given, the seat is given back to this shard of a sharded class
+      instead of the class item. The class item update fails while the class is sharded.
+
+    Returns:
+    - list: TransactItems for `transact_write_items`. The first item is the enrollment,
+      the third one the class (or its shard).
+    """
+    if shard_no is not None:
+        class_item = build_shard_drop_item(class_id, shard_no)
+    else:
+        class_item = {
+            # ***********************************************
+            # UPDATE class available status & enrollment_count
+            # ***********************************************
+            "Update": {
+                "TableName": TableNames.CLASSES,
+                "Key": {"id": class_id},
+                "UpdateExpression": "SET available = :status, \
+                                        enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size",
+                "ConditionExpression": "attribute_not_exists(shard_count)",
+                "ExpressionAttributeValues": {
+                    ":status": "true",
+                    ":step_size": -1,
+                    ":zero": 0,
+                },
+            }
+        }
+
+    return [
+        {
+            # ***********************************************
+            # DELETE FROM enrollment table
+            # ***********************************************
+            "Delete": {
+                "TableName": TableNames.ENROLLMENTS,
+                "Key": {"class_id": class_id, "student_cwid": student_id},
+                "ConditionExpression": "student_info = :student_info",
+                "ExpressionAttributeValues": {":student_info": student_info},
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+            }
+        },
+        {
+            # ***********************************************
+            # INSERT INTO droplist table
+            # ***********************************************
+            "Put": {
+                "TableName": TableNames.DROPLIST,
+                "Item": {
+                    "class_id": class_id,
+                    "student_cwid": student_id,
+                    "student_info": student_info,
+                    "administrative": administrative,
+                },
+            }
+        },
+        class_item,
+        {
+            # ***********************************************
+            # UPDATE PERSONNEL `enrollments` attribute
+            # ***********************************************
+            "Update": {
+                "TableName": TableNames.PERSONNEL,
+                "Key": {"cwid": student_id},
+                "UpdateExpression": "DELETE enrollments :value",
+                "ExpressionAttributeValues": {":value": {class_id}},
+            }
+        },
+    ]
+
+
+def _transact_drop(class_id, student_id, student_info: dict, administrative: bool, dynamodb: DynamoClient):
+    """
+    Runs the drop transaction. It is tried again when the enrollment stores other names,
+    or when the class was sharded or unsharded since this instance last saw it.
+    """
+    for attempt in range(MAX_DROP_ATTEMPTS):
+        shard_count = get_cached_shard_count(class_id)
+        shard_no = random.randrange(shard_count) if shard_count else None
+
+        try:
+            dynamodb.transact_write_items(
+                build_drop_transact_items(class_id, student_id, student_info, administrative, shard_no))
+            return
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException" or attempt == MAX_DROP_ATTEMPTS - 1:
+                raise
+
+            enrollment_reason, _, class_reason = e.response["CancellationReasons"][:3]
+
+            if enrollment_reason["Code"] == "ConditionalCheckFailed":
+                if "Item" not in enrollment_reason:
+                    raise
+
+                # The enrollment stores other names. Copy them from the enrollment & try again.
+                student_info = _deserializer.deserialize(enrollment_reason["Item"]["student_info"])
+            elif class_reason["Code"] == "ConditionalCheckFailed":
+                # The class was sharded or unsharded. Look up its mode & try again.
+                kwargs = {"Key": {"id": class_id}, "ProjectionExpression": "shard_count", "ConsistentRead": True}
+                class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item", {})
+                cache_shard_count(class_id, class_item.get("shard_count"))
+            else:
+                raise
+
+
 def drop_from_enrollment(
-    class_id, student_id, administrative: bool, dynamodb: DynamoClient
+    class_id, student_id, administrative: bool, dynamodb: DynamoClient, student_info: dict = None
 ):
+    """
+    Drops a student from a class, and triggers auto enrollment from the waitlist.
+
+    Parameters:
+    - student_info (dict): The student's names as stored in the enrollment, if known
+      (e.g. from the request headers). Then an ordinary drop is a single transaction.
+      Otherwise, they are read from the enrollment first.
+
+    Raises:
+    - HTTPException (404): If the student is not enrolled in the class.
+    - HTTPException (409): If a conflict occurs.
+    """
     try:
-        # ***********************************************
-        # Get student info
-        # ***********************************************
-        kwargs = {"Key": {"cwid": student_id}}
-        response = dynamodb.get_item(TableNames.PERSONNEL, kwargs)
+        if student_info is None:
+            # ***********************************************
+            # Get student info from the enrollment
+            # ***********************************************
+            kwargs = {
+                "Key": {"class_id": class_id, "student_cwid": student_id},
+                "ProjectionExpression": "student_info",
+            }
+            response = dynamodb.get_item(TableNames.ENROLLMENTS, kwargs)
 
-        if "Item" not in response:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Student Not Found"
-            )
+            if "Item" not in response:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Enrollment Not Found"
+                )
 
-        first_name = response["Item"]["first_name"]
-        last_name = response["Item"]["last_name"]
+            student_info = response["Item"]["student_info"]
 
-        # Build transact items
-        TransactItems = [
-            {
-                # ***********************************************
-                # DELETE FROM enrollment table
-                # ***********************************************
-                "Delete": {
-                    "TableName": TableNames.ENROLLMENTS,
-                    "Key": {"class_id": class_id, "student_cwid": student_id},
-                    "ConditionExpression": "attribute_exists(class_id) AND attribute_exists(student_cwid)",
-                }
-            },
-            {
-                # ***********************************************
-                # INSERT INTO droplist table
-                # ***********************************************
-                "Put": {
-                    "TableName": TableNames.DROPLIST,
-                    "Item": {
-                        "class_id": class_id,
-                        "student_cwid": student_id,
-                        "student_info": {
-                            "first_name": first_name,
-                            "last_name": last_name,
-                        },
-                        "administrative": administrative,
-                    },
-                }
-            },
-            {
-                # ***********************************************
-                # UPDATE class available status & enrollment_count
-                # ***********************************************
-                "Update": {
-                    "TableName": TableNames.CLASSES,
-                    "Key": {"id": class_id},
-                    "UpdateExpression": "SET available = :status, \
-                                            enrollment_count = if_not_exists(enrollment_count, :zero) + :step_size",
-                    "ExpressionAttributeValues": {
-                        ":status": "true",
-                        ":step_size": -1,
-                        ":zero": 0,
-                    },
-                }
-            },
-            {
-                # ***********************************************
-                # UPDATE PERSONNEL `enrollments` attribute
-                # ***********************************************
-                "Update": {
-                    "TableName": TableNames.PERSONNEL,
-                    "Key": {"cwid": student_id},
-                    "UpdateExpression": "DELETE enrollments :value",
-                    "ExpressionAttributeValues": {":value": {class_id}},
-                }
-            },
-        ]
-
-        dynamodb.transact_write_items(TransactItems)
+        _transact_drop(class_id, student_id, student_info, administrative, dynamodb)
+
+        bump_versions([class_id], [student_id], catalog=True)
 
         # ---------------------------------------------------------------------
         # Trigger auto enrollment
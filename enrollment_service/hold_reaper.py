@@ -0,0 +1,47 @@
+"""
+Reclaims expired seat holds and gives the seats to the waitlists.
+
+Usage:
+```
+python3 -m enrollment_service.hold_reaper
+```
+"""
+import time
+from botocore.exceptions import ClientError
+from redis import Redis, RedisError
+from .dynamoclient import DynamoClient
+from .db_connection import get_dynamodb, get_redisdb
+from .enrollment_helper import is_auto_enroll_enabled, enroll_students_from_waitlist
+from .seat_holds import reclaim_expired_holds
+
+# How often the reaper looks for expired holds
+REAPER_INTERVAL_SECONDS = 1
+
+
+def run_reaper(dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Reclaims expired holds every REAPER_INTERVAL_SECONDS, and gives the seats
+    to the waitlists if auto enrollment is enabled.
+    """
+    while True:
+        try:
+            class_ids = reclaim_expired_holds(redisdb)
+
+            if class_ids:
+                print(f"Reclaimed expired holds of {len(class_ids)} class(es)")
+
+                if is_auto_enroll_enabled(dynamodb):
+                    enroll_students_from_waitlist(class_ids, dynamodb)
+        except RedisError as e:
+            print(f"RedisError: {e}")
+        except ClientError as e:
+            print(f"ClientError: {e}")
+        except Exception as e:
+            # e.g. a missing config item. The next round tries again: the reaper must keep running.
+            print(f"An unexpected error occurred: {e!r}")
+
+        time.sleep(REAPER_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    run_reaper(get_dynamodb(), get_redisdb())
@@ -0,0 +1,222 @@
+import json
+import asyncio
+import hashlib
+from http import HTTPStatus
+from redis import RedisError
+from .db_connection import get_async_redisdb
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+
+# How long a stored response can be replayed
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+# How long the lock of a key outlives its request if the service dies. While the request runs
+# (e.g. a bulk enrollment or an import, that can take minutes), the lock is refreshed.
+IDEMPOTENCY_LOCK_SECONDS = 30
+IDEMPOTENCY_LOCK_REFRESH_SECONDS = 10
+
+# How long a concurrent duplicate waits for the original request to finish
+IDEMPOTENCY_WAIT_SECONDS = 5
+IDEMPOTENCY_POLL_INTERVAL_SECONDS = 0.05
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class IdempotencyMiddleware:
+    """
+    Replays the stored response of a mutating request that carries an `Idempotency-Key` header.
+
+    The first request with a given key is processed normally and its response is stored in Redis
+    for IDEMPOTENCY_TTL_SECONDS. Retries with the same key get the stored response back without
+    running the endpoint again. While the first request is still in progress, duplicates wait for
+    its result for up to IDEMPOTENCY_WAIT_SECONDS, then get 409 with `Retry-After`.
+
+    Keys are scoped by the caller's CWID. Reusing a key for a different request gets 422.
+    Server errors (5xx) are not stored, so they can be retried. If Redis is unavailable,
+    requests are processed without idempotency.
+
+    Streamed responses (e.g. the NDJSON of `POST /enrollment/bulk/`) are passed through without
+    being buffered, and their body is not stored: retries get 409 instead of running the
+    mutation again.
+
+    Example:
+    ```python
+    app.add_middleware(IdempotencyMiddleware)
+    ```
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.redisdb = get_async_redisdb()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        # ---------------------------------------------------------------------
+        # Buffer the request body, so that it can be fingerprinted & replayed
+        # ---------------------------------------------------------------------
+        body, receive = await buffer_request_body(receive)
+
+        fingerprint = hashlib.sha256(b"\n".join([
+            scope["method"].encode("ascii"),
+            scope["path"].encode("utf-8"),
+            scope.get("query_string", b""),
+            body
+        ])).hexdigest()
+
+        cwid = headers.get(b"x-cwid", b"").decode("latin-1")
+        key = f"idempotency:{cwid}:{idempotency_key.decode('latin-1')}"
+        lock_key = f"{key}:lock"
+
+        try:
+            # ***********************************************
+            # Replay the stored response, if any
+            # ***********************************************
+            stored = await self.redisdb.get(key)
+
+            if stored is None:
+                # ***********************************************
+                # Deduplicate concurrent requests
+                # ***********************************************
+                is_locked = await self.redisdb.set(lock_key, fingerprint, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS)
+
+                if is_locked:
+                    # The original request may have finished right before the lock was taken
+                    stored = await self.redisdb.get(key)
+                    if stored is not None:
+                        await self.redisdb.delete(lock_key)
+                else:
+                    stored = await self._wait_for_stored_response(key)
+
+                    if stored is None:
+                        await send_error(send, HTTPStatus.CONFLICT,
+                                          "A request with the same Idempotency-Key is in progress",
+                                          retry_after=IDEMPOTENCY_WAIT_SECONDS)
+                        return
+        except RedisError:
+            await self.app(scope, receive, send)
+            return
+
+        if stored is not None:
+            await _replay(send, json.loads(stored), fingerprint)
+            return
+
+        # ---------------------------------------------------------------------
+        # Process the request & store the response
+        # ---------------------------------------------------------------------
+        response = {"fingerprint": fingerprint, "status": None, "headers": [], "body": [], "streamed": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [[k.decode("latin-1"), v.decode("latin-1")]
+                                       for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                # A response sent in several parts is streamed: do not hold it in memory
+                if message.get("more_body", False):
+                    response["streamed"] = True
+                    response["body"] = []
+                if not response["streamed"]:
+                    response["body"].append(message.get("body", b""))
+            await send(message)
+
+        refresher = asyncio.create_task(self._refresh_lock(lock_key))
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            refresher.cancel()
+
+            try:
+                if response["status"] is not None and response["status"] < HTTPStatus.INTERNAL_SERVER_ERROR:
+                    response["body"] = b"".join(response["body"]).decode("latin-1")
+                    await self.redisdb.set(key, json.dumps(response), ex=IDEMPOTENCY_TTL_SECONDS)
+                await self.redisdb.delete(lock_key)
+            except RedisError:
+                pass
+
+    async def _refresh_lock(self, lock_key: str):
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LOCK_REFRESH_SECONDS)
+            try:
+                await self.redisdb.expire(lock_key, IDEMPOTENCY_LOCK_SECONDS)
+            except RedisError:
+                pass
+
+    async def _wait_for_stored_response(self, key: str):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+
+        while loop.time() < deadline:
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL_SECONDS)
+            stored = await self.redisdb.get(key)
+            if stored is not None:
+                return stored
+
+        return None
+
+
+async def buffer_request_body(receive):
+    chunks = []
+    more_body = True
+
+    while more_body:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+
+    body = b"".join(chunks)
+    is_replayed = False
+
+    async def replay_receive():
+        nonlocal is_replayed
+        if not is_replayed:
+            is_replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay_receive
+
+
+async def _replay(send, stored: dict, fingerprint: str):
+    if stored["fingerprint"] != fingerprint:
+        await send_error(send, HTTPStatus.UNPROCESSABLE_ENTITY,
+                          "Idempotency-Key was already used for a different request")
+        return
+
+    if stored.get("streamed"):
+        await send_error(send, HTTPStatus.CONFLICT,
+                          "A request with the same Idempotency-Key was already processed. "
+                          "Its streamed response is not stored.")
+        return
+
+    headers = [[k.encode("latin-1"), v.encode("latin-1")] for k, v in stored["headers"]]
+    headers.append([REPLAYED_HEADER, b"true"])
+
+    await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": stored["body"].encode("latin-1")})
+
+
+async def send_error(send, status_code: int, detail: str, retry_after: int = None):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    headers = [
+        [b"content-type", b"application/json"],
+        [b"content-length", str(len(body)).encode("ascii")]
+    ]
+    if retry_after is not None:
+        headers.append([b"retry-after", str(retry_after).encode("ascii")])
+
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -1,106 +1,166 @@
 # from typing import Annotated
 import sqlite3
-from fastapi import Depends, HTTPException, Header, status, APIRouter
+from typing import Optional
+from fastapi import Depends, HTTPException, Header, Query, status, APIRouter
 from redis import Redis, RedisError
 from .dynamoclient import DynamoClient
 from .db_connection import get_db, get_redisdb, get_dynamodb, TableNames
-from .enrollment_helper import drop_from_enrollment, enroll_students_from_waitlist, is_auto_enroll_enabled
+from .enrollment_helper import drop_from_enrollment, enroll_students_from_waitlist, is_auto_enroll_enabled, \
+    query_items, read_waitlist
+from .pagination import ResponseFormat, list_response, decode_cursor
+from .bulk_enrollment import bulk_drop
+from .models import BatchDrop
+from .versions import compute_etag, is_not_modified, not_modified_response, CLASS_VERSION_KEY
 
 instructor_router = APIRouter()
 
+# Maximum page size of the class lists. Without `limit`, the whole list is returned.
+MAX_PAGE_SIZE = 1000
+
+# Maximum number of students in one batch drop
+MAX_BATCH_DROP_SIZE = 1000
+
 
 @instructor_router.get("/classes/{class_id}/students")
 def get_current_enrollment(class_id: str,
+                           format: ResponseFormat = ResponseFormat.JSON,
+                           if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+                           limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                           cursor: Optional[str] = None,
                            dynamodb: DynamoClient = Depends(get_dynamodb)):
     """
     Retreive current enrollment for the classes.
 
     Parameters:
     - class_id (int): The ID of the class.
+    - format (ResponseFormat, in the query string): `json` (default), `ndjson` or `json-stream`.
+      The streaming formats send the students while they are read.
+    - limit (int, in the query string): Maximum number of students in the page. Default: all of them.
+    - cursor (str, in the query string): The `X-Next-Cursor` header of the previous page.
 
     Returns:
-    - dict: A dictionary containing the details of the classes
-    """
-    try:
-        kwargs = {
-            "KeyConditionExpression": "class_id = :value",
-            "ExpressionAttributeValues": {":value": class_id}
-        }
-        responses = dynamodb.query(TableNames.ENROLLMENTS, kwargs)
-        response_json = responses["Items"]
+    - list: The enrolled students. If there are more students, the cursor of the next page
+      is in the `X-Next-Cursor` response header.
 
-    except HTTPException as e:
-        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=e)
-    else:
-        return response_json
+    - 304 Not Modified: If `If-None-Match` matches the ETag of the class's version.
+
+    Raises:
+    - HTTPException (400): If the cursor is invalid.
+    """
+    return _query_class_list(TableNames.ENROLLMENTS, class_id, format, limit, cursor, if_none_match, dynamodb)
 
 
 @instructor_router.get("/classes/{class_id}/waitlist/")
 def get_waitlist(class_id: str,
+                 format: ResponseFormat = ResponseFormat.JSON,
+                 if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None,
                  redisdb: Redis = Depends(get_redisdb)):
     """
     Retreive current waiting list for the class.
 
     Parameters:
     - class_id (int): The ID of the class.
+    - format (ResponseFormat, in the query string): `json` (default), `ndjson` or `json-stream`.
+    - limit (int, in the query string): Maximum number of students in the page. Default: all of them.
+    - cursor (str, in the query string): The `X-Next-Cursor` header of the previous page.
 
     Returns:
-    - dict: A dictionary containing the details of the classes
+    - list: The students on the waitlist, in order. If there are more students, the cursor
+      of the next page is in the `X-Next-Cursor` response header.
+
+    - 304 Not Modified: If `If-None-Match` matches the ETag of the class's version.
+
+    Raises:
+    - HTTPException (400): If the cursor is invalid.
     """
-    response_json = []
     try:
-        sorted_set_elements = redisdb.zrange(class_id, 0, -1, withscores=True)
-
-        for member, score in sorted_set_elements:
-            student_id, first_name, last_name = member.decode('utf-8').split("#")
-            item = {
-                "student_cwid": student_id,
-                "first_name": first_name,
-                "last_name": last_name,
-                "created_at": score 
-            }
-            response_json.append(item)
-        
+        offset = decode_cursor(cursor).get("offset", 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        etag = compute_etag([CLASS_VERSION_KEY.format(class_id)], "waitlist", format.value, limit, cursor,
+                            redisdb=redisdb)
+
+        if is_not_modified(if_none_match, etag):
+            redisdb.close()
+            return not_modified_response(etag)
+
+        entries, next_offset = read_waitlist(class_id, redisdb, limit, offset)
+        next_position = {"offset": next_offset} if next_offset is not None else None
+
+        return list_response(entries, format, next_position, on_close=redisdb.close, etag=etag)
+
+    except HTTPException as e:
+        redisdb.close()
+        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
     except RedisError as e:
+        redisdb.close()
         print(f"RedisError: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    else:
-        return response_json
-    finally:
-        redisdb.close()  # Close the Redis connection
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
 
 
 @instructor_router.get("/classes/{class_id}/droplist/")
 def get_droplist(class_id: str,
+                 format: ResponseFormat = ResponseFormat.JSON,
+                 if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None,
                  dynamodb: DynamoClient = Depends(get_dynamodb)):
     """
     Retreive students who have dropped the class.
 
     Parameters:
     - class_id (int): The ID of the class.
-    
+    - format (ResponseFormat, in the query string): `json` (default), `ndjson` or `json-stream`.
+    - limit (int, in the query string): Maximum number of students in the page. Default: all of them.
+    - cursor (str, in the query string): The `X-Next-Cursor` header of the previous page.
+
     Returns:
-    - dict: A dictionary containing the details of the classes
+    - list: The students who dropped the class. If there are more students, the cursor
+      of the next page is in the `X-Next-Cursor` response header.
+
+    - 304 Not Modified: If `If-None-Match` matches the ETag of the class's version.
+
+    Raises:
+    - HTTPException (400): If the cursor is invalid.
     """
+    return _query_class_list(TableNames.DROPLIST, class_id, format, limit, cursor, if_none_match, dynamodb)
+
+
+def _query_class_list(table_name: str,
+                      class_id: str,
+                      fmt: ResponseFormat,
+                      limit: Optional[int],
+                      cursor: Optional[str],
+                      if_none_match: Optional[str],
+                      dynamodb: DynamoClient):
     try:
+        exclusive_start_key = decode_cursor(cursor) if cursor else None
+        if exclusive_start_key and exclusive_start_key.get("class_id") != class_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+        # The version is read before the list, so the ETag is never newer than the list
+        etag = compute_etag([CLASS_VERSION_KEY.format(class_id)], table_name, fmt.value, limit, cursor)
+
+        if is_not_modified(if_none_match, etag):
+            return not_modified_response(etag)
+
         kwargs = {
             "KeyConditionExpression": "class_id = :value",
             "ExpressionAttributeValues": {":value": class_id}
         }
-        responses = dynamodb.query(TableNames.DROPLIST, kwargs)
-        response_json = responses["Items"]
+        items, last_evaluated_key = query_items(dynamodb, table_name, kwargs, limit, exclusive_start_key)
+
+        return list_response(items, fmt, last_evaluated_key, etag=etag)
 
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=str(e.detail))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=e)
-    else:
-        return response_json
+                            detail=str(e))
 
 
 @instructor_router.delete("/enrollment/{class_id}/{student_id}/administratively/", status_code=status.HTTP_200_OK)
@@ -123,3 +183,36 @@ def drop_class(class_id: str,
     """
     administrative = True
     drop_from_enrollment(class_id, student_id, administrative, dynamodb)
+
+
+@instructor_router.post("/enrollment/{class_id}/administratively/", status_code=status.HTTP_200_OK)
+def drop_students(class_id: str,
+                  request: BatchDrop,
+                  dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Handles a POST request to administratively drop many students from a specific class at once.
+
+    The enrollments are read in one batched read and deleted in chunked transactions.
+    The waitlist promotion runs once, after all the drops.
+
+    Parameters:
+    - class_id (str): The ID of the class.
+    - `request` (BatchDrop): The JSON object with the following property:
+        - `cwids` (list): The IDs of the students to drop, up to MAX_BATCH_DROP_SIZE.
+
+    Returns:
+    - list: One result per student:
+      {"class_id": ..., "cwid": ..., "status": "dropped" | "failed", "detail": ...}
+
+    Raises:
+    - HTTPException (400): If there are too many students.
+    """
+    if len(request.cwids) > MAX_BATCH_DROP_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {MAX_BATCH_DROP_SIZE} students per request")
+
+    try:
+        return bulk_drop(class_id, request.cwids, dynamodb)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=str(e))
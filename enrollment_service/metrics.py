@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import deque
+
+# Rates are computed over the last RATE_WINDOW_SECONDS
+RATE_WINDOW_SECONDS = 60
+
+
+class Metrics:
+    """
+    In-process counters & gauges of a service instance.
+
+    Example:
+    ```python
+    metrics.increment("personnel_sync.redis_hits")
+    metrics.snapshot()
+    ```
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._counters = {}
+        self._gauges = {}
+        # Counter name -> deque of [second, count]
+        self._buckets = {}
+
+    def increment(self, name: str, value: int = 1):
+        now = int(time.monotonic())
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+            buckets = self._buckets.setdefault(name, deque())
+            if buckets and buckets[-1][0] == now:
+                buckets[-1][1] += value
+            else:
+                buckets.append([now, value])
+            self._trim(buckets, now)
+
+    def set_gauge(self, name: str, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        """
+        Returns:
+        - dict: The total and the per-second rate of every counter, and the value of every gauge.
+        """
+        now = time.monotonic()
+        window = min(RATE_WINDOW_SECONDS, max(now - self._started_at, 1))
+
+        with self._lock:
+            counters = {}
+            for name, total in self._counters.items():
+                buckets = self._buckets[name]
+                self._trim(buckets, int(now))
+                counters[name] = {
+                    "total": total,
+                    "per_second": round(sum(count for _, count in buckets) / window, 3)
+                }
+
+            return {
+                "uptime_seconds": round(now - self._started_at, 3),
+                "counters": counters,
+                "gauges": dict(self._gauges)
+            }
+
+    @staticmethod
+    def _trim(buckets: deque, now: int):
+        while buckets and buckets[0][0] <= now - RATE_WINDOW_SECONDS:
+            buckets.popleft()
+
+
+metrics = Metrics()
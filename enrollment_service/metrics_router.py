@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from .metrics import metrics
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics/")
+def get_metrics():
+    """
+    Retreive the metrics of this service instance.
+
+    Returns:
+    - dict: Counters (total & per-second rate over the last minute) and gauges.
+    """
+    return metrics.snapshot()
@@ -37,8 +37,22 @@ class ClassCreate(BaseModel):
 
 class ClassPatch(BaseModel):
     instructor_cwid: Optional[int] = None
+
+class ShardConfig(BaseModel):
+    shard_count: int
     
 class Course(BaseModel):
     department_code: str
     course_no: int
-    title: str
\ No newline at end of file
+    title: str
+
+
+class Placement(BaseModel):
+    class_id: str
+    cwid: int
+
+class BulkEnrollment(BaseModel):
+    placements: list[Placement]
+
+class BatchDrop(BaseModel):
+    cwids: list[int]
@@ -0,0 +1,106 @@
+import json
+import base64
+import binascii
+from enum import Enum
+from decimal import Decimal
+from http import HTTPStatus
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from .serialization import FastJSONResponse, dumps
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class ResponseFormat(str, Enum):
+    """
+    How a list is sent to the client.
+
+    - json: One JSON array, built before it is sent.
+    - ndjson: One JSON object per line, streamed as the items are read.
+    - json-stream: One JSON array, streamed as the items are read.
+    """
+    JSON = "json"
+    NDJSON = "ndjson"
+    JSON_STREAM = "json-stream"
+
+
+def encode_cursor(position: dict) -> str:
+    """
+    Encodes a pagination position (e.g. DynamoDB `LastEvaluatedKey`) into an opaque cursor.
+
+    Parameters:
+    - position (dict): The position to encode. Decimal values are converted to int.
+
+    Returns:
+    - str: A URL-safe cursor string.
+    """
+    data = {k: int(v) if isinstance(v, Decimal) else v for k, v in position.items()}
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    Raises:
+    - HTTPException (400): If the cursor is malformed.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor")
+
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor")
+
+    return data
+
+
+def list_response(items, fmt: ResponseFormat, next_position: dict = None, on_close=None, etag: str = None):
+    """
+    Sends a list of items in the requested format.
+
+    Parameters:
+    - items (iterable): The items. Streaming formats consume it lazily, so it can be a generator
+      that reads the next page from the database when the previous one has been sent.
+    - fmt (ResponseFormat): The response format.
+    - next_position (dict): Position of the next page, sent as the `X-Next-Cursor` header.
+    - on_close (callable): Called once the items have been consumed (e.g. to close a connection).
+    - etag (str): Sent as the `ETag` header.
+
+    Returns:
+    - Response
+    """
+    headers = {}
+    if next_position:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(next_position)
+    if etag:
+        headers["ETag"] = etag
+
+    if fmt == ResponseFormat.JSON:
+        try:
+            content = list(items)
+        finally:
+            if on_close:
+                on_close()
+        return FastJSONResponse(content=content, headers=headers)
+
+    def stream():
+        try:
+            if fmt == ResponseFormat.NDJSON:
+                for item in items:
+                    yield dumps(item) + b"\n"
+            else:
+                separator = b"["
+                for item in items:
+                    yield separator + dumps(item)
+                    separator = b","
+                yield b"[]" if separator == b"[" else b"]"
+        finally:
+            if on_close:
+                on_close()
+
+    media_type = "application/x-ndjson" if fmt == ResponseFormat.NDJSON else "application/json"
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
@@ -1,13 +1,21 @@
+import json
 from typing import Annotated, Any
 from http import HTTPStatus
 from fastapi import Depends, Response, HTTPException, Body, status, APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from botocore.exceptions import ClientError
 from .dynamoclient import DynamoClient
-from .db_connection import get_dynamodb, TableNames
-from .enrollment_helper import get_all_available_classes, enroll_students_from_waitlist
+from .db_connection import get_dynamodb, get_redisdb, TableNames
+from .enrollment_helper import get_all_available_classes, enroll_students_from_waitlist, cache_auto_enroll_enabled, \
+    build_class_record
 from .dependency_injection import sync_user_account
-from .models import Course, ClassCreate, ClassPatch, Config
+from .models import Course, ClassCreate, ClassPatch, Config, BulkEnrollment, ShardConfig
+from .bulk_enrollment import plan_bulk_enrollment, execute_bulk_enrollment
+from .bulk_import import ImportKind, ImportFormat, import_records, iter_lines_from_async
+from .versions import bump_versions
+from .seat_shards import shard_class, unshard_class, delete_shards, MAX_SEAT_SHARDS
+from .student_router import WAITLIST_CAPACITY, MAX_NUMBER_OF_WAITLISTS_PER_STUDENT
 
 registrar_router = APIRouter()
 
@@ -32,6 +40,13 @@ def set_auto_enrollment(config: Config, dynamodb: DynamoClient = Depends(get_dyn
         }
         dynamodb.put_item(TableNames.CONFIGS, kwargs)
 
+        # Refresh the cached config
+        redisdb = get_redisdb()
+        try:
+            cache_auto_enroll_enabled(config.auto_enrollment_enabled, redisdb)
+        finally:
+            redisdb.close()
+
         if config.auto_enrollment_enabled:
             # ***********************************************
             # Perform auto enrollment from waitlists
@@ -145,20 +160,7 @@ def create_class(new_class: ClassCreate, dynamodb: DynamoClient = Depends(get_dy
         # ---------------------------------------------------------------------
         # Insert into DB
         # ---------------------------------------------------------------------
-        # Generate class_id. Example format: 2024.Fall.CPSC.335.2
-        new_class.id = f"{new_class.year}.{new_class.semester}.{new_class.department_code}.{new_class.course_no}.{new_class.section_no}"
-
-        # Convert to dictionary
-        record = dict(new_class)
-
-        # Add class name
-        record["title"] = responses[0]["Item"]["title"]
-
-        # Add instructor info
-        record["instructor_info"] = {
-            "first_name": responses[1]["Item"]["first_name"],
-            "last_name": responses[1]["Item"]["last_name"]
-        }
+        record = build_class_record(new_class, responses[0]["Item"], responses[1]["Item"])
 
         kwargs = {
             "Item": record,
@@ -167,6 +169,8 @@ def create_class(new_class: ClassCreate, dynamodb: DynamoClient = Depends(get_dy
 
         dynamodb.put_item(TableNames.CLASSES, kwargs)
 
+        bump_versions([record["id"]], catalog=True)
+
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
             raise HTTPException(status_code=HTTPStatus.CONFLICT,
@@ -208,6 +212,14 @@ def delete_class(class_id: str, dynamodb: DynamoClient = Depends(get_dynamodb)):
             "ConditionExpression": "attribute_exists(id)",
         }
         dynamodb.delete_item(TableNames.CLASSES, kwargs)
+
+        redisdb = get_redisdb()
+        try:
+            delete_shards(class_id, dynamodb, redisdb)
+        finally:
+            redisdb.close()
+
+        bump_versions([class_id], catalog=True)
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
             raise HTTPException(
@@ -275,6 +287,8 @@ def update_class_instructor(class_info: ClassPatch, class_id: str, dynamodb: Dyn
         }
 
         dynamodb.update_item(TableNames.CLASSES, update_kwargs)
+
+        bump_versions([class_id], catalog=True)
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
             raise HTTPException(
@@ -288,3 +302,128 @@ def update_class_instructor(class_info: ClassPatch, class_id: str, dynamodb: Dyn
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="INTERNAL SERVER ERROR")
     else:
         return JSONResponse(status_code=HTTPStatus.OK, content={"message": "Item updated successfully"})
+
+
+@registrar_router.put("/classes/{class_id}/shards/")
+def set_class_shards(config: ShardConfig, class_id: str, dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Splits the seat counter of a very hot class over several items, so that concurrent
+    enrollments & drops do not all update the class item.
+
+    Parameters:
+    - `config` (ShardConfig): The JSON object with the following property:
+        - `shard_count` (int): Number of counter items, up to MAX_SEAT_SHARDS.
+          0 or 1 folds the shards back into the class item.
+
+    Returns:
+    - dict: A dictionary indicating the success of the operation.
+      Example: {"detail": "Class sharded", "shard_count": 8}
+
+    Raises:
+    - HTTPException (400): If shard_count is out of range.
+    - HTTPException (404): If the class is not found.
+    - HTTPException (409): If the class changed meanwhile. Retry the request.
+    """
+    if not 0 <= config.shard_count <= MAX_SEAT_SHARDS:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f"shard_count must be between 0 and {MAX_SEAT_SHARDS}")
+
+    redisdb = get_redisdb()
+
+    try:
+        if config.shard_count > 1:
+            shard_class(class_id, config.shard_count, dynamodb, redisdb)
+        else:
+            unshard_class(class_id, dynamodb, redisdb)
+
+        bump_versions(catalog=True, redisdb=redisdb)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "TransactionCanceledException":
+            raise HTTPException(
+                status_code=HTTPStatus.CONFLICT, detail="Transaction Canceled")
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="INTERNAL SERVER ERROR")
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="INTERNAL SERVER ERROR")
+    else:
+        if config.shard_count > 1:
+            return {"detail": "Class sharded", "shard_count": config.shard_count}
+        return {"detail": "Class unsharded", "shard_count": 0}
+    finally:
+        redisdb.close()
+
+
+@registrar_router.post("/enrollment/bulk/")
+def bulk_enroll(request: BulkEnrollment, dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Enrolls many students in classes at once (e.g. to move a cohort).
+
+    Placements are grouped by class. Each class gets its open seats filled in the order
+    of the placements, and the remaining students are placed on the waitlist.
+
+    Parameters:
+    - `request` (BulkEnrollment): The JSON object with the following property:
+        - `placements` (list): Objects with `class_id` (str) and `cwid` (int).
+
+    Returns:
+    - NDJSON stream: One line per placement, as soon as it is written:
+      {"class_id": ..., "cwid": ..., "status": "enrolled" | "waitlisted" | "failed", "detail": ...}
+    """
+    redisdb = get_redisdb()
+
+    try:
+        placements = [(e.class_id, e.cwid) for e in request.placements]
+        plan = plan_bulk_enrollment(placements, WAITLIST_CAPACITY, MAX_NUMBER_OF_WAITLISTS_PER_STUDENT,
+                                    dynamodb, redisdb)
+    except Exception as e:
+        redisdb.close()
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail=str(e))
+
+    def stream_results():
+        try:
+            for result in execute_bulk_enrollment(plan, redisdb):
+                yield json.dumps(result) + "\n"
+        finally:
+            redisdb.close()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@registrar_router.post("/import/{kind}/")
+async def bulk_import(kind: ImportKind,
+                      request: Request,
+                      format: ImportFormat = ImportFormat.CSV,
+                      dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Imports courses or classes from a CSV or NDJSON upload (e.g. a term's schedule).
+
+    The body is parsed while it is uploaded. Records are processed in chunks: the referenced
+    courses & instructors are prefetched with batched reads and the valid records are written
+    with conditional transactions, which never overwrite an existing record. Invalid rows are
+    reported and do not abort the import.
+
+    Parameters:
+    - `kind` (ImportKind): `courses` or `classes`.
+    - `format` (ImportFormat, query): `csv` (with a header row) or `ndjson`. Default: `csv`.
+    - Body: One record per row, with the fields of `POST /courses/` or `POST /classes/`.
+
+    Returns:
+    - dict: {"imported": int, "failed": int, "errors": [{"row": int, "detail": str}]}
+
+    Raises:
+    - HTTPException (400): If the body is not UTF-8 text.
+    - HTTPException (500): If the database cannot be written.
+    """
+    try:
+        return await run_in_threadpool(import_records, kind, format, iter_lines_from_async(request.stream()),
+                                       dynamodb)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST, detail="Body must be UTF-8 text")
+    except ClientError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail=e.response["Error"]["Message"])
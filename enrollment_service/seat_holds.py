@@ -0,0 +1,143 @@
+"""
+Seat holds: short-lived reservations of a seat, kept in Redis.
+
+A hold is a member (the student's CWID) of the sorted set `holds:{class_id}`, scored by its
+expiry time. Unexpired holds count against `room_capacity`: enrollments & promotions leave
+held seats to their holders, who confirm them later (see `POST /holds/{class_id}/confirm/`).
+
+Expired holds are reclaimed by the reaper (`enrollment_service.hold_reaper`), which then runs
+the waitlist promotion of the class. The sorted set `holds:index` (class_id -> earliest expiry)
+tells the reaper where to look.
+"""
+import time
+from redis import Redis
+
+# How long a hold lasts
+HOLD_TTL_SECONDS = 300
+
+HOLDS_KEY = "holds:{}"
+HOLDS_INDEX_KEY = "holds:index"
+
+# KEYS: holds of the class, holds index, waitlist of the class
+# ARGV: student, now, expires_at, open seats, class_id
+# Returns the expiry of the student's hold, or nil if there is no seat left.
+# An existing hold is returned as is: holds cannot be extended.
+PLACE_HOLD_SCRIPT = """
+local expires_at = redis.call('ZSCORE', KEYS[1], ARGV[1])
+
+if expires_at and tonumber(expires_at) > tonumber(ARGV[2]) then
+    return expires_at
+end
+
+-- Students on the waitlist come first
+if redis.call('ZCARD', KEYS[3]) > 0 then
+    return false
+end
+
+local num_holds = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[2], '+inf')
+if num_holds >= tonumber(ARGV[4]) then
+    return false
+end
+
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+
+local index_score = redis.call('ZSCORE', KEYS[2], ARGV[5])
+if not index_score or tonumber(index_score) > tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[5])
+end
+
+return ARGV[3]
+"""
+
+# KEYS: holds of the class, holds index
+# ARGV: now, class_id
+# Returns the number of expired holds removed.
+REAP_HOLDS_SCRIPT = """
+local num_expired = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+
+local first = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if first[2] then
+    redis.call('ZADD', KEYS[2], first[2], ARGV[2])
+else
+    redis.call('ZREM', KEYS[2], ARGV[2])
+end
+
+return num_expired
+"""
+
+
+def place_hold(class_id, student_id, open_seats: int, redisdb: Redis, ttl: int = HOLD_TTL_SECONDS):
+    """
+    Holds a seat for a student. If the student already holds one, that hold is returned.
+
+    Seats are held while the class's waitlist is empty and the unexpired holds
+    leave an open seat.
+
+    Parameters:
+    - open_seats (int): room_capacity - enrollment_count of the class.
+
+    Returns:
+    - float: The expiry time of the hold (Unix time), or None if no seat is left.
+    """
+    now = time.time()
+
+    place = redisdb.register_script(PLACE_HOLD_SCRIPT)
+    expires_at = place(keys=[HOLDS_KEY.format(class_id), HOLDS_INDEX_KEY, class_id],
+                       args=[student_id, now, now + ttl, open_seats, class_id])
+
+    return float(expires_at) if expires_at is not None else None
+
+
+def get_hold_expiry(class_id, student_id, redisdb: Redis):
+    """
+    Returns:
+    - float: The expiry time of the student's hold, or None if the student holds no seat.
+    """
+    expires_at = redisdb.zscore(HOLDS_KEY.format(class_id), student_id)
+    return expires_at if expires_at is not None and expires_at > time.time() else None
+
+
+def release_hold(class_id, student_id, redisdb: Redis):
+    """
+    Returns:
+    - bool: True if the student had a hold.
+    """
+    return redisdb.zrem(HOLDS_KEY.format(class_id), student_id) > 0
+
+
+def count_active_holds(class_id, redisdb: Redis, exclude=None):
+    """
+    Returns:
+    - int: The number of unexpired holds of the class, without the hold of `exclude` (a CWID).
+    """
+    key = HOLDS_KEY.format(class_id)
+    now = time.time()
+
+    pipeline = redisdb.pipeline(transaction=False)
+    pipeline.zcount(key, f"({now}", "+inf")
+    pipeline.zscore(key, exclude if exclude is not None else "")
+    num_holds, excluded_expiry = pipeline.execute()
+
+    if excluded_expiry is not None and excluded_expiry > now:
+        num_holds -= 1
+
+    return num_holds
+
+
+def reclaim_expired_holds(redisdb: Redis):
+    """
+    Removes the expired holds.
+
+    Returns:
+    - list: The IDs of the classes that got seats back.
+    """
+    now = time.time()
+    reap = redisdb.register_script(REAP_HOLDS_SCRIPT)
+    reclaimed = []
+
+    for class_id in redisdb.zrangebyscore(HOLDS_INDEX_KEY, "-inf", now):
+        class_id = class_id.decode("utf-8")
+        if reap(keys=[HOLDS_KEY.format(class_id), HOLDS_INDEX_KEY], args=[now, class_id]) > 0:
+            reclaimed.append(class_id)
+
+    return reclaimed
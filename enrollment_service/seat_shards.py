@@ -0,0 +1,392 @@
+"""
+Sharded seat counters for very hot classes.
+
+Every enrollment & drop of a class updates `enrollment_count` on its Classes item, so they all
+compete for that one item. A hot class can instead be split over `shard_count` counter items
+in the ClassSeatShards table, `{class_id, shard_no, capacity, enrollment_count}`, each owning
+part of the open seats. An enrollment takes a seat from a shard with room, a drop gives one
+back to a random shard. The writes spread over the shards instead of queueing on one item.
+
+While a class is sharded:
+- Its item carries `shard_count`. Enrollments & drops that update the class item are rejected
+  by their conditions, and go to the shards instead.
+- Its `enrollment_count` only holds the enrollments folded in so far. The current count
+  is that plus the shards' counts (see `get_enrollment_count`).
+- The merger (`enrollment_service.shard_merger`) folds the shards' counts back into the class
+  item and spreads the open seats over the shards again, so that listings catch up and seats
+  given back to one shard are open in all of them.
+"""
+import random
+import time
+from redis import Redis
+from fastapi import HTTPException
+from http import HTTPStatus
+from .dynamoclient import DynamoClient
+from .db_connection import TableNames
+
+# Sharding writes the class item and every shard in one transaction (100 items at most),
+# and enrollments read all the shards to find one with room
+MAX_SEAT_SHARDS = 20
+
+# How long a service instance remembers that a class is sharded.
+# Meanwhile its enrollments & drops go to the shards without trying the class item first.
+SHARD_COUNT_CACHE_TTL_SECONDS = 30
+
+# Redis set of the sharded classes, for the merger
+SHARDED_CLASSES_KEY = "shards:classes"
+
+# class_id -> (shard_count, cached at)
+_shard_count_cache = {}
+
+
+def get_cached_shard_count(class_id):
+    """
+    Returns:
+    - int: The shard_count of the class if it is known to be sharded. Otherwise, None.
+    """
+    cached = _shard_count_cache.get(class_id)
+    if cached is None:
+        return None
+
+    shard_count, cached_at = cached
+    if time.monotonic() - cached_at > SHARD_COUNT_CACHE_TTL_SECONDS:
+        _shard_count_cache.pop(class_id, None)
+        return None
+
+    return shard_count
+
+
+def cache_shard_count(class_id, shard_count):
+    """
+    Remembers the `shard_count` of a class item. None (the class is not sharded) forgets it.
+    """
+    if shard_count:
+        _shard_count_cache[class_id] = (int(shard_count), time.monotonic())
+    else:
+        _shard_count_cache.pop(class_id, None)
+
+
+def split_seats(num_seats: int, shard_count: int):
+    """
+    Returns:
+    - list: The capacity of every shard. They differ by one seat at most.
+    """
+    num_seats = max(0, num_seats)
+    return [num_seats // shard_count + (1 if i < num_seats % shard_count else 0)
+            for i in range(shard_count)]
+
+
+def query_shards(class_id, dynamodb: DynamoClient, consistent: bool = True):
+    """
+    Returns:
+    - list: The shards of the class, in shard_no order. Empty if the class is not sharded.
+    """
+    kwargs = {
+        "KeyConditionExpression": "class_id = :class_id",
+        "ExpressionAttributeValues": {":class_id": class_id},
+        "ConsistentRead": consistent,
+    }
+    return dynamodb.query(TableNames.SEAT_SHARDS, kwargs)["Items"]
+
+
+def get_enrollment_count(class_id, class_item: dict, dynamodb: DynamoClient):
+    """
+    Returns:
+    - int: The number of students enrolled in the class, including the ones counted by its
+      shards that are not folded into the class item yet.
+    """
+    enrollment_count = int(class_item.get("enrollment_count", 0))
+
+    if class_item.get("shard_count"):
+        enrollment_count += sum(int(e["enrollment_count"]) for e in query_shards(class_id, dynamodb))
+
+    return enrollment_count
+
+
+def build_shard_enroll_item(class_id, shard_no: int):
+    """
+    Builds the transaction item that takes a seat from a shard, if the shard has one.
+    It takes the place of the class update in the enrollment transaction.
+    """
+    return {
+        "Update": {
+            "TableName": TableNames.SEAT_SHARDS,
+            "Key": {"class_id": class_id, "shard_no": shard_no},
+            "UpdateExpression": "ADD enrollment_count :step_size",
+            "ConditionExpression": "enrollment_count < capacity",
+            "ExpressionAttributeValues": {":step_size": 1},
+        }
+    }
+
+
+def build_shard_drop_item(class_id, shard_no: int, num_seats: int = 1):
+    """
+    Builds the transaction item that gives `num_seats` seats back to a shard.
+    It takes the place of the class update in the drop transaction.
+    """
+    return {
+        "Update": {
+            "TableName": TableNames.SEAT_SHARDS,
+            "Key": {"class_id": class_id, "shard_no": shard_no},
+            "UpdateExpression": "ADD enrollment_count :step_size",
+            # Fails once the class is unsharded, instead of creating a stray shard
+            "ConditionExpression": "attribute_exists(class_id)",
+            "ExpressionAttributeValues": {":step_size": -num_seats},
+        }
+    }
+
+
+def build_shard_claim_items(class_id, shards: list, num_seats: int):
+    """
+    Builds the transaction items that take up to `num_seats` seats from the shards.
+    Each item only succeeds if its shard did not change since it was read.
+
+    Parameters:
+    - shards (list): The shards, as returned by `query_shards`.
+
+    Returns:
+    - tuple: (transact_items, num_claimed)
+    """
+    transact_items = []
+    num_claimed = 0
+
+    for shard in shards:
+        num_taken = min(int(shard["capacity"]) - int(shard["enrollment_count"]), num_seats - num_claimed)
+        if num_taken <= 0:
+            continue
+
+        transact_items.append({
+            "Update": {
+                "TableName": TableNames.SEAT_SHARDS,
+                "Key": {"class_id": class_id, "shard_no": shard["shard_no"]},
+                "UpdateExpression": "ADD enrollment_count :step_size",
+                "ConditionExpression": "enrollment_count = :count",
+                "ExpressionAttributeValues": {
+                    ":step_size": num_taken,
+                    ":count": shard["enrollment_count"],
+                },
+            }
+        })
+        num_claimed += num_taken
+
+        if num_claimed == num_seats:
+            break
+
+    return transact_items, num_claimed
+
+
+def pick_open_shards(class_id, dynamodb: DynamoClient):
+    """
+    Returns:
+    - list: The shard_no of the shards that have room, in random order,
+      so that concurrent enrollments spread over them.
+    """
+    shard_numbers = [int(e["shard_no"]) for e in query_shards(class_id, dynamodb, consistent=False)
+                     if e["enrollment_count"] < e["capacity"]]
+    random.shuffle(shard_numbers)
+    return shard_numbers
+
+
+def _read_class(class_id, dynamodb: DynamoClient):
+    kwargs = {"Key": {"id": class_id}, "ConsistentRead": True}
+    class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+    if class_item is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Class Not Found")
+
+    return class_item
+
+
+def _build_class_fold_item(class_item: dict, update_expression: str, values: dict):
+    """
+    Builds the class update of a fold, conditioned on the class item & shard_count not having
+    changed since they were read.
+    """
+    if "enrollment_count" in class_item:
+        condition = "shard_count = :shard_count AND enrollment_count = :count"
+        values[":count"] = class_item["enrollment_count"]
+    else:
+        condition = "shard_count = :shard_count AND attribute_not_exists(enrollment_count)"
+
+    values[":shard_count"] = class_item["shard_count"]
+
+    return {
+        "Update": {
+            "TableName": TableNames.CLASSES,
+            "Key": {"id": class_item["id"]},
+            "UpdateExpression": update_expression,
+            "ConditionExpression": condition,
+            "ExpressionAttributeValues": values,
+        }
+    }
+
+
+def shard_class(class_id, shard_count: int, dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Splits the open seats of a class over `shard_count` counter items.
+    A class that is sharded already is unsharded first.
+
+    Raises:
+    - HTTPException (404): If the class does not exist.
+    - botocore.exceptions.ClientError: If the class changed meanwhile (TransactionCanceledException).
+    """
+    unshard_class(class_id, dynamodb, redisdb)
+    class_item = _read_class(class_id, dynamodb)
+
+    enrollment_count = int(class_item.get("enrollment_count", 0))
+    capacities = split_seats(int(class_item.get("room_capacity", 0)) - enrollment_count, shard_count)
+
+    if "enrollment_count" in class_item:
+        condition = "attribute_not_exists(shard_count) AND enrollment_count = :count"
+        values = {":shard_count": shard_count, ":count": class_item["enrollment_count"]}
+    else:
+        condition = "attribute_exists(id) AND attribute_not_exists(shard_count) \
+                     AND attribute_not_exists(enrollment_count)"
+        values = {":shard_count": shard_count}
+
+    transact_items = [
+        {
+            # ***********************************************
+            # UPDATE class: flag it as sharded
+            # ***********************************************
+            "Update": {
+                "TableName": TableNames.CLASSES,
+                "Key": {"id": class_id},
+                "UpdateExpression": "SET shard_count = :shard_count",
+                "ConditionExpression": condition,
+                "ExpressionAttributeValues": values,
+            }
+        }
+    ]
+
+    for shard_no, capacity in enumerate(capacities):
+        transact_items.append({
+            # ***********************************************
+            # INSERT INTO shards table
+            # ***********************************************
+            "Put": {
+                "TableName": TableNames.SEAT_SHARDS,
+                "Item": {
+                    "class_id": class_id,
+                    "shard_no": shard_no,
+                    "capacity": capacity,
+                    "enrollment_count": 0,
+                },
+            }
+        })
+
+    dynamodb.transact_write_items(transact_items)
+
+    redisdb.sadd(SHARDED_CLASSES_KEY, class_id)
+    cache_shard_count(class_id, shard_count)
+
+
+def unshard_class(class_id, dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Folds the shards of a class into its item and deletes them. Nothing happens if the class
+    is not sharded.
+
+    Raises:
+    - HTTPException (404): If the class does not exist.
+    - botocore.exceptions.ClientError: If the class or a shard changed meanwhile
+      (TransactionCanceledException).
+    """
+    class_item = _read_class(class_id, dynamodb)
+
+    if class_item.get("shard_count"):
+        shards = query_shards(class_id, dynamodb)
+        enrollment_count = int(class_item.get("enrollment_count", 0)) + \
+            sum(int(e["enrollment_count"]) for e in shards)
+        available = "true" if int(class_item.get("room_capacity", 0)) > enrollment_count else "false"
+
+        # ***********************************************
+        # UPDATE class: fold the counts & remove the flag
+        # ***********************************************
+        transact_items = [_build_class_fold_item(
+            class_item,
+            "SET enrollment_count = :total, available = :status REMOVE shard_count",
+            {":total": enrollment_count, ":status": available})]
+
+        for shard in shards:
+            # ***********************************************
+            # DELETE FROM shards table
+            # ***********************************************
+            transact_items.append({
+                "Delete": {
+                    "TableName": TableNames.SEAT_SHARDS,
+                    "Key": {"class_id": class_id, "shard_no": shard["shard_no"]},
+                    "ConditionExpression": "enrollment_count = :count",
+                    "ExpressionAttributeValues": {":count": shard["enrollment_count"]},
+                }
+            })
+
+        dynamodb.transact_write_items(transact_items)
+
+    redisdb.srem(SHARDED_CLASSES_KEY, class_id)
+    cache_shard_count(class_id, None)
+
+
+def fold_shards(class_id, dynamodb: DynamoClient):
+    """
+    Moves the shards' counts into the class item, and splits the open seats over the shards again.
+
+    Returns:
+    - int: The number of enrollments folded (negative if there were more drops),
+      or None if the class is no longer sharded.
+
+    Raises:
+    - botocore.exceptions.ClientError: If the class or a shard changed meanwhile
+      (TransactionCanceledException). The fold can simply be tried again later.
+    """
+    kwargs = {"Key": {"id": class_id}, "ConsistentRead": True}
+    class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+    if not class_item or not class_item.get("shard_count"):
+        return None
+
+    shards = query_shards(class_id, dynamodb)
+    num_folded = sum(int(e["enrollment_count"]) for e in shards)
+
+    # Nothing enrolled or dropped since the last fold
+    if not any(e["enrollment_count"] for e in shards):
+        return 0
+
+    enrollment_count = int(class_item.get("enrollment_count", 0)) + num_folded
+    room_capacity = int(class_item.get("room_capacity", 0))
+    capacities = split_seats(room_capacity - enrollment_count, len(shards))
+
+    transact_items = [_build_class_fold_item(
+        class_item,
+        "SET enrollment_count = :total, available = :status",
+        {":total": enrollment_count, ":status": "true" if room_capacity > enrollment_count else "false"})]
+
+    for shard, capacity in zip(shards, capacities):
+        transact_items.append({
+            "Update": {
+                "TableName": TableNames.SEAT_SHARDS,
+                "Key": {"class_id": class_id, "shard_no": shard["shard_no"]},
+                "UpdateExpression": "SET enrollment_count = :zero, capacity = :capacity",
+                "ConditionExpression": "enrollment_count = :count",
+                "ExpressionAttributeValues": {
+                    ":zero": 0,
+                    ":capacity": capacity,
+                    ":count": shard["enrollment_count"],
+                },
+            }
+        })
+
+    dynamodb.transact_write_items(transact_items)
+
+    return num_folded
+
+
+def delete_shards(class_id, dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Deletes the shards of a deleted class.
+    """
+    with dynamodb.batch_writer(TableNames.SEAT_SHARDS) as batch:
+        for shard in query_shards(class_id, dynamodb):
+            batch.delete_item(Key={"class_id": class_id, "shard_no": shard["shard_no"]})
+
+    redisdb.srem(SHARDED_CLASSES_KEY, class_id)
+    cache_shard_count(class_id, None)
@@ -0,0 +1,64 @@
+"""
+JSON serialization of DynamoDB items.
+
+boto3 returns numbers as `Decimal` and string/number sets as `set`. They are encoded here
+directly (Decimal -> int or float, set -> list), without the recursive `jsonable_encoder` pass.
+orjson is used when it is installed, otherwise the standard json module.
+
+Endpoints that return large lists should return a `FastJSONResponse` themselves: FastAPI runs
+`jsonable_encoder` on every other return value before the response class renders it.
+"""
+import json
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(obj):
+    """
+    Encodes the values that JSON does not support natively.
+    """
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8")
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        """
+        Serializes an object (e.g. DynamoDB items) to compact JSON.
+        """
+        return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj) -> bytes:
+        """
+        Serializes an object (e.g. DynamoDB items) to compact JSON.
+        """
+        return json.dumps(obj, default=encode_default, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse that encodes DynamoDB types natively.
+
+    Example:
+    ```python
+    app = FastAPI(default_response_class=FastJSONResponse)
+    return FastJSONResponse(content=response["Items"])
+    ```
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,50 @@
+"""
+Folds the seat shards of sharded classes back into their class items.
+
+Usage:
+```
+python3 -m enrollment_service.shard_merger
+```
+"""
+import time
+from botocore.exceptions import ClientError
+from redis import Redis, RedisError
+from .dynamoclient import DynamoClient
+from .db_connection import get_dynamodb, get_redisdb
+from .seat_shards import fold_shards, SHARDED_CLASSES_KEY
+from .versions import bump_versions
+
+# How often the merger folds the shards. Until then, listings show the count of the last fold.
+MERGER_INTERVAL_SECONDS = 2
+
+
+def run_merger(dynamodb: DynamoClient, redisdb: Redis):
+    """
+    Folds the shards of every sharded class each MERGER_INTERVAL_SECONDS.
+    A fold that conflicts with an enrollment or drop is tried again in the next round.
+    """
+    while True:
+        try:
+            for class_id in redisdb.smembers(SHARDED_CLASSES_KEY):
+                class_id = class_id.decode("utf-8")
+
+                try:
+                    num_folded = fold_shards(class_id, dynamodb)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "TransactionCanceledException":
+                        print(f"ClientError: {e}")
+                    continue
+
+                if num_folded is None:
+                    # Unsharded or deleted
+                    redisdb.srem(SHARDED_CLASSES_KEY, class_id)
+                elif num_folded:
+                    bump_versions(catalog=True, redisdb=redisdb)
+        except RedisError as e:
+            print(f"RedisError: {e}")
+
+        time.sleep(MERGER_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    run_merger(get_dynamodb(), get_redisdb())
@@ -1,46 +1,90 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Optional
 from http import HTTPStatus
-from fastapi import Depends, HTTPException, Header, Body, status, APIRouter, Request
+from fastapi import Depends, HTTPException, Header, Body, Query, status, APIRouter, Request
 from fastapi.responses import JSONResponse
 from botocore.exceptions import ClientError
 from redis import Redis, RedisError
 from .dynamoclient import DynamoClient
-from .db_connection import get_redisdb, get_dynamodb, TableNames
-from .enrollment_helper import add_to_waitlist, drop_from_enrollment, get_all_available_classes
+from .db_connection import get_redisdb, get_dynamodb, TableNames, settings
+from .enrollment_helper import add_to_waitlist, drop_from_enrollment, query_available_classes, \
+    enroll_student, build_enroll_transact_items, mark_class_unavailable, is_auto_enroll_enabled, \
+    enroll_students_from_waitlist, publish_waitlist_positions
+from .pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+from .serialization import FastJSONResponse
+from .seat_holds import place_hold, get_hold_expiry, release_hold, count_active_holds
+from .seat_shards import get_enrollment_count
+from .dashboard import get_dashboard
+from .versions import bump_versions, compute_etag, is_not_modified, not_modified_response, \
+    CATALOG_VERSION_KEY, STUDENT_VERSION_KEY
 from .dependency_injection import sync_user_account
 from .models import ClassCreate
 from datetime import datetime
+import pika
 
 WAITLIST_CAPACITY = 15
 MAX_NUMBER_OF_WAITLISTS_PER_STUDENT = 3
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Enrollment strategy, set with the FAST_ENROLL environment variable (see Settings)
+FAST_ENROLL = settings.FAST_ENROLL
 
 student_router = APIRouter()
 
 
 @student_router.get("/classes/available/", dependencies=[Depends(sync_user_account)])
-def get_available_classes(student_id: int = Header(alias="x-cwid"), 
+def get_available_classes(student_id: int = Header(alias="x-cwid"),
+                          if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+                          department_code: Optional[str] = None,
+                          year: Optional[int] = None,
+                          semester: Optional[str] = None,
+                          course_no: Optional[int] = None,
+                          limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          cursor: Optional[str] = None,
                           dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Retreive one page of the classes that have open seats, excluding the classes
+    that the student is enrolled or waitlisted.
+
+    Parameters:
+    - department_code, year, semester, course_no (optional, in the query string): Filters.
+    - limit (int, in the query string): Maximum number of classes in the page.
+    - cursor (str, in the query string): The `X-Next-Cursor` header of the previous page.
+
+    Returns:
+    - list: The available classes. If there are more classes, the cursor of the next page
+      is returned in the `X-Next-Cursor` response header.
+    - 304 Not Modified: If `If-None-Match` matches the ETag, i.e. no class and none of the
+      student's enrollments & waitlists changed. Then the database is not read.
+
+    Raises:
+    - HTTPException (400): If the cursor is invalid.
+    """
     try:
+        exclusive_start_key = decode_cursor(cursor) if cursor else None
+
         # ---------------------------------------------------------------------
-        # Get all the classes that have open seats
+        # Answer from the version counters if nothing changed.
+        # They are read before the classes, so the ETag is never newer than the page.
         # ---------------------------------------------------------------------
-        available_classes = get_all_available_classes(dynamodb)
-        
+        etag = compute_etag([CATALOG_VERSION_KEY, STUDENT_VERSION_KEY.format(student_id)],
+                            student_id, department_code, year, semester, course_no, limit, cursor)
+
+        if is_not_modified(if_none_match, etag):
+            return not_modified_response(etag)
+
+        headers = {"ETag": etag} if etag else {}
 
         # ---------------------------------------------------------------------
         # Retrieves all the classes that the student is enrolled or waitlisted
         # ---------------------------------------------------------------------
-        kwargs = {"Key": {"cwid": student_id}}
-        response = dynamodb.get_item(TableNames.PERSONNEL, kwargs)
-
-        my_classes = []
-        
-        if "enrollments" in response["Item"]:
-            my_classes.extend(list(response["Item"]["enrollments"]))
-
-        if "waitlists" in response["Item"]:
-            my_classes.extend(list(response["Item"]["waitlists"]))
+        kwargs = {
+            "Key": {"cwid": student_id},
+            "ProjectionExpression": "enrollments, waitlists"
+        }
+        personnel = dynamodb.get_item(TableNames.PERSONNEL, kwargs).get("Item", {})
 
+        my_classes = set(personnel.get("enrollments", set())) | set(personnel.get("waitlists", set()))
 
         # ---------------------------------------------------------------------
         # Get the available classes for this_student by filtering out
@@ -48,8 +92,17 @@ def get_available_classes(student_id: int = Header(alias="x-cwid"),
         #
         # available_classes_for_this_student = available_classes - enrollments - waitlists
         # ---------------------------------------------------------------------
-        for item in my_classes:
-            available_classes = [e for e in available_classes if e['id'] != item]
+        filters = {
+            "department_code": department_code,
+            "year": year,
+            "semester": semester,
+            "course_no": course_no
+        }
+        available_classes, last_evaluated_key = query_available_classes(
+            dynamodb, filters, my_classes, limit, exclusive_start_key)
+
+        if last_evaluated_key:
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(last_evaluated_key)
 
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=str(e.detail))
@@ -57,7 +110,8 @@ def get_available_classes(student_id: int = Header(alias="x-cwid"),
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=e)
     else:
-        return available_classes
+        # Returned as a response, so that FastAPI does not run jsonable_encoder on the classes
+        return FastJSONResponse(content=available_classes, headers=headers)
 
 
 @student_router.post("/enrollment/", dependencies=[Depends(sync_user_account)], status_code=status.HTTP_201_CREATED)
@@ -92,90 +146,72 @@ def enroll(class_id: Annotated[str, Body(embed=True)],
         # API Response data
         response_json = {}
 
-        # ---------------------------------------------------------------------
-        # Get class information: room_capacity & enrollment_count
-        # ---------------------------------------------------------------------
-        get_class_params = {
-            "Get": {
-                "TableName": TableNames.CLASSES,
-                "Key": {
-                    "id": class_id
-                }
-            }
-        }
-        responses = dynamodb.transact_get_items([get_class_params])
-
-        if not responses[0]:
-            raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                                detail="Class Not Found")
-
-        class_info = ClassCreate(**responses[0]["Item"])
-
-        # ---------------------------------------------------------------------
-        # If there is an open seat, enroll the student in the class
-        # ---------------------------------------------------------------------
-        if class_info.room_capacity > class_info.enrollment_count:
-
-            # After student enrolled in the class,
-            # If there will be NO open seats (Class will be full),
-            # Then, set available status to "false".
-            # Otherwise, "true"
-            available = "true" if class_info.room_capacity > class_info.enrollment_count + 1 else "false"
-
-            TransactItems = [
-                {
-                    # ***********************************************
-                    # INSERT new item INTO enrollments table
-                    # ***********************************************
-                    "Put": {
-                        "TableName": TableNames.ENROLLMENTS,
-                        "Item": {
-                            "class_id": class_id,
-                            "student_cwid": student_id,
-                            "student_info": {
-                                "first_name": first_name,
-                                "last_name": last_name
-                            }
-                        },
-                        "ConditionExpression": "attribute_not_exists(class_id) AND attribute_not_exists(student_cwid)"
-                    }
-                },
-                {
-                    # ***********************************************
-                    # UPDATE class available status & enrollment_count
-                    # ***********************************************
-                    "Update": {
-                        "TableName": TableNames.CLASSES,
-                        "Key": {
-                            "id": class_id
-                        },
-                        "UpdateExpression": "SET available = :status, \
-                                                enrollment_count = enrollment_count + :step_size",
-                        "ExpressionAttributeValues": {
-                            ":status": available,
-                            ":step_size": 1
-                        }
-                    }
-                },
-                {
-                    # TODO: refactoring needed
-                    # ***********************************************
-                    # UPDATE PERSONNEL `enrollments` attribute
-                    # ***********************************************
-                    "Update": {
-                        "TableName": TableNames.PERSONNEL,
-                        "Key": {
-                            "cwid": student_id
-                        },
-                        "UpdateExpression": "ADD enrollments :value",
-                        "ExpressionAttributeValues": {
-                            ":value": {class_id}
-                        },
+        # Seats held by other students are not open.
+        # If the student holds a seat, the enrollment takes it.
+        num_held_seats = count_active_holds(class_id, redisdb, exclude=student_id)
+
+        if FAST_ENROLL:
+            # ---------------------------------------------------------------------
+            # Enroll with one conditional transaction. No need to read the class first,
+            # unless seats are held. If the class is full, its item is returned.
+            # ---------------------------------------------------------------------
+            max_enrollment_count = None
+
+            if num_held_seats:
+                kwargs = {"Key": {"id": class_id}, "ProjectionExpression": "room_capacity"}
+                class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+                if class_item:
+                    max_enrollment_count = int(class_item["room_capacity"]) - num_held_seats
+
+            full_class = enroll_student(class_id, student_id, first_name, last_name, dynamodb,
+                                        max_enrollment_count)
+        else:
+            # ---------------------------------------------------------------------
+            # Get class information: room_capacity & enrollment_count
+            # ---------------------------------------------------------------------
+            get_class_params = {
+                "Get": {
+                    "TableName": TableNames.CLASSES,
+                    "Key": {
+                        "id": class_id
                     }
                 }
-            ]
-
-            dynamodb.transact_write_items(TransactItems)
+            }
+            responses = dynamodb.transact_get_items([get_class_params])
+
+            if not responses[0]:
+                raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                                    detail="Class Not Found")
+
+            class_info = ClassCreate(**responses[0]["Item"])
+            full_class = None
+
+            # ---------------------------------------------------------------------
+            # If there is an open seat, enroll the student in the class
+            # ---------------------------------------------------------------------
+            room_capacity = class_info.room_capacity - num_held_seats
+
+            if responses[0]["Item"].get("shard_count"):
+                # The class item does not count the seats taken from its shards
+                full_class = enroll_student(class_id, student_id, first_name, last_name, dynamodb,
+                                            room_capacity if num_held_seats else None)
+            elif room_capacity > class_info.enrollment_count:
+
+                # After student enrolled in the class,
+                # If there will be NO open seats (Class will be full),
+                # Then, set available status to "false".
+                # Otherwise, "true"
+                available = "true" if room_capacity > class_info.enrollment_count + 1 else "false"
+
+                TransactItems = build_enroll_transact_items(class_id, student_id, first_name, last_name, available,
+                                                            room_capacity)
+                dynamodb.transact_write_items(TransactItems)
+            else:
+                full_class = responses[0]["Item"]
+
+        if full_class is None:
+            release_hold(class_id, student_id, redisdb)
+            bump_versions([class_id], [student_id], catalog=True, redisdb=redisdb)
 
             response_json = JSONResponse(status_code=HTTPStatus.CREATED, content={
                                          "detail": "Enrolled successfully"})
@@ -184,13 +220,18 @@ def enroll(class_id: Annotated[str, Body(embed=True)],
         # Else, Check & Add the student to the waitlist
         # ---------------------------------------------------------------------
         else:
+            # The class is full. Make sure it is no longer listed as available.
+            if full_class.get("available") == "true":
+                mark_class_unavailable(class_id, dynamodb)
+
             # ***********************************************
             # Check number of waitlists limit per student
             # ***********************************************
+            # The Personnel item may be missing: claims that were synchronized recently are not checked again
             kwargs = {"Key": {"cwid": student_id}}
-            response = dynamodb.get_item(TableNames.PERSONNEL, kwargs)
+            personnel = dynamodb.get_item(TableNames.PERSONNEL, kwargs).get("Item", {})
 
-            if "waitlists" in response["Item"] and MAX_NUMBER_OF_WAITLISTS_PER_STUDENT <= len(response["Item"]["waitlists"]):
+            if MAX_NUMBER_OF_WAITLISTS_PER_STUDENT <= len(personnel.get("waitlists", ())):
                 raise HTTPException(status_code=HTTPStatus.CONFLICT,
                                     detail="Exceed number of waitlists limit")
 
@@ -221,7 +262,7 @@ def enroll(class_id: Annotated[str, Body(embed=True)],
             # OK. Checks passed. Place the student on waitlist
             # ***********************************************
             score = int(datetime.utcnow().timestamp())
-            add_to_waitlist(class_id, class_info.title, student_id, new_member, score)
+            add_to_waitlist(class_id, full_class.get("title"), student_id, new_member, score)
 
             # Return value
             response_json = JSONResponse(status_code=HTTPStatus.CREATED,
@@ -252,6 +293,8 @@ def drop_class(
         class_id: str,
         student_id: int = Header(
             alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+        first_name: Optional[str] = Header(None, alias="x-first-name"),
+        last_name: Optional[str] = Header(None, alias="x-last-name"),
         dynamodb: DynamoClient = Depends(get_dynamodb)):
     """
     Handles a DELETE request to drop a student (himself/herself) from a specific class.
@@ -259,6 +302,8 @@ def drop_class(
     Parameters:
     - class_id (int): The ID of the class from which the student wants to drop.
     - student_id (int, in the header): A unique ID for students, instructors, and registrars.
+    - first_name, last_name (str, in the header): The student's names. They are stored in the
+      enrollment too, so with them the drop needs no extra read.
 
     Returns:
     - dict: A dictionary with the detail message indicating the success of the operation.
@@ -267,7 +312,146 @@ def drop_class(
     - HTTPException (409): If a conflict occurs
     """
     administrative = False
-    drop_from_enrollment(class_id, student_id, administrative, dynamodb)
+    student_info = None
+
+    if first_name is not None and last_name is not None:
+        student_info = {"first_name": first_name, "last_name": last_name}
+
+    drop_from_enrollment(class_id, student_id, administrative, dynamodb, student_info)
+
+
+@student_router.post("/holds/", dependencies=[Depends(sync_user_account)], status_code=status.HTTP_201_CREATED)
+def hold_seat(class_id: Annotated[str, Body(embed=True)],
+              student_id: int = Header(
+                  alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+              redisdb: Redis = Depends(get_redisdb),
+              dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Student holds a seat in a class for HOLD_TTL_SECONDS, to enroll later with
+    `POST /holds/{class_id}/confirm/`. Holding a seat again returns the existing hold.
+
+    Parameters:
+    - class_id (str, in the request body): The class.
+    - student_id (int, in the request header): The student.
+
+    Returns:
+    - dict: {"class_id": str, "expires_at": int (Unix time)}
+
+    Raises:
+    - HTTPException (404): If the class does not exist.
+    - HTTPException (409): If there is no open seat to hold, or students are on the waitlist.
+    """
+    try:
+        kwargs = {"Key": {"id": class_id}, "ProjectionExpression": "room_capacity, enrollment_count, shard_count"}
+        class_item = dynamodb.get_item(TableNames.CLASSES, kwargs).get("Item")
+
+        if not class_item:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Class Not Found")
+
+        open_seats = int(class_item.get("room_capacity", 0)) - get_enrollment_count(class_id, class_item, dynamodb)
+        expires_at = place_hold(class_id, student_id, open_seats, redisdb)
+
+        if expires_at is None:
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="No open seats")
+
+    except RedisError as e:
+        print(f"RedisError: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
+    else:
+        return {"class_id": class_id, "expires_at": int(expires_at)}
+    finally:
+        redisdb.close()  # Close the Redis connection
+
+
+@student_router.post("/holds/{class_id}/confirm/", dependencies=[Depends(sync_user_account)],
+                     status_code=status.HTTP_201_CREATED)
+def confirm_hold(class_id: str,
+                 student_id: int = Header(
+                     alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+                 first_name: str = Header(alias="x-first-name"),
+                 last_name: str = Header(alias="x-last-name"),
+                 redisdb: Redis = Depends(get_redisdb),
+                 dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Student enrolls in a class with the seat they hold.
+
+    Returns:
+    - dict: {"detail": "Enrolled successfully"}
+
+    Raises:
+    - HTTPException (404): If the student holds no seat (e.g. the hold expired) or the class does not exist.
+    - HTTPException (409): If the student already enrolled, or the seat was lost.
+    """
+    try:
+        if get_hold_expiry(class_id, student_id, redisdb) is None:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Hold Not Found")
+
+        # The hold is released once the outcome is definite. After a transient failure
+        # (e.g. a canceled transaction), the student keeps the seat and may retry.
+        try:
+            full_class = enroll_student(class_id, student_id, first_name, last_name, dynamodb)
+        except HTTPException as e:
+            if e.detail in ("Already enrolled", "Class Not Found"):
+                release_hold(class_id, student_id, redisdb)
+            raise
+
+        release_hold(class_id, student_id, redisdb)
+
+        if full_class is not None:
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Class is full")
+
+        bump_versions([class_id], [student_id], catalog=True, redisdb=redisdb)
+
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "TransactionCanceledException":
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Transaction Canceled")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
+    except RedisError as e:
+        print(f"RedisError: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
+    else:
+        return {"detail": "Enrolled successfully"}
+    finally:
+        redisdb.close()  # Close the Redis connection
+
+
+@student_router.delete("/holds/{class_id}/", status_code=status.HTTP_200_OK)
+def release_seat(class_id: str,
+                 student_id: int = Header(
+                     alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+                 redisdb: Redis = Depends(get_redisdb),
+                 dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Student gives back the seat they hold. The seat goes to the waitlist if auto enrollment is enabled.
+
+    Raises:
+    - HTTPException (404): If the student holds no seat.
+    """
+    try:
+        if not release_hold(class_id, student_id, redisdb):
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Hold Not Found")
+
+        if is_auto_enroll_enabled(dynamodb):
+            enroll_students_from_waitlist([class_id], dynamodb)
+
+    except RedisError as e:
+        print(f"RedisError: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e.detail))
+    else:
+        return {"detail": "Hold released"}
+    finally:
+        redisdb.close()  # Close the Redis connection
 
 
 @student_router.get("/waitlist/{class_id}/position/")
@@ -348,8 +532,9 @@ def remove_from_waitlist(
     - HTTPException (409): If a conflict occurs
     """
     try:
-        # Get the rank of the member in the sorted set
-        deleted_count = redisdb.zrem(class_id, student_id)
+        # Members are `cwid#first_name#last_name`: find the student's by its CWID
+        members = [m for m, _ in redisdb.zscan_iter(class_id, match=f"{student_id}#*")]
+        deleted_count = redisdb.zrem(class_id, *members) if members else 0
 
         if deleted_count > 0:
             # ***********************************************
@@ -369,6 +554,14 @@ def remove_from_waitlist(
 
             dynamodb.update_item(TableNames.PERSONNEL, kwargs)
 
+            bump_versions([class_id], [student_id], redisdb=redisdb)
+
+            # The students behind moved up. The removal stands even if the event is lost.
+            try:
+                publish_waitlist_positions(class_id, redisdb)
+            except pika.exceptions.AMQPError as e:
+                print(f"Failed to publish the waitlist positions: {e}")
+
             response_json = {"detail": "Item deleted successfully"}
         else:
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
@@ -381,3 +574,33 @@ def remove_from_waitlist(
         return response_json
     finally:
         redisdb.close()  # Close the Redis connection
+
+
+@student_router.get("/dashboard/", dependencies=[Depends(sync_user_account)])
+def get_student_dashboard(student_id: int = Header(alias="x-cwid"),
+                          first_name: str = Header(alias="x-first-name"),
+                          last_name: str = Header(alias="x-last-name"),
+                          redisdb: Redis = Depends(get_redisdb),
+                          dynamodb: DynamoClient = Depends(get_dynamodb)):
+    """
+    Retreive everything the student's home page shows in one request: the enrolled and
+    waitlisted classes, the waitlist positions and the notification subscriptions.
+    The backend calls run concurrently (see dashboard.py).
+
+    Returns:
+    - dict: {"student": {...}, "enrollments": [class, ...],
+             "waitlists": [class with "position", ...], "subscriptions": [...]}
+    """
+    try:
+        dashboard = get_dashboard(student_id, first_name, last_name, dynamodb, redisdb)
+    except RedisError as e:
+        print(f"RedisError: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="INTERNAL SERVER ERROR")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=str(e))
+    else:
+        return FastJSONResponse(content=dashboard)
+    finally:
+        redisdb.close()  # Close the Redis connection
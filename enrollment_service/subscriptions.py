@@ -0,0 +1,36 @@
+"""
+Notification subscriptions: the Redis key layout, and the reads the enrollment service needs.
+
+Every subscription is stored twice:
+- The student's hash `{cwid}#{first_name}#{last_name}`: class_id -> preferences (JSON).
+- The class index `subscribers:{class_id}`: student member -> preferences (JSON).
+
+The notification service writes them (see `notification_service.subscription_store`), the
+enrollment service reads them to notify promoted students and to build the dashboard.
+"""
+import json
+from redis import Redis
+
+SUBSCRIBERS_KEY = "subscribers:{}"
+
+
+def member_name(student_id, first_name: str, last_name: str):
+    return f"{student_id}#{first_name}#{last_name}"
+
+
+def get_subscriptions(member: str, redisdb: Redis):
+    """
+    Returns:
+    - list: The student's subscriptions: [{"class_id", "email", "webhook_url"}, ...]
+    """
+    return [{**json.loads(value), "class_id": class_id.decode("utf-8")}
+            for class_id, value in redisdb.hgetall(member).items()]
+
+
+def get_class_subscribers(class_id, redisdb: Redis):
+    """
+    Returns:
+    - dict: member ("{cwid}#{first_name}#{last_name}") -> preferences, for every subscriber of the class.
+    """
+    return {member.decode("utf-8"): json.loads(value)
+            for member, value in redisdb.hgetall(SUBSCRIBERS_KEY.format(class_id)).items()}
@@ -0,0 +1,103 @@
+import uuid
+import hashlib
+from fastapi import Response
+from redis import Redis, RedisError
+from .db_connection import get_redisdb
+
+# Version counters in Redis. They are bumped after every write that changes what is listed:
+# - class: the roster, droplist & waitlist of one class.
+# - student: the classes a student is enrolled or waitlisted in.
+# - catalog: any class (seats, instructor, new & deleted classes).
+CLASS_VERSION_KEY = "version:class:{}"
+STUDENT_VERSION_KEY = "version:student:{}"
+CATALOG_VERSION_KEY = "version:catalog"
+
+# Random token that is part of every ETag. If the counters are lost (e.g. Redis is flushed),
+# a new token is created, so that ETags issued before can never match again.
+VERSION_EPOCH_KEY = "version:epoch"
+
+
+def bump_versions(class_ids=(), student_ids=(), catalog: bool = False, redisdb: Redis = None):
+    """
+    Bumps the version counters after a write. Call it once the write is committed.
+
+    Parameters:
+    - class_ids (iterable): Classes whose roster, droplist or waitlist changed.
+    - student_ids (iterable): Students whose enrollments or waitlists changed.
+    - catalog (bool): True if the listing of available classes changed.
+    - redisdb (Redis): Redis connection. If not given, a connection is opened and closed here.
+    """
+    keys = [CLASS_VERSION_KEY.format(e) for e in class_ids]
+    keys += [STUDENT_VERSION_KEY.format(e) for e in student_ids]
+    if catalog:
+        keys.append(CATALOG_VERSION_KEY)
+
+    if not keys:
+        return
+
+    connection = redisdb or get_redisdb()
+
+    try:
+        pipeline = connection.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(key)
+        pipeline.execute()
+    except RedisError as e:
+        print(f"RedisError: {e}")
+    finally:
+        if redisdb is None:
+            connection.close()
+
+
+def compute_etag(version_keys: list, *params, redisdb: Redis = None):
+    """
+    Computes a strong ETag from version counters and the request parameters.
+
+    Parameters:
+    - version_keys (list): The counters the response depends on (e.g. CATALOG_VERSION_KEY).
+    - params: Anything else the response depends on (e.g. filters, page size, cursor).
+    - redisdb (Redis): Redis connection. If not given, a connection is opened and closed here.
+
+    Returns:
+    - str: The quoted ETag, or None if the counters cannot be read.
+    """
+    connection = redisdb or get_redisdb()
+
+    try:
+        pipeline = connection.pipeline(transaction=False)
+        pipeline.set(VERSION_EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        pipeline.get(VERSION_EPOCH_KEY)
+        pipeline.mget(version_keys)
+        _, epoch, versions = pipeline.execute()
+    except RedisError as e:
+        print(f"RedisError: {e}")
+        return None
+    finally:
+        if redisdb is None:
+            connection.close()
+
+    parts = [epoch.decode("utf-8")]
+    parts += [e.decode("utf-8") if e is not None else "0" for e in versions]
+    parts += [str(e) for e in params]
+
+    return '"' + hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def is_not_modified(if_none_match: str, etag: str):
+    """
+    Returns:
+    - bool: True if the `If-None-Match` request header matches the ETag.
+    """
+    if not if_none_match or not etag:
+        return False
+
+    candidates = [e.strip() for e in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+
+    # If-None-Match uses the weak comparison
+    return any(e.removeprefix("W/") == etag for e in candidates)
+
+
+def not_modified_response(etag: str):
+    return Response(status_code=304, headers={"ETag": etag})
@@ -1,18 +1,50 @@
+import asyncio
 from fastapi import FastAPI, Depends, Header, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from http import HTTPStatus
 from redis import Redis
 from pydantic import BaseModel, Field
 from typing import Optional
-import json
 from enrollment_service.db_connection import get_redisdb
+from enrollment_service.serialization import FastJSONResponse
+from enrollment_service.metrics_router import metrics_router
+from enrollment_service.subscriptions import get_subscriptions, member_name
+from .subscription_store import subscribe, unsubscribe, SubscribeResult
+from .subscription_store import subscribe_many, unsubscribe_many, migrate_subscriptions, MigrateResult
+from .event_stream import hub, start_consumer, stream_events
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+app.include_router(metrics_router)
+
+# Maximum number of classes per batch request
+MAX_BATCH_CLASSES = 100
+
+# Per-class status of the batch requests
+SUBSCRIBE_STATUS = {
+    SubscribeResult.SUBSCRIBED: "subscribed",
+    SubscribeResult.ALREADY_SUBSCRIBED: "already_subscribed",
+    SubscribeResult.NOT_WAITLISTED: "not_waitlisted",
+}
+MIGRATE_STATUS = {
+    MigrateResult.MIGRATED: "migrated",
+    MigrateResult.NOT_SUBSCRIBED: "not_subscribed",
+    MigrateResult.NOT_WAITLISTED: "not_waitlisted",
+    MigrateResult.ALREADY_SUBSCRIBED: "already_subscribed",
+}
 
 class SubscriptionPreference(BaseModel):
     webhook_url: Optional[str] = Field(default=None, exclude=True)
     email: Optional[str] = Field(default=None, exclude=True)
 
+class BatchSubscription(SubscriptionPreference):
+    class_ids: list[str]
+
+class BatchUnsubscription(BaseModel):
+    class_ids: list[str]
+
+class SubscriptionMigration(BaseModel):
+    classes: dict[str, str] = Field(description="Old class_id -> new class_id")
+
 
 @app.post("/class/{class_id}/subscribe")
 def subscribe_notification_for_course(
@@ -27,22 +59,19 @@ def subscribe_notification_for_course(
     if not preference.webhook_url and not preference.email:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Please provide webhook_url and/or email to subscribe for notification")
 
-    member_name = f'{student_id}#{first_name}#{last_name}'    
-    is_student_waitlisted = redisdb.zrank(class_id, member_name) != None
-    
-    if not is_student_waitlisted:
+    member = member_name(student_id, first_name, last_name)
+
+    try:
+        result = subscribe(class_id, member, {"webhook_url": preference.webhook_url, "email": preference.email}, redisdb)
+    except:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail= "Something went wrong on our side!")
+
+    if result == SubscribeResult.NOT_WAITLISTED:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="User currently not waitlisted in course")
-    
-    is_subscribed = redisdb.hget(member_name, class_id) != None
-    if not is_subscribed:
-        try:                        
-            if bool(redisdb.hset(member_name, class_id, json.dumps({"webhook_url": preference.webhook_url, "email": preference.email}))):
-                return JSONResponse(status_code=HTTPStatus.OK, content={"detail" : f'successfully subscribed to class with class id {class_id}'})
-            
-        except:            
-            raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail= "Something went wrong on our side!")
-
-        
+
+    if result == SubscribeResult.SUBSCRIBED:
+        return JSONResponse(status_code=HTTPStatus.OK, content={"detail" : f'successfully subscribed to class with class id {class_id}'})
+
     raise HTTPException(status_code=HTTPStatus.CONFLICT, detail= f"User is already subscribed to notifcation for course with class id {class_id}")
 
 
@@ -54,12 +83,8 @@ def get_user_subscriptions(
     last_name: str = Header(alias="x-last-name"),
     ):
     
-    member_name = f'{student_id}#{first_name}#{last_name}'
-    
-    student_notification_subscriptions = [{
-        **json.loads(value), **{"class_id" : course.decode()}
-    } for course, value in redisdb.hgetall(member_name).items()]
-    
+    student_notification_subscriptions = get_subscriptions(member_name(student_id, first_name, last_name), redisdb)
+
     return JSONResponse(status_code=HTTPStatus.OK, content={"notification subscription" : student_notification_subscriptions})
 
 @app.delete("/class/{class_id}/unsubscribe")
@@ -71,17 +96,126 @@ def unsubscribe_notification_for_course(
     last_name: str = Header(alias="x-last-name")
     ):
 
-    member_name = f'{student_id}#{first_name}#{last_name}'
-    is_subscribed = redisdb.hget(member_name, class_id) != None
+    try:
+        unsubscribed = unsubscribe(class_id, member_name(student_id, first_name, last_name), redisdb)
+    except:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Something went wrong on our side!")
 
-    if is_subscribed:
-        try:
-            if bool(redisdb.hdel(member_name, class_id)):
-                return JSONResponse(status_code=HTTPStatus.OK, content={"detail" : f'successfully unsubscribed from class with class id {class_id}'})
+    if unsubscribed:
+        return JSONResponse(status_code=HTTPStatus.OK, content={"detail" : f'successfully unsubscribed from class with class id {class_id}'})
 
-        except:
-            raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Something went wrong on our side!")
-            
-    
     raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=f"User currently not subscribed for notifications for class with class id {class_id}")
-    
+
+
+@app.post("/subscriptions/subscribe")
+def subscribe_notification_for_courses(
+    batch: BatchSubscription,
+    redisdb: Redis = Depends(get_redisdb),
+    student_id: int = Header(alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+    first_name: str = Header(alias="x-first-name"),
+    last_name: str = Header(alias="x-last-name"),
+    ):
+    """
+    Subscribes to the notifications of many classes with the same preferences, in one round trip.
+    The waitlists of all the classes are checked and the subscriptions written atomically.
+
+    Returns:
+    - dict: {"results": [{"class_id": ..., "status": "subscribed" | "already_subscribed" | "not_waitlisted"}, ...]}
+    """
+    if not batch.webhook_url and not batch.email:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Please provide webhook_url and/or email to subscribe for notification")
+
+    if len(batch.class_ids) > MAX_BATCH_CLASSES:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"At most {MAX_BATCH_CLASSES} classes per request")
+
+    member = member_name(student_id, first_name, last_name)
+
+    try:
+        results = subscribe_many(batch.class_ids, member, {"webhook_url": batch.webhook_url, "email": batch.email}, redisdb)
+    except:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Something went wrong on our side!")
+
+    return {"results": [{"class_id": class_id, "status": SUBSCRIBE_STATUS[result]} for class_id, result in results.items()]}
+
+
+@app.post("/subscriptions/unsubscribe")
+def unsubscribe_notification_for_courses(
+    batch: BatchUnsubscription,
+    redisdb: Redis = Depends(get_redisdb),
+    student_id: int = Header(alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+    first_name: str = Header(alias="x-first-name"),
+    last_name: str = Header(alias="x-last-name"),
+    ):
+    """
+    Unsubscribes from the notifications of many classes, atomically.
+
+    Returns:
+    - dict: {"results": [{"class_id": ..., "status": "unsubscribed" | "not_subscribed"}, ...]}
+    """
+    if len(batch.class_ids) > MAX_BATCH_CLASSES:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"At most {MAX_BATCH_CLASSES} classes per request")
+
+    try:
+        results = unsubscribe_many(batch.class_ids, member_name(student_id, first_name, last_name), redisdb)
+    except:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Something went wrong on our side!")
+
+    return {"results": [{"class_id": class_id, "status": "unsubscribed" if unsubscribed else "not_subscribed"}
+                        for class_id, unsubscribed in results.items()]}
+
+
+@app.post("/subscriptions/migrate")
+def migrate_notification_subscriptions(
+    migration: SubscriptionMigration,
+    redisdb: Redis = Depends(get_redisdb),
+    student_id: int = Header(alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+    first_name: str = Header(alias="x-first-name"),
+    last_name: str = Header(alias="x-last-name"),
+    ):
+    """
+    Moves subscriptions to other classes (e.g. the same classes of the next term), keeping their preferences.
+    The student must be on the waitlist of the new classes. All the moves are done atomically.
+
+    Returns:
+    - dict: {"results": [{"class_id": ..., "new_class_id": ...,
+                          "status": "migrated" | "not_subscribed" | "not_waitlisted" | "already_subscribed"}, ...]}
+    """
+    if len(migration.classes) > MAX_BATCH_CLASSES:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"At most {MAX_BATCH_CLASSES} classes per request")
+
+    try:
+        results = migrate_subscriptions(migration.classes, member_name(student_id, first_name, last_name), redisdb)
+    except:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Something went wrong on our side!")
+
+    return {"results": [{"class_id": class_id, "new_class_id": migration.classes[class_id], "status": MIGRATE_STATUS[result]}
+                        for class_id, result in results.items()]}
+
+
+@app.on_event("startup")
+async def start_event_stream():
+    hub.attach(asyncio.get_running_loop())
+    app.state.stop_event_stream = start_consumer(hub)
+
+
+@app.on_event("shutdown")
+async def stop_event_stream():
+    app.state.stop_event_stream.set()
+
+
+@app.get("/events/stream")
+async def stream_enrollment_events(
+    student_id: int = Header(alias="x-cwid", description="A unique ID for students, instructors, and registrars"),
+    ):
+    """
+    Streams the enrollment events of the student with Server-Sent Events:
+    - `AutoEnrolledFromWaitlist`: {"event_type", "class_id"}
+    - `WaitlistPositionChanged`: {"event_type", "class_id", "position"}
+
+    The stream stays open until the client disconnects. See `notification_service/event_stream.py`.
+    """
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(stream_events(hub, student_id), media_type="text/event-stream", headers=headers)
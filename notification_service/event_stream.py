@@ -0,0 +1,176 @@
+"""
+Real-time enrollment events, streamed to connected students with Server-Sent Events.
+
+One consumer per service instance reads `waitlist_events` through its own exclusive queue
+and fans every event out in memory to the streams of the students it concerns:
+- `AutoEnrolledFromWaitlist`: to the stream of `student_cwid`.
+- `WaitlistPositionChanged`: to the stream of every CWID in `positions`, with its own position.
+
+Every stream has a queue of at most STREAM_BUFFER_SIZE events. When a slow client lets it
+fill up, its oldest event is dropped (see `event_stream.*` in `GET /metrics/`), so memory stays
+bounded whatever the number of connected clients.
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+import pika
+from enrollment_service.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_NAME = "waitlist_events"
+
+# Events kept per stream while the client is reading slowly
+STREAM_BUFFER_SIZE = 64
+
+# A comment line is sent after that many seconds without events, so proxies keep the stream open
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Delay before reconnecting to RabbitMQ after the connection is lost
+RECONNECT_DELAY_SECONDS = 5
+
+
+class EventHub:
+    """
+    The open streams of this service instance, per CWID.
+
+    All the methods but `publish_threadsafe` must be called from the event loop.
+    """
+
+    def __init__(self):
+        self._loop = None
+        # CWID -> set of asyncio.Queue
+        self._streams = {}
+        self._num_streams = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def open_stream(self, cwid: int):
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER_SIZE)
+        self._streams.setdefault(cwid, set()).add(queue)
+
+        self._num_streams += 1
+        metrics.set_gauge("event_stream.open", self._num_streams)
+        return queue
+
+    def close_stream(self, cwid: int, queue: asyncio.Queue):
+        queues = self._streams.get(cwid)
+        if queues is None or queue not in queues:
+            return
+
+        queues.discard(queue)
+        if not queues:
+            del self._streams[cwid]
+
+        self._num_streams -= 1
+        metrics.set_gauge("event_stream.open", self._num_streams)
+
+    def publish_threadsafe(self, event: dict):
+        """
+        Hands an event over to the event loop. Called by the RabbitMQ consumer thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.publish, event)
+
+    def publish(self, event: dict):
+        """
+        Delivers an event to the streams of the students it concerns.
+        """
+        metrics.increment("event_stream.received")
+
+        for cwid, student_event in split_event(event):
+            for queue in self._streams.get(cwid, ()):
+                if queue.full():
+                    queue.get_nowait()
+                    metrics.increment("event_stream.dropped")
+
+                queue.put_nowait(student_event)
+                metrics.increment("event_stream.delivered")
+
+
+def split_event(event: dict):
+    """
+    Splits an event of the exchange into the events of each student.
+
+    Returns:
+    - list: [(cwid, event), ...]
+    """
+    event_type = event.get("event_type")
+
+    if event_type == "AutoEnrolledFromWaitlist" and "student_cwid" in event:
+        return [(int(event["student_cwid"]), {"event_type": event_type, "class_id": event["class_id"]})]
+
+    if event_type == "WaitlistPositionChanged":
+        return [(int(cwid), {"event_type": event_type, "class_id": event["class_id"], "position": position})
+                for cwid, position in event.get("positions", {}).items()]
+
+    return []
+
+
+async def stream_events(hub: EventHub, cwid: int):
+    """
+    Yields the Server-Sent Events of a student until the client disconnects.
+    """
+    queue = hub.open_stream(cwid)
+
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+            else:
+                yield f"event: {event['event_type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        hub.close_stream(cwid, queue)
+
+
+def consume(hub: EventHub, stop: threading.Event):
+    """
+    Feeds the hub with the events of `waitlist_events` until `stop` is set.
+    Runs in its own thread, and reconnects whenever RabbitMQ goes away.
+    """
+    def on_message(channel, method, properties, body):
+        try:
+            hub.publish_threadsafe(json.loads(body.decode("utf-8")))
+        except json.decoder.JSONDecodeError as e:
+            logger.error(f"Malformed event: {e}")
+
+    while not stop.is_set():
+        try:
+            connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+            channel = connection.channel()
+
+            channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type="topic")
+
+            # A queue of our own, deleted with the connection: every instance sees every event
+            queue_name = channel.queue_declare(queue="", exclusive=True).method.queue
+            channel.queue_bind(exchange=EXCHANGE_NAME, queue=queue_name, routing_key="#")
+            channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=True)
+
+            try:
+                while not stop.is_set():
+                    connection.process_data_events(time_limit=1)
+            finally:
+                connection.close()
+        except pika.exceptions.AMQPError as e:
+            logger.error(f"Event stream consumer disconnected: {e}")
+            time.sleep(RECONNECT_DELAY_SECONDS)
+
+
+def start_consumer(hub: EventHub):
+    """
+    Starts the RabbitMQ consumer of the hub in a daemon thread.
+
+    Returns:
+    - threading.Event: Set it to stop the consumer.
+    """
+    stop = threading.Event()
+    threading.Thread(target=consume, args=(hub, stop), name="event-stream-consumer", daemon=True).start()
+    return stop
+
+
+hub = EventHub()
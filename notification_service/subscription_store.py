@@ -0,0 +1,251 @@
+"""
+Notification subscriptions, kept in Redis.
+
+Every subscription is stored twice (see `enrollment_service.subscriptions` for the key layout
+& the reads), and both copies are written by one Lua script:
+- The student's hash `{cwid}#{first_name}#{last_name}`: class_id -> preferences (JSON).
+- The class index `subscribers:{class_id}`: student member -> preferences (JSON).
+
+The student's hash lists a student's subscriptions, the class index lists the subscribers
+of a class in one HGETALL (e.g. to notify promoted students). Subscribe & unsubscribe are
+a single round trip each, for one class or for many (the batch scripts check the waitlists
+of all the classes and write all the subscriptions atomically).
+
+Subscriptions stored before the class index existed are indexed with:
+```
+python3 -m notification_service.subscription_store --rebuild-index
+```
+"""
+import json
+import argparse
+from redis import Redis
+from enrollment_service.db_connection import get_redisdb
+from enrollment_service.subscriptions import SUBSCRIBERS_KEY
+
+
+class SubscribeResult:
+    SUBSCRIBED = 1
+    ALREADY_SUBSCRIBED = 0
+    NOT_WAITLISTED = -1
+
+
+class MigrateResult:
+    MIGRATED = 1
+    NOT_SUBSCRIBED = 0
+    NOT_WAITLISTED = -1
+    ALREADY_SUBSCRIBED = -2
+
+
+# KEYS: student's hash, class index, waitlist of the class
+# ARGV: class_id, member, preferences
+# Returns a SubscribeResult.
+SUBSCRIBE_SCRIPT = """
+if not redis.call('ZRANK', KEYS[3], ARGV[2]) then
+    return -1
+end
+
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[3]) == 0 then
+    return 0
+end
+
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+return 1
+"""
+
+# KEYS: student's hash, class index
+# ARGV: class_id, member
+# Returns 1 if the student was subscribed.
+UNSUBSCRIBE_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+
+redis.call('HDEL', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: student's hash, then the class index & the waitlist of every class
+# ARGV: member, preferences, then the class_id of every class
+# Returns a SubscribeResult per class.
+BATCH_SUBSCRIBE_SCRIPT = """
+local results = {}
+
+for i = 3, #ARGV do
+    local index = KEYS[2 * i - 4]
+    local waitlist = KEYS[2 * i - 3]
+
+    if not redis.call('ZRANK', waitlist, ARGV[1]) then
+        results[#results + 1] = -1
+    elseif redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[2]) == 0 then
+        results[#results + 1] = 0
+    else
+        redis.call('HSET', index, ARGV[1], ARGV[2])
+        results[#results + 1] = 1
+    end
+end
+
+return results
+"""
+
+# KEYS: student's hash, then the class index of every class
+# ARGV: member, then the class_id of every class
+# Returns 1 per class the student was subscribed to, else 0.
+BATCH_UNSUBSCRIBE_SCRIPT = """
+local results = {}
+
+for i = 2, #ARGV do
+    if redis.call('HDEL', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HDEL', KEYS[i], ARGV[1])
+        results[#results + 1] = 1
+    else
+        results[#results + 1] = 0
+    end
+end
+
+return results
+"""
+
+# KEYS: student's hash, then the index of the old class, the index & the waitlist of the new class per pair
+# ARGV: member, then the old class_id & the new class_id of every pair
+# Returns a MigrateResult per pair.
+MIGRATE_SCRIPT = """
+local results = {}
+local k = 2
+
+for i = 2, #ARGV, 2 do
+    local old_index, new_index, new_waitlist = KEYS[k], KEYS[k + 1], KEYS[k + 2]
+    k = k + 3
+    local preferences = redis.call('HGET', KEYS[1], ARGV[i])
+
+    if not preferences then
+        results[#results + 1] = 0
+    elseif not redis.call('ZRANK', new_waitlist, ARGV[1]) then
+        results[#results + 1] = -1
+    elseif redis.call('HSETNX', KEYS[1], ARGV[i + 1], preferences) == 0 then
+        results[#results + 1] = -2
+    else
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        redis.call('HDEL', old_index, ARGV[1])
+        redis.call('HSET', new_index, ARGV[1], preferences)
+        results[#results + 1] = 1
+    end
+end
+
+return results
+"""
+
+
+def subscribe(class_id, member: str, preferences: dict, redisdb: Redis):
+    """
+    Subscribes a student on the waitlist of a class to its notifications.
+
+    Returns:
+    - int: A SubscribeResult.
+    """
+    script = redisdb.register_script(SUBSCRIBE_SCRIPT)
+    return script(keys=[member, SUBSCRIBERS_KEY.format(class_id), class_id],
+                  args=[class_id, member, json.dumps(preferences)])
+
+
+def unsubscribe(class_id, member: str, redisdb: Redis):
+    """
+    Returns:
+    - bool: True if the student was subscribed.
+    """
+    script = redisdb.register_script(UNSUBSCRIBE_SCRIPT)
+    return script(keys=[member, SUBSCRIBERS_KEY.format(class_id)], args=[class_id, member]) == 1
+
+
+def subscribe_many(class_ids: list, member: str, preferences: dict, redisdb: Redis):
+    """
+    Subscribes a student to the notifications of many classes, with the same preferences.
+
+    Returns:
+    - dict: class_id -> SubscribeResult. Duplicated class_ids are subscribed once.
+    """
+    class_ids = list(dict.fromkeys(class_ids))
+    if not class_ids:
+        return {}
+
+    keys = [member]
+    for class_id in class_ids:
+        keys += [SUBSCRIBERS_KEY.format(class_id), class_id]
+
+    script = redisdb.register_script(BATCH_SUBSCRIBE_SCRIPT)
+    results = script(keys=keys, args=[member, json.dumps(preferences), *class_ids])
+    return dict(zip(class_ids, results))
+
+
+def unsubscribe_many(class_ids: list, member: str, redisdb: Redis):
+    """
+    Returns:
+    - dict: class_id -> True if the student was subscribed.
+    """
+    class_ids = list(dict.fromkeys(class_ids))
+    if not class_ids:
+        return {}
+
+    keys = [member] + [SUBSCRIBERS_KEY.format(class_id) for class_id in class_ids]
+
+    script = redisdb.register_script(BATCH_UNSUBSCRIBE_SCRIPT)
+    results = script(keys=keys, args=[member, *class_ids])
+    return {class_id: result == 1 for class_id, result in zip(class_ids, results)}
+
+
+def migrate_subscriptions(class_map: dict, member: str, redisdb: Redis):
+    """
+    Moves a student's subscriptions from classes to other classes (e.g. the same classes of the
+    next term), keeping the preferences. The student must be on the waitlist of the new classes.
+
+    Parameters:
+    - class_map (dict): old class_id -> new class_id.
+
+    Returns:
+    - dict: old class_id -> MigrateResult.
+    """
+    if not class_map:
+        return {}
+
+    keys = [member]
+    args = [member]
+    for old_class_id, new_class_id in class_map.items():
+        keys += [SUBSCRIBERS_KEY.format(old_class_id), SUBSCRIBERS_KEY.format(new_class_id), new_class_id]
+        args += [old_class_id, new_class_id]
+
+    script = redisdb.register_script(MIGRATE_SCRIPT)
+    results = script(keys=keys, args=args)
+    return dict(zip(class_map, results))
+
+
+def rebuild_class_index(redisdb: Redis):
+    """
+    Indexes the subscriptions of every student's hash by class.
+
+    Returns:
+    - int: The number of subscriptions indexed.
+    """
+    num_indexed = 0
+
+    for member in redisdb.scan_iter(match="*#*#*", _type="HASH"):
+        subscriptions = redisdb.hgetall(member)
+
+        pipeline = redisdb.pipeline(transaction=False)
+        for class_id, preferences in subscriptions.items():
+            pipeline.hset(SUBSCRIBERS_KEY.format(class_id.decode("utf-8")), member, preferences)
+        pipeline.execute()
+
+        num_indexed += len(subscriptions)
+
+    return num_indexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the notification subscription store.")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Index the existing subscriptions by class.")
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        print(f"Indexed {rebuild_class_index(get_redisdb())} subscription(s)")
+    else:
+        parser.print_help()
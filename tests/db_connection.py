@@ -11,6 +11,7 @@ class TableNames:
     ENROLLMENTS = "Enrollments"
     DROPLIST = "Droplist"
     PERSONNEL = "Personnel"
+    SEAT_SHARDS = "ClassSeatShards"
 
 
 class Settings(BaseSettings, env_file=".env", extra="ignore"):
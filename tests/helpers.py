@@ -126,12 +126,14 @@ def create_class(dept_code, course_no, section_no, academic_year, semester,
     response = requests.post(url, headers=headers, json=body)
     return response
 
-def enroll_class(class_id, access_token):
+def enroll_class(class_id, access_token, idempotency_key=None):
     # Prepare header & message body
     headers = {
         "Content-Type": "application/json;",
         "Authorization": f"Bearer {access_token}"
     }
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
     body = {
         "class_id": class_id
     }
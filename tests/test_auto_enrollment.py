@@ -7,6 +7,7 @@ from tests.webhook_service import WebhookTestService
 import pika
 import time
 import json
+import threading
 
 class AutoEnrollmentTest(unittest.TestCase):
     # Flag to indicate if a message was received
@@ -19,16 +20,16 @@ class AutoEnrollmentTest(unittest.TestCase):
         unittest_tearDown()
 
     # ---------------- Helper Functions ----------------
-    def purge_rabbitmq_queue(self, exchange_name, queue_name):
+    def purge_rabbitmq_queue(self, exchange_name, queue_name, binding_key):
         connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
         channel = connection.channel()
 
-        # Declare a fanout exchange
-        channel.exchange_declare(exchange=exchange_name, exchange_type='fanout')
+        # Declare a topic exchange
+        channel.exchange_declare(exchange=exchange_name, exchange_type='topic')
 
-        # Declare a queue and bind it to the fanout exchange
+        # Declare a queue and bind it to the topic exchange
         channel.queue_declare(queue=queue_name)
-        channel.queue_bind(exchange=exchange_name, queue=queue_name)
+        channel.queue_bind(exchange=exchange_name, queue=queue_name, routing_key=binding_key)
 
         # Purge the queue
         channel.queue_purge(queue=queue_name)
@@ -36,17 +37,17 @@ class AutoEnrollmentTest(unittest.TestCase):
         # Close connection
         connection.close()
 
-    def receive_from_fanout_exchange(self, exchange_name, queue_name, on_message_callback, timeout_seconds=10):
+    def receive_from_topic_exchange(self, exchange_name, queue_name, binding_key, on_message_callback, timeout_seconds=10):
         connection = pika.BlockingConnection(
             pika.ConnectionParameters('localhost'))
         channel = connection.channel()
 
-        # Declare a fanout exchange
-        channel.exchange_declare(exchange=exchange_name, exchange_type='fanout')
+        # Declare a topic exchange
+        channel.exchange_declare(exchange=exchange_name, exchange_type='topic')
 
-        # Declare a queue and bind it to the fanout exchange
+        # Declare a queue and bind it to the topic exchange
         channel.queue_declare(queue=queue_name)
-        channel.queue_bind(exchange=exchange_name, queue=queue_name)
+        channel.queue_bind(exchange=exchange_name, queue=queue_name, routing_key=binding_key)
 
         # Set up the callback function for handling incoming messages
         channel.basic_consume(
@@ -153,7 +154,7 @@ class AutoEnrollmentTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
 
         # RabbitMQ: Purge the queue
-        self.purge_rabbitmq_queue("waitlist_exchange", "email")
+        self.purge_rabbitmq_queue("waitlist_events", "email", "AutoEnrolledFromWaitlist.email.*")
 
         # BEFORE TEST: Get number of students on the waitlist before sending the request
         rdb = get_redisdb()
@@ -179,11 +180,15 @@ class AutoEnrollmentTest(unittest.TestCase):
         self.assertEqual(count2, 1)
 
         received_email = None
+        received_routing_key = None
 
         def callback(channel, method, properties, body):            
             # Flag to indicate if a message was received
             self.message_received = True
 
+            nonlocal received_routing_key
+            received_routing_key = method.routing_key
+
             try:
                 data = json.loads(body)
                 if "email" in data:
@@ -198,11 +203,13 @@ class AutoEnrollmentTest(unittest.TestCase):
             channel.basic_ack(delivery_tag=method.delivery_tag)
 
         # RabbitMQ: Wait for the incoming message
-        msg_received = self.receive_from_fanout_exchange("waitlist_exchange", "email", callback, 15)
+        msg_received = self.receive_from_topic_exchange("waitlist_events", "email", "AutoEnrolledFromWaitlist.email.*",
+                                                        callback, 15)
         
         # ------------------------- Assert -------------------------
         self.assertTrue(msg_received)
         self.assertEqual(received_email, subscribed_email)
+        self.assertEqual(received_routing_key, "AutoEnrolledFromWaitlist.email.none")
 
     def test_webhook_dispatcher(self):
         # ------------------- Create sample data -------------------
@@ -283,6 +290,47 @@ class AutoEnrollmentTest(unittest.TestCase):
 
         
 
+    def test_event_stream(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Student 1 enrolls, Student 2 is waitlisted
+        enroll_class(class_id, users.student1.access_token)
+        enroll_class(class_id, users.student2.access_token)
+
+        # ------------- Student 2 opens the event stream -----------
+        events = []
+
+        def read_stream():
+            headers = {"Authorization": f"Bearer {users.student2.access_token}"}
+            with requests.get(f'{BASE_URL}/api/events/stream', headers=headers, stream=True, timeout=15) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("data: "):
+                        events.append(json.loads(line[len("data: "):]))
+                        return
+
+        reader = threading.Thread(target=read_stream, daemon=True)
+        reader.start()
+        time.sleep(1) # Wait for the stream to be open
+
+        # ------------------ Student 1 drops class -----------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.student1.access_token}"
+        }
+        response = requests.delete(f'{BASE_URL}/api/enrollment/{class_id}/', headers=headers)
+
+        reader.join(15)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(events, [{"event_type": "AutoEnrolledFromWaitlist", "class_id": class_id}])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,3 +1,4 @@
+import json
 import unittest
 import requests
 from tests.helpers import *
@@ -100,6 +101,73 @@ class CurrentEnrollmentTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 1)
 
+    def test_get_current_enrollment_as_ndjson_pages(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Students 1 & 2 enroll
+        response = enroll_class(class_id, users.student1.access_token)
+        response = enroll_class(class_id, users.student2.access_token)
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.instructor.access_token}"
+        }
+
+        # Send request
+        url = f'{BASE_URL}/api/classes/{class_id}/students/'
+        response1 = requests.get(url, headers=headers, params={"format": "ndjson", "limit": 1})
+        response2 = requests.get(url, headers=headers, params={"format": "ndjson", "limit": 1,
+                                                               "cursor": response1.headers["X-Next-Cursor"]})
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response2.status_code, 200)
+
+        students = [json.loads(line) for line in (response1.text + response2.text).splitlines() if line]
+        self.assertEqual(len(students), 2)
+        self.assertNotEqual(students[0]["student_cwid"], students[1]["student_cwid"])
+
+    def test_get_current_enrollment_not_modified(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Student 1 enrolls
+        response = enroll_class(class_id, users.student1.access_token)
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.instructor.access_token}"
+        }
+
+        # Send request
+        url = f'{BASE_URL}/api/classes/{class_id}/students/'
+        response1 = requests.get(url, headers=headers)
+        etag = response1.headers["ETag"]
+        response2 = requests.get(url, headers={**headers, "If-None-Match": etag})
+
+        # Student 2 enrolls. The roster changed.
+        response = enroll_class(class_id, users.student2.access_token)
+        response3 = requests.get(url, headers={**headers, "If-None-Match": etag})
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response2.status_code, 304)
+        self.assertEqual(response3.status_code, 200)
+        self.assertEqual(len(response3.json()), 2)
+
     def test_drop_student_administratively(self):
         # ------------------- Create sample data -------------------
         # Register new users & Login
@@ -127,6 +195,42 @@ class CurrentEnrollmentTest(unittest.TestCase):
         self.assertEqual(response1.status_code, 200)
         self.assertEqual(response2.status_code, 404)
 
+    def test_drop_students_administratively(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 2, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Both students enroll
+        enroll_class(class_id, users.student1.access_token)
+        enroll_class(class_id, users.student2.access_token)
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.instructor.access_token}"
+        }
+        body = {"cwids": [users.student1.id, users.student2.id, 424242]}
+
+        # Send request
+        url = f'{BASE_URL}/api/enrollment/{class_id}/administratively/'
+        response = requests.post(url, headers=headers, json=body)
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+        statuses = {e["cwid"]: e["status"] for e in response.json()}
+        self.assertEqual(statuses, {users.student1.id: "dropped",
+                                    users.student2.id: "dropped",
+                                    424242: "failed"})
+
+        url = f'{BASE_URL}/api/classes/{class_id}/droplist/'
+        response = requests.get(url, headers=headers)
+        self.assertEqual(len(response.json()), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -240,6 +240,36 @@ class SubscribeTest(unittest.TestCase):
         self.assertEqual(response2.status_code, 409)
 
 
+    def test_subscription_indexed_by_class(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class. Student 2 is waitlisted.
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        enroll_class(class_id, users.student1.access_token)
+        enroll_class(class_id, users.student2.access_token)
+
+        # -------------------- Make API requests --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.student2.access_token}"
+        }
+        body = {"email": "john@fullerton.edu"}
+
+        requests.post(f'{BASE_URL}/api/class/{class_id}/subscribe', headers=headers, json=body)
+        subscribers_after_subscribe = get_redisdb().hgetall(f"subscribers:{class_id}")
+
+        requests.delete(f'{BASE_URL}/api/class/{class_id}/unsubscribe', headers=headers)
+        subscribers_after_unsubscribe = get_redisdb().hgetall(f"subscribers:{class_id}")
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(len(subscribers_after_subscribe), 1)
+        self.assertEqual(subscribers_after_unsubscribe, {})
+
+
 class UnsubscribeTest(unittest.TestCase):
     def setUp(self):
         unittest_setUp()
@@ -312,6 +342,49 @@ class UnsubscribeTest(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class BatchSubscriptionTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_batch_subscribe_and_unsubscribe(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create 2 classes. Student 2 is waitlisted in both.
+        class_ids = []
+        for section_no in (2, 3):
+            response = create_class("SOC", 301, section_no, 2024, "FA", 1, 1, users.registrar.access_token)
+            class_ids.append(response.json()["inserted_id"])
+
+            enroll_class(class_ids[-1], users.student1.access_token)
+            enroll_class(class_ids[-1], users.student2.access_token)
+
+        # -------------------- Make API requests --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.student2.access_token}"
+        }
+        body = {"class_ids": class_ids + ["SOC-999"], "email": "john@fullerton.edu"}
+
+        subscribe_response = requests.post(f'{BASE_URL}/api/subscriptions/subscribe', headers=headers, json=body)
+        resubscribe_response = requests.post(f'{BASE_URL}/api/subscriptions/subscribe', headers=headers, json=body)
+        unsubscribe_response = requests.post(f'{BASE_URL}/api/subscriptions/unsubscribe', headers=headers,
+                                             json={"class_ids": class_ids})
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(subscribe_response.status_code, 200)
+        self.assertEqual([e["status"] for e in subscribe_response.json()["results"]],
+                         ["subscribed", "subscribed", "not_waitlisted"])
+        self.assertEqual([e["status"] for e in resubscribe_response.json()["results"]],
+                         ["already_subscribed", "already_subscribed", "not_waitlisted"])
+        self.assertEqual([e["status"] for e in unsubscribe_response.json()["results"]],
+                         ["unsubscribed", "unsubscribed"])
+
+
 class GetSubscriptionTest(unittest.TestCase):
     def setUp(self):
         unittest_setUp()
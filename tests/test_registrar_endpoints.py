@@ -1,3 +1,4 @@
+import json
 import unittest
 import requests
 from tests.helpers import *
@@ -262,6 +263,135 @@ class CreateClassTest(unittest.TestCase):
         
         # ------------------------- Assert -------------------------
         self.assertEqual(response.status_code, 404)
-    
+
+class BulkEnrollmentTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_bulk_enrollment(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class with one seat
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.registrar.access_token}"
+        }
+        body = {
+            "placements": [
+                {"class_id": class_id, "cwid": 3},
+                {"class_id": class_id, "cwid": 2},
+                {"class_id": class_id, "cwid": 424242}
+            ]
+        }
+
+        # Send request
+        url = f'{BASE_URL}/api/enrollment/bulk/'
+        response = requests.post(url, headers=headers, json=body)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 200)
+
+        results = [json.loads(line) for line in response.text.splitlines() if line]
+        statuses = {e["cwid"]: e["status"] for e in results}
+
+        self.assertEqual(statuses, {3: "enrolled", 2: "waitlisted", 424242: "failed"})
+
+class BulkImportTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_import_classes_csv(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "text/csv",
+            "Authorization": f"Bearer {users.registrar.access_token}"
+        }
+        body = "\n".join([
+            "department_code,course_no,section_no,year,semester,instructor_cwid,room_capacity",
+            "SOC,301,2,2024,FA,1,10",
+            "SOC,301,2,2024,FA,1,10",
+            "XXXX,999,1,2024,FA,1,10",
+            "SOC,301,3,2024,FA,1,not-a-number"
+        ])
+
+        # Send request
+        url = f'{BASE_URL}/api/import/classes/?format=csv'
+        response = requests.post(url, headers=headers, data=body)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 200)
+
+        summary = response.json()
+        self.assertEqual(summary["imported"], 1)
+        self.assertEqual(summary["failed"], 3)
+        self.assertEqual([e["row"] for e in summary["errors"]], [2, 3, 4])
+
+class ClassShardsTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_sharded_class(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class with one seat
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.registrar.access_token}"
+        }
+        url = f'{BASE_URL}/api/classes/{class_id}/shards/'
+
+        # -------------------- Make API request --------------------
+        # Split the seat over 2 shards, then fill it
+        response = requests.put(url, headers=headers, json={"shard_count": 2})
+        self.assertEqual(response.status_code, 200)
+
+        response = enroll_class(class_id, users.student1.access_token)
+        self.assertEqual(response.json()["detail"], "Enrolled successfully")
+
+        response = enroll_class(class_id, users.student2.access_token)
+        self.assertEqual(response.json()["detail"], "Successfully placed on the waitlist")
+
+        # Fold the shards back into the class
+        response = requests.put(url, headers=headers, json={"shard_count": 0})
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 200)
+
+        dynamodb = get_dynamodb()
+        class_item = dynamodb.Table(TableNames.CLASSES).get_item(Key={"id": class_id})["Item"]
+        self.assertEqual(class_item["enrollment_count"], 1)
+        self.assertNotIn("shard_count", class_item)
+
+        shards = dynamodb.Table(TableNames.SEAT_SHARDS).query(KeyConditionExpression=Key("class_id").eq(class_id))
+        self.assertEqual(shards["Items"], [])
+
+        # Out of range
+        response = requests.put(url, headers=headers, json={"shard_count": 1000})
+        self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -2,7 +2,8 @@ import unittest
 import requests
 from tests.helpers import *
 from tests.settings import BASE_URL
-from tests.db_connection import get_redisdb
+from concurrent.futures import ThreadPoolExecutor
+from tests.db_connection import get_redisdb, get_dynamodb, TableNames
 
 class ClassTest(unittest.TestCase):
     def setUp(self):
@@ -37,6 +38,36 @@ class ClassTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 2)
 
+    def test_get_available_class_filtered_and_paginated(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # -------------------- Make API request --------------------
+        headers = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.student1.access_token}"
+        }
+
+        # Send request: Filter by department
+        url = f'{BASE_URL}/api/classes/available/?department_code=SOC'
+        response1 = requests.get(url, headers=headers)
+
+        # Send request: First page of one class
+        url = f'{BASE_URL}/api/classes/available/?limit=1'
+        response2 = requests.get(url, headers=headers)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual([e["id"] for e in response1.json()], [class_id])
+        self.assertEqual(response2.status_code, 200)
+        self.assertEqual(len(response2.json()), 1)
+        self.assertIn("X-Next-Cursor", response2.headers)
+
 class EnrollmentTest(unittest.TestCase):
     def setUp(self):
         unittest_setUp()
@@ -77,6 +108,25 @@ class EnrollmentTest(unittest.TestCase):
         # ------------------------- Assert -------------------------
         self.assertEqual(response.status_code, 409)
 
+    def test_enroll_with_idempotency_key(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Student 1 enrolls, then the request is retried with the same key
+        response1 = enroll_class(class_id, users.student1.access_token, idempotency_key="enroll-1")
+        response2 = enroll_class(class_id, users.student1.access_token, idempotency_key="enroll-1")
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response1.status_code, 201)
+        self.assertEqual(response2.status_code, 201)
+        self.assertEqual(response2.json(), response1.json())
+        self.assertEqual(response2.headers.get("Idempotent-Replayed"), "true")
+
     def test_enroll_nonexisting_class(self):
         # ------------------- Create sample data -------------------
         # Register new users & Login
@@ -132,6 +182,138 @@ class EnrollmentTest(unittest.TestCase):
 
         # ------------------------- Assert -------------------------
         self.assertEqual(response.status_code, 409)
+
+    def test_place_on_waitlist_after_reseed(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login. Their claims get synchronized.
+        users = create_sample_users()
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+        enroll_class(class_id, users.student1.access_token)
+        enroll_class(class_id, users.student2.access_token)
+
+        # Reseed right away: the Personnel items are gone, the same users come back
+        unittest_setUp()
+        users = create_sample_users()
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # Student 1 takes the only seat, student 2 joins the waitlist
+        response1 = enroll_class(class_id, users.student1.access_token)
+        response2 = enroll_class(class_id, users.student2.access_token)
+
+        # ------------------------- Assert -------------------------
+        rdb = get_redisdb()
+
+        self.assertEqual(response1.status_code, 201)
+        self.assertEqual(response2.status_code, 201)
+        self.assertEqual(rdb.zcard(class_id), 1)
+
+class EnrollOutcomeTest(unittest.TestCase):
+    """
+    The outcomes of `POST /enrollment/`: one conditional transaction (or the read-then-enroll
+    path when FAST_ENROLL is off), whichever the service runs with.
+    """
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_enrolled(self):
+        # ------------------- Create sample data -------------------
+        users = create_sample_users()
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # -------------------- Make API request --------------------
+        response = enroll_class(class_id, users.student1.access_token)
+
+        # ------------------------- Assert -------------------------
+        item = get_dynamodb().Table(TableNames.CLASSES).get_item(Key={"id": class_id})["Item"]
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["detail"], "Enrolled successfully")
+        self.assertEqual(int(item["enrollment_count"]), 1)
+
+    def test_full_class_places_on_waitlist(self):
+        # ------------------- Create sample data -------------------
+        users = create_sample_users()
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+        enroll_class(class_id, users.student1.access_token)
+
+        # -------------------- Make API request --------------------
+        response = enroll_class(class_id, users.student2.access_token)
+
+        # ------------------------- Assert -------------------------
+        rdb = get_redisdb()
+        waitlist = [m.decode("utf-8").split("#")[0] for m in rdb.zrange(class_id, 0, -1)]
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["detail"], "Successfully placed on the waitlist")
+        self.assertEqual(waitlist, [str(users.student2.id)])
+
+    def test_unknown_class(self):
+        # ------------------- Create sample data -------------------
+        users = create_sample_users()
+
+        # -------------------- Make API request --------------------
+        response = enroll_class("2024.FA.SOC.301.99", users.student1.access_token)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["detail"], "Class Not Found")
+
+    def test_already_enrolled(self):
+        # ------------------- Create sample data -------------------
+        users = create_sample_users()
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 10, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+        enroll_class(class_id, users.student1.access_token)
+
+        # -------------------- Make API request --------------------
+        response = enroll_class(class_id, users.student1.access_token)
+
+        # ------------------------- Assert -------------------------
+        item = get_dynamodb().Table(TableNames.CLASSES).get_item(Key={"id": class_id})["Item"]
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["detail"], "Already enrolled")
+        self.assertEqual(int(item["enrollment_count"]), 1)
+
+    def test_concurrent_enrollments_do_not_overbook(self):
+        # ------------------- Create sample data -------------------
+        users = create_sample_users()
+
+        # More students, all racing for the last seat
+        access_tokens = []
+        for i in range(10):
+            username = f"racer{i}@csu.fullerton.edu"
+            user_register(900100 + i, username, "1234", "racer", str(i), ["Student"])
+            access_tokens.append(user_login(username, password="1234"))
+
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # -------------------- Make API request --------------------
+        with ThreadPoolExecutor(max_workers=len(access_tokens)) as executor:
+            responses = list(executor.map(lambda token: enroll_class(class_id, token), access_tokens))
+
+        # ------------------------- Assert -------------------------
+        details = [r.json().get("detail") for r in responses]
+        item = get_dynamodb().Table(TableNames.CLASSES).get_item(Key={"id": class_id})["Item"]
+
+        # Conflicting transactions may be canceled (409), but the seat is never given twice
+        self.assertEqual(details.count("Enrolled successfully"), 1)
+        self.assertEqual(int(item["enrollment_count"]), 1)
+        self.assertEqual(get_redisdb().zcard(class_id), details.count("Successfully placed on the waitlist"))
+
 class DropClassTest(unittest.TestCase):
     def setUp(self):
         unittest_setUp()
@@ -302,5 +484,72 @@ class WaitlistTest(unittest.TestCase):
         # ------------------------- Assert -------------------------
         self.assertEqual(response.status_code, 200)
 
+class SeatHoldTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_hold_and_confirm_seat(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class with one seat
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        # -------------------- Make API request --------------------
+        headers1 = {
+            "Content-Type": "application/json;",
+            "Authorization": f"Bearer {users.student1.access_token}"
+        }
+
+        # Student 1 holds the seat
+        response_hold = requests.post(f'{BASE_URL}/api/holds/', headers=headers1, json={"class_id": class_id})
+
+        # Student 2 cannot take the held seat, and is placed on the waitlist
+        response_enroll = enroll_class(class_id, users.student2.access_token)
+
+        # Student 1 confirms
+        response_confirm = requests.post(f'{BASE_URL}/api/holds/{class_id}/confirm/', headers=headers1)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response_hold.status_code, 201)
+        self.assertEqual(response_enroll.json()["detail"], "Successfully placed on the waitlist")
+        self.assertEqual(response_confirm.status_code, 201)
+
+class DashboardTest(unittest.TestCase):
+    def setUp(self):
+        unittest_setUp()
+
+    def tearDown(self):
+        unittest_tearDown()
+
+    def test_get_dashboard(self):
+        # ------------------- Create sample data -------------------
+        # Register new users & Login
+        users = create_sample_users()
+
+        # Create a class with one seat. Student 1 enrolls, student 2 is waitlisted.
+        response = create_class("SOC", 301, 2, 2024, "FA", 1, 1, users.registrar.access_token)
+        class_id = response.json()["inserted_id"]
+
+        enroll_class(class_id, users.student1.access_token)
+        enroll_class(class_id, users.student2.access_token)
+
+        # -------------------- Make API request --------------------
+        headers = {"Authorization": f"Bearer {users.student2.access_token}"}
+        response = requests.get(f'{BASE_URL}/api/dashboard/', headers=headers)
+
+        # ------------------------- Assert -------------------------
+        self.assertEqual(response.status_code, 200)
+
+        dashboard = response.json()
+        self.assertEqual(dashboard["enrollments"], [])
+        self.assertEqual([(e["id"], e["position"]) for e in dashboard["waitlists"]], [(class_id, 1)])
+        self.assertEqual(dashboard["subscriptions"], [])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import time
+import asyncio
 import threading
+from typing import Union
 from fastapi import FastAPI
 
 import os
@@ -52,16 +54,24 @@ class ServiceManager:
 
 
 class WebhookTestService:
-    def __init__(self, port=8000):
+    def __init__(self, port=8000, delay_seconds=0, shutdown_timer=30):
         self.incoming_data = list()
         
         # Create a service manager
-        self.manager = ServiceManager(port=port, shutdown_timer=30)
+        self.manager = ServiceManager(port=port, shutdown_timer=shutdown_timer)
 
         # FastAPI routes
         @self.manager.app.post("/webhook")
-        async def post_data(data: dict):
-            self.incoming_data.append(data)
+        async def post_data(data: Union[dict, list]):
+            # Optional. Answer slowly, like an overloaded endpoint
+            if delay_seconds:
+                await asyncio.sleep(delay_seconds)
+
+            # A list is a batch of events
+            if isinstance(data, list):
+                self.incoming_data.extend(data)
+            else:
+                self.incoming_data.append(data)
             return {"message": "Webhook received"}
         
         @self.manager.app.get("/webhook")
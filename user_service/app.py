@@ -14,6 +14,7 @@ import base64
 
 from fastapi import FastAPI, Depends, Response, HTTPException, status, Path
 from .db_connection import get_db, get_db_replicas
+from .serialization import FastJSONResponse
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
@@ -31,7 +32,7 @@ class UserLoginModel(BaseModel):
     username: str
     password: str    
 
-app = FastAPI()    
+app = FastAPI(default_response_class=FastJSONResponse)
  
 def hash_password(password, salt=None, iterations=260000):
     if salt is None:
@@ -0,0 +1,42 @@
+"""
+JSON responses of the user service, rendered with orjson when it is installed, otherwise
+with the standard json module.
+
+The user service deploys on its own: it keeps this copy rather than importing the one of
+the enrollment service, which also encodes DynamoDB types.
+"""
+import json
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        """
+        Serializes an object to compact JSON.
+        """
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj) -> bytes:
+        """
+        Serializes an object to compact JSON.
+        """
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson when it is available.
+
+    Example:
+    ```python
+    app = FastAPI(default_response_class=FastJSONResponse)
+    ```
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,90 @@
+"""
+Inspects & replays the failed messages of a dispatcher queue (see RETRY_DELAYS_SECONDS in runtime.py).
+
+Usage (from the repository root):
+```
+python3 workers/dead_letters.py email                 # Retry & dead-letter queue depths, first dead letters
+python3 workers/dead_letters.py email --replay        # Send the dead letters back to the queue
+python3 workers/dead_letters.py webhook --replay --limit 10
+python3 workers/dead_letters.py webhook --purge       # Delete the dead letters
+```
+"""
+import json
+import argparse
+import pika
+from runtime import RETRY_DELAYS_SECONDS, RETRY_QUEUE, DEAD_LETTER_QUEUE, declare_retry_queues
+
+
+def queue_depth(channel, queue_name: str):
+    return channel.queue_declare(queue=queue_name, passive=True).method.message_count
+
+
+def show(channel, queue_name: str, limit: int):
+    print(f"{queue_name:<28} {queue_depth(channel, queue_name):>8} waiting")
+    for delay in RETRY_DELAYS_SECONDS:
+        retry_queue = RETRY_QUEUE.format(queue_name, delay)
+        print(f"{retry_queue:<28} {queue_depth(channel, retry_queue):>8} waiting")
+
+    dead_letter_queue = DEAD_LETTER_QUEUE.format(queue_name)
+    print(f"{dead_letter_queue:<28} {queue_depth(channel, dead_letter_queue):>8} dead\n")
+
+    # Peek: the messages are requeued when the channel closes, since they are not acknowledged
+    for _ in range(limit):
+        method, properties, body = channel.basic_get(queue=dead_letter_queue, auto_ack=False)
+        if method is None:
+            break
+
+        headers = properties.headers or {}
+        print(json.dumps({
+            "attempts": headers.get("x-attempts"),
+            "last_error": headers.get("x-last-error"),
+            "body": body.decode("utf-8", errors="replace"),
+        }))
+
+
+def replay(channel, queue_name: str, limit: int):
+    """
+    Returns:
+    - int: The number of messages sent back to the queue, with a fresh attempt count.
+    """
+    dead_letter_queue = DEAD_LETTER_QUEUE.format(queue_name)
+    num_replayed = 0
+
+    while limit is None or num_replayed < limit:
+        method, properties, body = channel.basic_get(queue=dead_letter_queue, auto_ack=False)
+        if method is None:
+            break
+
+        channel.basic_publish(exchange="", routing_key=queue_name, body=body,
+                              properties=pika.BasicProperties(delivery_mode=properties.delivery_mode))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        num_replayed += 1
+
+    return num_replayed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect & replay the dead letters of a dispatcher queue.")
+    parser.add_argument("queue", help="The dispatcher queue, e.g. email or webhook.")
+    parser.add_argument("--replay", action="store_true", help="Send the dead letters back to the queue.")
+    parser.add_argument("--purge", action="store_true", help="Delete the dead letters.")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Dead letters to show (default: 10) or to replay (default: all).")
+    args = parser.parse_args()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+    channel = connection.channel()
+
+    # The dispatcher binds the queue to the exchange
+    channel.queue_declare(queue=args.queue)
+    declare_retry_queues(channel, args.queue)
+
+    if args.replay:
+        print(f"Replayed {replay(channel, args.queue, args.limit)} message(s)")
+    elif args.purge:
+        method = channel.queue_purge(queue=DEAD_LETTER_QUEUE.format(args.queue))
+        print(f"Purged {method.method.message_count} message(s)")
+    else:
+        show(channel, args.queue, 10 if args.limit is None else args.limit)
+
+    connection.close()
@@ -0,0 +1,192 @@
+import time
+import queue
+import smtplib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = "localhost"
+SMTP_PORT = 8025
+SENDER_EMAIL = "office@fullerton.edu"
+
+# Persistent SMTP sessions, and the number of messages sent at once (one session each)
+MAILER_WORKERS = 8
+
+# A session is dropped and reopened after that many messages, so servers that limit them do not cut us off
+MAX_MESSAGES_PER_SESSION = 100
+
+# Attempts per message. A failed session is reopened before the next attempt.
+MAX_SEND_ATTEMPTS = 3
+
+SMTP_TIMEOUT_SECONDS = 10
+
+# The rate is logged every REPORT_INTERVAL_SECONDS while messages are sent
+REPORT_INTERVAL_SECONDS = 10
+
+
+def build_message(recipient_email: str, subject: str, body: str):
+    message = MIMEText(body, "plain")
+    message["From"] = SENDER_EMAIL
+    message["To"] = recipient_email
+    message["Subject"] = subject
+    return message.as_string()
+
+
+class SMTPSession:
+    """
+    A persistent SMTP connection, opened on first use and reopened after failures.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._smtp = None
+        self._num_sent = 0
+
+    def send(self, sender: str, recipients: list, message: str):
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+            self._num_sent = 0
+
+        try:
+            self._smtp.sendmail(sender, recipients, message)
+        except smtplib.SMTPRecipientsRefused:
+            # The session is fine, the message is not
+            raise
+        except (smtplib.SMTPException, OSError):
+            self.close()
+            raise
+
+        self._num_sent += 1
+        if self._num_sent >= MAX_MESSAGES_PER_SESSION:
+            self.close()
+
+    def close(self):
+        if self._smtp is None:
+            return
+
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+class Mailer:
+    """
+    Sends emails concurrently over a pool of persistent SMTP sessions.
+
+    Every send runs on one of MAILER_WORKERS threads, with a session of its own for the duration of
+    the message, so consecutive messages reuse the connection (no TCP handshake, EHLO per message).
+
+    Example:
+    ```python
+    mailer = Mailer()
+    future = mailer.send("student@csu.fullerton.edu", "Subject", "Body")
+    future.result()  # Raises if the message could not be sent
+    mailer.close()
+    ```
+    """
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, num_workers: int = MAILER_WORKERS):
+        self._sessions = queue.Queue()
+        for _ in range(num_workers):
+            self._sessions.put(SMTPSession(host, port))
+
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="mailer")
+
+        self._lock = threading.Lock()
+        self._num_sent = 0
+        self._num_failed = 0
+        self._reported_at = time.monotonic()
+        self._num_reported = 0
+
+    def send(self, recipient_email: str, subject: str, body: str):
+        """
+        Queues an email.
+
+        Returns:
+        - concurrent.futures.Future: Done when the message is sent. Its exception is the last failure.
+        """
+        return self._executor.submit(self._send, recipient_email, build_message(recipient_email, subject, body))
+
+    def _send(self, recipient_email: str, message: str):
+        session = self._sessions.get()
+
+        try:
+            for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+                try:
+                    session.send(SENDER_EMAIL, [recipient_email], message)
+                    break
+                except smtplib.SMTPRecipientsRefused:
+                    raise
+                except (smtplib.SMTPException, OSError):
+                    if attempt == MAX_SEND_ATTEMPTS:
+                        raise
+        except Exception:
+            self._count(sent=False)
+            raise
+        finally:
+            self._sessions.put(session)
+
+        self._count(sent=True)
+
+    def _count(self, sent: bool):
+        with self._lock:
+            if sent:
+                self._num_sent += 1
+            else:
+                self._num_failed += 1
+
+            now = time.monotonic()
+            if now - self._reported_at >= REPORT_INTERVAL_SECONDS:
+                rate = (self._num_sent - self._num_reported) / (now - self._reported_at)
+                logger.info(f"Mailer: {rate:.1f} messages/s ({self._num_sent} sent, {self._num_failed} failed)")
+                self._reported_at = now
+                self._num_reported = self._num_sent
+
+    def stats(self):
+        """
+        Returns:
+        - dict: {"sent", "failed"} since the mailer was created.
+        """
+        with self._lock:
+            return {"sent": self._num_sent, "failed": self._num_failed}
+
+    def close(self):
+        """
+        Waits for the queued emails, then closes the sessions.
+        """
+        self._executor.shutdown(wait=True)
+        while not self._sessions.empty():
+            self._sessions.get().close()
+
+
+if __name__ == "__main__":
+    # Sends fake promotion emails as fast as possible, e.g. to `python3 -m aiosmtpd -n -l 0.0.0.0:8025`
+    parser = argparse.ArgumentParser(description="Benchmark the mailer against a local SMTP server.")
+    parser.add_argument("--messages", type=int, default=1000, help="Emails to send. Default: 1000")
+    parser.add_argument("--workers", type=int, default=MAILER_WORKERS, help=f"SMTP sessions. Default: {MAILER_WORKERS}")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    mailer = Mailer(num_workers=args.workers)
+    started_at = time.perf_counter()
+
+    futures = [mailer.send(f"student{i}@csu.fullerton.edu", "Automatically Enrollment",
+                           "You have been successfully enrolled to BENCH from the waitlist.")
+               for i in range(args.messages)]
+    for future in futures:
+        future.exception()
+
+    elapsed = time.perf_counter() - started_at
+    mailer.close()
+
+    stats = mailer.stats()
+    print(f"{stats['sent']} sent, {stats['failed']} failed in {elapsed:.2f}s: "
+          f"{stats['sent'] / elapsed:.1f} messages/s ({stats['sent'] / elapsed * 60:.0f}/min)")
@@ -0,0 +1,319 @@
+import math
+import json
+import time
+import signal
+import logging
+import functools
+import threading
+import pika
+
+logger = logging.getLogger(__name__)
+
+# Topic exchange of the enrollment events. Routing keys: `{event_type}.{email|none}.{webhook|none}`
+EXCHANGE_NAME = "waitlist_events"
+
+# Messages a consumer receives before acknowledging any of them
+DEFAULT_PREFETCH_COUNT = 32
+
+# Consumers of a worker, whatever the queue depth
+DEFAULT_MIN_CONSUMERS = 1
+DEFAULT_MAX_CONSUMERS = 8
+
+# The supervisor wants one consumer per that many messages waiting in the queue
+MESSAGES_PER_CONSUMER = 500
+
+# How often the supervisor checks the queue depth
+SCALE_INTERVAL_SECONDS = 5
+
+# On shutdown, how long a consumer waits for its messages in progress before closing anyway
+DRAIN_TIMEOUT_SECONDS = 30
+
+# Delay before each retry of a failed message (exponential backoff). Once they are all used up,
+# the message goes to the dead-letter queue.
+RETRY_DELAYS_SECONDS = (10, 30, 90, 270, 810)
+
+# Queues where failed messages wait for their retry, and where they end up after the last attempt
+RETRY_QUEUE = "{}.retry.{}s"
+DEAD_LETTER_QUEUE = "{}.dead"
+
+# Characters of the last error kept in the headers of a failed message
+MAX_ERROR_LENGTH = 500
+
+
+class Park:
+    """
+    Returned by a handler to set a message aside in `queue_name` for `delay_seconds`, e.g. while
+    its destination is down. It then comes back to the queue, without using up a retry attempt.
+    """
+
+    def __init__(self, queue_name: str, delay_seconds: float):
+        self.queue_name = queue_name
+        self.delay_seconds = delay_seconds
+
+
+class Consumer(threading.Thread):
+    """
+    Consumes a queue on a connection & channel of its own.
+
+    `handler(data)` gets every message as a dict. It returns None once the message is handled,
+    a concurrent.futures.Future that completes when it is, or a Park. The message is acknowledged when
+    the handler succeeds. When it fails, the message is scheduled for a retry (see `schedule_retry`)
+    and acknowledged, so it neither blocks the prefetch window nor comes back right away.
+    """
+
+    def __init__(self, queue_name: str, binding_key: str, handler, prefetch_count: int):
+        super().__init__(daemon=True)
+        self.queue_name = queue_name
+        self.binding_key = binding_key
+        self.handler = handler
+        self.prefetch_count = prefetch_count
+
+        self._stopping = threading.Event()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """
+        Stops taking messages. The messages in progress are finished before the connection closes.
+        """
+        self._stopping.set()
+
+    def run(self):
+        connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+        channel = connection.channel()
+
+        declare_queue(channel, self.queue_name, self.binding_key)
+        declare_retry_queues(channel, self.queue_name)
+        channel.basic_qos(prefetch_count=self.prefetch_count)
+
+        consumer_tag = channel.basic_consume(
+            queue=self.queue_name, on_message_callback=functools.partial(self._on_message, connection=connection),
+            auto_ack=False)
+
+        try:
+            while not self._stopping.is_set():
+                connection.process_data_events(time_limit=1)
+
+            # ***********************************************
+            # Drain: no new messages, finish the ones in progress
+            # ***********************************************
+            channel.basic_cancel(consumer_tag)
+
+            deadline = time.monotonic() + DRAIN_TIMEOUT_SECONDS
+            while self._in_flight and time.monotonic() < deadline:
+                connection.process_data_events(time_limit=0.1)
+
+            if self._in_flight:
+                logger.warning(f"{self.name}: closing with {self._in_flight} message(s) in progress")
+        finally:
+            connection.close()
+
+    def _on_message(self, channel, method, properties, body, connection):
+        try:
+            data = json.loads(body.decode("utf-8"))
+        except json.decoder.JSONDecodeError as e:
+            # Retrying will not help
+            logger.error(f"Malformed message: {e}")
+            dead_letter(channel, self.queue_name, properties, body, e)
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        try:
+            future = self.handler(data)
+        except Exception as e:
+            self._complete(channel, method, properties, body, e)
+            return
+
+        if isinstance(future, Park):
+            park(channel, self.queue_name, future, properties, body)
+            future = None
+
+        if future is None:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        with self._lock:
+            self._in_flight += 1
+
+        def on_done(future):
+            # Channels are not thread-safe: ack (or retry) & update the count from the connection's thread
+            connection.add_callback_threadsafe(
+                functools.partial(self._complete, channel, method, properties, body, future.exception(),
+                                  in_flight=True))
+
+        future.add_done_callback(on_done)
+
+    def _complete(self, channel, method, properties, body, error: Exception = None, in_flight: bool = False):
+        if error is not None:
+            logger.error(f"Failed to handle message: {error!r}")
+            schedule_retry(channel, self.queue_name, properties, body, error)
+
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+        if in_flight:
+            with self._lock:
+                self._in_flight -= 1
+
+
+class Supervisor:
+    """
+    Runs the consumers of a worker, and scales their number with the depth of its queue:
+    one consumer per MESSAGES_PER_CONSUMER waiting messages, between `min_consumers` and `max_consumers`.
+
+    SIGINT & SIGTERM drain the consumers (see `Consumer.stop`) before `run` returns.
+
+    Example:
+    ```python
+    Supervisor("email", "AutoEnrolledFromWaitlist.email.*", handler, prefetch_count=32, max_consumers=8).run()
+    ```
+    """
+
+    def __init__(self, queue_name: str, binding_key: str, handler,
+                 prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+                 min_consumers: int = DEFAULT_MIN_CONSUMERS,
+                 max_consumers: int = DEFAULT_MAX_CONSUMERS):
+        self.queue_name = queue_name
+        self.binding_key = binding_key
+        self.handler = handler
+        self.prefetch_count = prefetch_count
+        self.min_consumers = min_consumers
+        self.max_consumers = max(min_consumers, max_consumers)
+
+        self._consumers = []
+        # Consumers removed by scaling down, still finishing their messages
+        self._draining = []
+        self._stopping = threading.Event()
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+        channel = connection.channel()
+        declare_queue(channel, self.queue_name, self.binding_key)
+
+        try:
+            while not self._stopping.is_set():
+                depth = channel.queue_declare(queue=self.queue_name, passive=True).method.message_count
+                self._scale(self.target_consumers(depth))
+
+                # Keep the connection alive while waiting
+                connection.sleep(SCALE_INTERVAL_SECONDS)
+        finally:
+            logger.info(f"Draining {len(self._consumers)} consumer(s) of {self.queue_name}")
+            for consumer in self._consumers:
+                consumer.stop()
+            for consumer in self._consumers + self._draining:
+                consumer.join()
+
+            connection.close()
+
+    def target_consumers(self, depth: int):
+        return min(self.max_consumers, max(self.min_consumers, math.ceil(depth / MESSAGES_PER_CONSUMER)))
+
+    def _scale(self, target: int):
+        # Replace the consumers that died (e.g. lost their connection)
+        self._consumers = [c for c in self._consumers if c.is_alive()]
+        self._draining = [c for c in self._draining if c.is_alive()]
+
+        if len(self._consumers) < target:
+            logger.info(f"Scaling {self.queue_name} consumers: {len(self._consumers)} -> {target}")
+            while len(self._consumers) < target:
+                consumer = Consumer(self.queue_name, self.binding_key, self.handler, self.prefetch_count)
+                consumer.start()
+                self._consumers.append(consumer)
+
+        elif len(self._consumers) > target:
+            logger.info(f"Scaling {self.queue_name} consumers: {len(self._consumers)} -> {target}")
+            while len(self._consumers) > target:
+                # Drains in the background
+                consumer = self._consumers.pop()
+                consumer.stop()
+                self._draining.append(consumer)
+
+
+def declare_queue(channel, queue_name: str, binding_key: str):
+    # Declare the topic exchange
+    channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type="topic")
+
+    # Declare a queue and bind it to the events it handles
+    channel.queue_declare(queue=queue_name)
+    channel.queue_bind(exchange=EXCHANGE_NAME, queue=queue_name, routing_key=binding_key)
+
+
+def declare_retry_queues(channel, queue_name: str):
+    """
+    Declares the delay queues of a queue, one per RETRY_DELAYS_SECONDS, and its dead-letter queue.
+
+    A delay queue has no consumer: its messages expire after the delay and are dead-lettered
+    back to the queue through the default exchange.
+    """
+    for delay in RETRY_DELAYS_SECONDS:
+        channel.queue_declare(queue=RETRY_QUEUE.format(queue_name, delay), arguments={
+            "x-message-ttl": delay * 1000,
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": queue_name,
+        })
+
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE.format(queue_name))
+
+
+def park(channel, queue_name: str, parking: Park, properties, body: bytes):
+    """
+    Publishes a message to a holding queue that sends it back to `queue_name` after the delay.
+    The holding queue is deleted once unused for a while.
+    """
+    delay_ms = int(parking.delay_seconds * 1000)
+
+    channel.queue_declare(queue=parking.queue_name, arguments={
+        "x-message-ttl": delay_ms,
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": queue_name,
+        "x-expires": delay_ms * 10,
+    })
+    channel.basic_publish(exchange="", routing_key=parking.queue_name, body=body, properties=properties)
+
+
+def schedule_retry(channel, queue_name: str, properties, body: bytes, error: Exception):
+    """
+    Publishes a failed message to the delay queue of its next attempt, or to the dead-letter queue
+    after the last one. The number of failed attempts is kept in the `x-attempts` header.
+    """
+    attempts = (properties.headers or {}).get("x-attempts", 0) + 1
+
+    if attempts > len(RETRY_DELAYS_SECONDS):
+        dead_letter(channel, queue_name, properties, body, error, attempts)
+        return
+
+    delay = RETRY_DELAYS_SECONDS[attempts - 1]
+    _republish(channel, RETRY_QUEUE.format(queue_name, delay), properties, body, error, attempts)
+
+
+def dead_letter(channel, queue_name: str, properties, body: bytes, error: Exception, attempts: int = None):
+    logger.error(f"Moving a message of {queue_name} to its dead-letter queue")
+    _republish(channel, DEAD_LETTER_QUEUE.format(queue_name), properties, body, error, attempts)
+
+
+def _republish(channel, routing_key: str, properties, body: bytes, error: Exception, attempts: int = None):
+    headers = dict(properties.headers or {})
+    headers["x-last-error"] = repr(error)[:MAX_ERROR_LENGTH]
+    if attempts is not None:
+        headers["x-attempts"] = attempts
+
+    channel.basic_publish(exchange="", routing_key=routing_key, body=body,
+                          properties=pika.BasicProperties(headers=headers, delivery_mode=properties.delivery_mode))
+
+
+def add_runtime_arguments(parser):
+    """
+    Adds the options of the runtime to the argparse parser of a worker.
+    """
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH_COUNT,
+                        help=f"Unacknowledged messages per consumer. Default: {DEFAULT_PREFETCH_COUNT}")
+    parser.add_argument("--min-consumers", type=int, default=DEFAULT_MIN_CONSUMERS,
+                        help=f"Default: {DEFAULT_MIN_CONSUMERS}")
+    parser.add_argument("--max-consumers", type=int, default=DEFAULT_MAX_CONSUMERS,
+                        help=f"Default: {DEFAULT_MAX_CONSUMERS}")
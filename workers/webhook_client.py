@@ -0,0 +1,339 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Deliveries in flight, all hosts together
+MAX_IN_FLIGHT = 256
+
+# Deliveries in flight (and open connections) per host, so a slow host cannot take all the slots
+MAX_IN_FLIGHT_PER_HOST = 16
+
+# Idle connections kept open per host
+MAX_KEEPALIVE_PER_HOST = 16
+
+# Seconds to connect, and to send the request / read the response
+CONNECT_TIMEOUT_SECONDS = 2
+READ_TIMEOUT_SECONDS = 5
+
+# Circuit breaker per host: it opens when, over the last BREAKER_WINDOW deliveries (at least
+# BREAKER_MIN_CALLS), the share of failures or of deliveries slower than BREAKER_SLOW_CALL_SECONDS
+# reaches BREAKER_THRESHOLD. After BREAKER_OPEN_SECONDS, one probe delivery decides whether it closes.
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 10
+BREAKER_THRESHOLD = 0.5
+BREAKER_SLOW_CALL_SECONDS = 2
+BREAKER_OPEN_SECONDS = 30
+
+# The breaker metrics are logged every BREAKER_REPORT_INTERVAL_SECONDS
+BREAKER_REPORT_INTERVAL_SECONDS = 30
+
+# Batching (opt-in): events for the same URL are sent together as one JSON array, once the
+# oldest one waited BATCH_WINDOW_SECONDS or BATCH_MAX_EVENTS are waiting, whichever comes first
+BATCH_WINDOW_SECONDS = 0.5
+BATCH_MAX_EVENTS = 50
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker of a host: closed -> open -> half_open -> closed (or open again).
+
+    Not thread-safe: WebhookClient guards its breakers with a lock.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = self.CLOSED
+        # (failed, slow) of the last deliveries while closed
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = None
+        self._probing = False
+        self.counters = {"opened": 0, "probes": 0, "parked": 0}
+
+    def allow(self, now: float):
+        """
+        Returns:
+        - bool: True if a delivery may be attempted now.
+        """
+        if self.state == self.OPEN and now - self._opened_at >= BREAKER_OPEN_SECONDS:
+            self.state = self.HALF_OPEN
+            self._probing = False
+
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            self.counters["probes"] += 1
+            return True
+
+        self.counters["parked"] += 1
+        return False
+
+    def record(self, failed: bool, latency: float, now: float):
+        slow = latency >= BREAKER_SLOW_CALL_SECONDS
+
+        if self.state == self.HALF_OPEN:
+            if failed or slow:
+                self._open(now)
+            else:
+                self._close()
+            return
+
+        if self.state == self.OPEN:
+            # A delivery that started before the breaker opened
+            return
+
+        self._outcomes.append((failed, slow))
+        if len(self._outcomes) >= BREAKER_MIN_CALLS:
+            failure_rate = sum(1 for f, _ in self._outcomes if f) / len(self._outcomes)
+            slow_rate = sum(1 for _, s in self._outcomes if s) / len(self._outcomes)
+
+            if failure_rate >= BREAKER_THRESHOLD or slow_rate >= BREAKER_THRESHOLD:
+                self._open(now)
+
+    def _open(self, now: float):
+        logger.warning(f"Circuit breaker of {self.host} opened")
+        self.state = self.OPEN
+        self._opened_at = now
+        self.counters["opened"] += 1
+
+    def _close(self):
+        logger.warning(f"Circuit breaker of {self.host} closed")
+        self.state = self.CLOSED
+        self._outcomes.clear()
+
+    def snapshot(self):
+        return {"state": self.state, **self.counters}
+
+
+class WebhookClient:
+    """
+    Delivers webhooks concurrently from an asyncio event loop running in its own thread.
+
+    Every host has its own keep-alive connection pool and its own cap on deliveries in flight,
+    so one slow endpoint only slows down its own deliveries. It also has a circuit breaker:
+    check `allow(url)` before posting, to set deliveries to a failing host aside.
+
+    Example:
+    ```python
+    client = WebhookClient()
+    future = client.post("http://localhost:5900/webhook", {"class_id": "..."})
+    future.result()  # Raises httpx.HTTPError if the delivery failed
+    client.close()
+    ```
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_in_flight_per_host: int = MAX_IN_FLIGHT_PER_HOST):
+        self.max_in_flight_per_host = max_in_flight_per_host
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="webhook-client", daemon=True)
+        self._thread.start()
+
+        self._slots = asyncio.run_coroutine_threadsafe(self._create_semaphore(max_in_flight), self._loop).result()
+        # Host -> (httpx.AsyncClient, asyncio.Semaphore). Only used from the event loop.
+        self._hosts = {}
+
+        # Host -> CircuitBreaker
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._report_timer = None
+        self._loop.call_soon_threadsafe(self._report)
+
+    @staticmethod
+    async def _create_semaphore(value: int):
+        return asyncio.Semaphore(value)
+
+    def post(self, url: str, payload: dict):
+        """
+        Queues a delivery. Thread-safe.
+
+        Returns:
+        - concurrent.futures.Future: The httpx.Response once delivered with a 2xx status.
+        """
+        return asyncio.run_coroutine_threadsafe(self._post(url, payload), self._loop)
+
+    async def _post(self, url: str, payload):
+        client, host_slots = self._get_host(url)
+
+        async with host_slots, self._slots:
+            started_at = time.monotonic()
+            try:
+                response = await client.post(url, json=payload)
+            except Exception:
+                # Connection errors & timeouts
+                self._record(url, True, started_at)
+                raise
+
+            # A 4xx is the payload's fault, not the host's
+            self._record(url, response.status_code >= 500, started_at)
+            response.raise_for_status()
+            return response
+
+    def allow(self, url: str):
+        """
+        Returns:
+        - bool: False while the circuit breaker of the URL's host is open. Thread-safe.
+        """
+        with self._breakers_lock:
+            return self._get_breaker(url).allow(time.monotonic())
+
+    def _record(self, url: str, failed: bool, started_at: float):
+        now = time.monotonic()
+        with self._breakers_lock:
+            self._get_breaker(url).record(failed, now - started_at, now)
+
+    def _get_breaker(self, url: str):
+        host = urlsplit(url).netloc
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(host)
+        return self._breakers[host]
+
+    def breaker_metrics(self):
+        """
+        Returns:
+        - dict: host -> {"state", "opened", "probes", "parked"}. Thread-safe.
+        """
+        with self._breakers_lock:
+            return {host: breaker.snapshot() for host, breaker in self._breakers.items()}
+
+    def _report(self):
+        metrics = self.breaker_metrics()
+        if metrics:
+            logger.info(f"Webhook circuit breakers: {json.dumps(metrics)}")
+
+        self._report_timer = self._loop.call_later(BREAKER_REPORT_INTERVAL_SECONDS, self._report)
+
+    def _get_host(self, url: str):
+        host = urlsplit(url).netloc
+
+        if host not in self._hosts:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=self.max_in_flight_per_host,
+                                    max_keepalive_connections=MAX_KEEPALIVE_PER_HOST),
+            )
+            self._hosts[host] = (client, asyncio.Semaphore(self.max_in_flight_per_host))
+
+        return self._hosts[host]
+
+    def close(self):
+        """
+        Closes the connections once the deliveries in flight are done.
+        """
+        async def close_clients():
+            if self._report_timer is not None:
+                self._report_timer.cancel()
+
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            for client, _ in self._hosts.values():
+                await client.aclose()
+
+        asyncio.run_coroutine_threadsafe(close_clients(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class WebhookBatcher:
+    """
+    Coalesces the events bound for the same URL into one delivery of a JSON array, on a WebhookClient.
+
+    Every event still has its own future, so each message is acknowledged (or retried) on its own.
+
+    Example:
+    ```python
+    batcher = WebhookBatcher(WebhookClient())
+    futures = [batcher.post("http://localhost:5900/webhook", event) for event in events]
+    batcher.close()
+    ```
+    """
+
+    def __init__(self, client: WebhookClient,
+                 window_seconds: float = BATCH_WINDOW_SECONDS,
+                 max_events: int = BATCH_MAX_EVENTS):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+
+        # URL -> [(payload, future), ...] and URL -> timer of the batch. Only used from the event loop.
+        self._batches = {}
+        self._timers = {}
+
+        self._lock = threading.Lock()
+        self._num_events = 0
+        self._num_requests = 0
+
+    def post(self, url: str, payload: dict):
+        """
+        Queues an event. Thread-safe.
+
+        Returns:
+        - concurrent.futures.Future: The httpx.Response of the batch once delivered with a 2xx status.
+        """
+        future = concurrent.futures.Future()
+        self.client._loop.call_soon_threadsafe(self._add, url, payload, future)
+        return future
+
+    def _add(self, url: str, payload: dict, future: concurrent.futures.Future):
+        batch = self._batches.setdefault(url, [])
+        batch.append((payload, future))
+
+        if len(batch) >= self.max_events:
+            self._flush(url)
+        elif len(batch) == 1:
+            self._timers[url] = self.client._loop.call_later(self.window_seconds, self._flush, url)
+
+    def _flush(self, url: str):
+        timer = self._timers.pop(url, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._batches.pop(url, None)
+        if batch:
+            self.client._loop.create_task(self._send(url, batch))
+
+    async def _send(self, url: str, batch: list):
+        with self._lock:
+            self._num_events += len(batch)
+            self._num_requests += 1
+
+        try:
+            response = await self.client._post(url, [payload for payload, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, future in batch:
+                future.set_result(response)
+
+    def stats(self):
+        """
+        Returns:
+        - dict: {"events", "requests"} sent since the batcher was created.
+        """
+        with self._lock:
+            return {"events": self._num_events, "requests": self._num_requests}
+
+    def close(self):
+        """
+        Sends the batches still waiting, then closes the client.
+        """
+        async def flush_all():
+            for url in list(self._batches):
+                self._flush(url)
+
+        asyncio.run_coroutine_threadsafe(flush_all(), self.client._loop).result()
+        self.client.close()
@@ -1,8 +1,10 @@
-import pika
-import requests
 import logging
-import json
+import hashlib
+import argparse
+from urllib.parse import urlsplit
 from helper import wait_for_service
+from webhook_client import WebhookClient, WebhookBatcher, BATCH_WINDOW_SECONDS, BATCH_MAX_EVENTS, BREAKER_OPEN_SECONDS
+from runtime import Supervisor, Park, add_runtime_arguments
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,61 +13,89 @@ logger = logging.getLogger(__name__)
 pika_logger = logging.getLogger('pika')
 pika_logger.setLevel(logging.WARNING)
 
-def callback(ch, method, properties, body):
-    # Log the received message
-    # logger.info(body)
-    
-    # Load the binary body into a Python object
-    data = json.loads(body.decode('utf-8'))
+QUEUE_NAME = "webhook"
+
+# Only the events with a webhook_url are routed to the queue
+BINDING_KEY = "AutoEnrolledFromWaitlist.*.webhook"
+
+# Where the messages for a host wait while its circuit breaker is open: webhook.held.{hostname}:{port}
+HOLDING_QUEUE = "webhook.held.{}:{}"
+
+# Ports of the URLs without one
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# RabbitMQ rejects longer queue names. Longer hosts are named by a hash instead.
+MAX_QUEUE_NAME_LENGTH = 255
+
+webhook_client = WebhookClient()
+
+# The WebhookClient, or a WebhookBatcher on top of it with --batch
+sender = webhook_client
+
+def holding_queue(webhook_url: str):
+    # Never the netloc: it may carry credentials, which would show up in the queue name
+    url = urlsplit(webhook_url)
+    hostname, port = url.hostname, url.port or DEFAULT_PORTS.get(url.scheme, 80)
+
+    queue_name = HOLDING_QUEUE.format(hostname, port)
+    if len(queue_name.encode("utf-8")) > MAX_QUEUE_NAME_LENGTH:
+        queue_name = HOLDING_QUEUE.format(hashlib.sha1(hostname.encode("utf-8")).hexdigest(), port)
+
+    return queue_name
+
+def handle(data):
+    # Only possible for messages replayed from elsewhere: the binding filters them out
+    if data.get("event_type") != "AutoEnrolledFromWaitlist" or not data.get("webhook_url"):
+        return None
+
     webhook_url = data.get("webhook_url")
 
-    if webhook_url:
-        # Optional. Add an message
-        data["message"] = "You have been successfully enrolled from the waitlist."
-        
-        try:
-            headers = {
-                "Content-Type": "application/json;"
-            }
-            
-            # Send request
-            response = requests.post(webhook_url, headers=headers, json=data)
-
-            # Check the HTTP response status code
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            # Handle exceptions raised by the HTTP request
-            logger.error(f"Failed to send POST request: {e}")
-        else:
-             # POST request is successful. Acknowledge the message!
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            
-def dispatcher():
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
+    # The host keeps failing: set the message aside until the breaker lets a probe through,
+    # instead of using up its retries and a delivery slot
+    if not webhook_client.allow(webhook_url):
+        return Park(holding_queue(webhook_url), BREAKER_OPEN_SECONDS)
 
-    exchange_name = "waitlist_exchange"
-    queue_name = "webhook"
+    # Optional. Add an message
+    data["message"] = "You have been successfully enrolled from the waitlist."
 
-    # Declare a fanout exchange
-    channel.exchange_declare(exchange=exchange_name, exchange_type='fanout')
+    # Send request, without blocking the consumer.
+    # The message is acknowledged once the endpoint answers with a 2xx status.
+    return sender.post(webhook_url, data)
+            
+def dispatcher(args):
+    global sender
+    prefetch_count = args.prefetch
 
-    # Declare a queue and bind it to the fanout exchange
-    channel.queue_declare(queue=queue_name)
-    channel.queue_bind(exchange=exchange_name, queue=queue_name)
+    if args.batch:
+        # Endpoints receive a JSON array of events instead of one event per request
+        sender = WebhookBatcher(webhook_client, window_seconds=args.batch_window, max_events=args.batch_size)
 
-    # Set up the callback function for handling incoming messages
-    channel.basic_consume(
-        queue=queue_name, on_message_callback=callback, auto_ack=False)
+        # A consumer holds at most `prefetch` unacknowledged messages: with fewer than a batch,
+        # no batch could ever fill up and every one would wait for the whole window
+        if prefetch_count < args.batch_size:
+            logger.info(f"Raising the prefetch from {prefetch_count} to the batch size, {args.batch_size}")
+            prefetch_count = args.batch_size
 
-    try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        logger.info("Received interrupt, stopping consumption.")
-        connection.close()
+    supervisor = Supervisor(QUEUE_NAME, BINDING_KEY, handle, prefetch_count=prefetch_count,
+                            min_consumers=args.min_consumers, max_consumers=args.max_consumers)
+
+    # Runs until SIGINT or SIGTERM, then drains the consumers
+    supervisor.run()
+    sender.close()
+    logger.info("Stopped consumption.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Deliver the promotion webhooks.")
+    add_runtime_arguments(parser)
+    parser.add_argument("--batch", action="store_true",
+                        help="Send the events bound for the same URL together, as one JSON array.")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW_SECONDS,
+                        help=f"Seconds an event waits for others. Default: {BATCH_WINDOW_SECONDS}")
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_EVENTS,
+                        help=f"Events per request at most. The prefetch is raised to at least "
+                             f"this size. Default: {BATCH_MAX_EVENTS}")
+    args = parser.parse_args()
+
     try:
         is_rabbitmq_running = wait_for_service(host="localhost", port=5672, timeout=60)
 
@@ -73,6 +103,6 @@ if __name__ == '__main__':
             raise Exception("RabbitMQ Not Running")
 
         # Start dispatcher
-        dispatcher()
+        dispatcher(args)
     except Exception as e:
         logger.error('Error during execution', exc_info=True)